@@ -6,6 +6,8 @@ from app.core.config import settings
 from app.db.base_class import Base
 from app.models.user import User
 from app.models.task import Task
+from app.models.blob import Blob, BlobDerivative
+from app.models.credit_transaction import CreditTransaction
 
 config = context.config
 
@@ -0,0 +1,46 @@
+"""task listing indexes
+
+Composite indexes backing keyset pagination of GET /tasks. They are built
+CONCURRENTLY so adding them to a large tasks table does not block writes;
+that cannot run inside a transaction, hence the autocommit block.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tasks_user_created_id",
+            "tasks",
+            ["user_id", "created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_tasks_user_status_created_id",
+            "tasks",
+            ["user_id", "status", "created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_tasks_user_status_created_id", table_name="tasks", postgresql_concurrently=True)
+        op.drop_index("ix_tasks_user_created_id", table_name="tasks", postgresql_concurrently=True)
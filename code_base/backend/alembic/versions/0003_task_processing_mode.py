@@ -0,0 +1,43 @@
+"""task processing mode
+
+Adds tasks.processing_mode, which routes small uploads to the vectorized
+batch worker, and the partial index the batch worker claims from.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tasks",
+        sa.Column("processing_mode", sa.String(length=16), nullable=False, server_default="standard"),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tasks_vectorized_queue",
+            "tasks",
+            ["created_at", "id"],
+            postgresql_where=sa.text("processing_mode = 'vectorized' AND status IN ('pending', 'processing')"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_tasks_vectorized_queue", table_name="tasks", postgresql_concurrently=True)
+    op.drop_column("tasks", "processing_mode")
@@ -1 +1,9 @@
- 
\ No newline at end of file
+from fastapi import APIRouter
+from app.api.api_v1.endpoints import auth, files, health, payments, tasks
+
+api_router = APIRouter()
+api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
+api_router.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
+api_router.include_router(files.router, prefix="/files", tags=["files"])
+api_router.include_router(payments.router, prefix="/payments", tags=["payments"])
+api_router.include_router(health.router, tags=["health"])
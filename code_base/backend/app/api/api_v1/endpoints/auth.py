@@ -1,28 +1,44 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
 from app.core.security import (
     create_access_token,
-    get_password_hash,
-    verify_password
+    hash_password,
+    verify_and_update_password
 )
-from app.db.session import get_db
+from app.core.tokens import token_versions
+from app.api.deps import rate_limit
+from app.db.session import get_async_db
 from app.models.user import User
 from datetime import timedelta
 
 router = APIRouter()
 
-@router.post("/signup")
+async def access_token_for(user: User) -> str:
+    """A token carrying what requests need to know, so they skip the user lookup."""
+    return create_access_token(
+        data={
+            "sub": user.email,
+            "uid": user.id,
+            "credits": user.credits,
+            "ver": await token_versions.current(user.id)
+        },
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+@router.post("/signup", dependencies=[Depends(rate_limit("auth.signup"))])
 async def signup(
     email: str,
     password: str,
     full_name: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new user account."""
     # Check if user already exists
-    if db.query(User).filter(User.email == email).first():
+    existing = await db.execute(select(User.id).where(User.email == email))
+    if existing.first():
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
@@ -31,19 +47,15 @@ async def signup(
     # Create new user
     user = User(
         email=email,
-        hashed_password=get_password_hash(password),
+        hashed_password=await hash_password(password),
         full_name=full_name,
         credits=0  # Start with 0 credits
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
-    # Create access token
-    access_token = create_access_token(
-        data={"sub": user.email},
-        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
+    access_token = await access_token_for(user)
 
     return {
         "user": {
@@ -55,23 +67,36 @@ async def signup(
         "token": access_token
     }
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(rate_limit("auth.login"))])
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login user and return access token."""
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = (
+        await db.execute(select(User).where(User.email == form_data.username))
+    ).scalar_one_or_none()
+    if not user:
         raise HTTPException(
             status_code=401,
             detail="Incorrect email or password"
         )
 
-    access_token = create_access_token(
-        data={"sub": user.email},
-        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    valid, new_hash = await verify_and_update_password(
+        form_data.password, user.hashed_password
     )
+    if not valid:
+        raise HTTPException(
+            status_code=401,
+            detail="Incorrect email or password"
+        )
+
+    # Transparently upgrade hashes made with outdated cost parameters
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
+    access_token = await access_token_for(user)
 
     return {
         "user": {
@@ -0,0 +1,80 @@
+"""
+Signed file transfer for the local storage backend.
+
+``LocalBackend`` signs URLs pointing here, so development and single-host
+deployments get the same upload/download flow as S3. With S3 storage
+clients talk to the bucket and these routes answer 404.
+"""
+from typing import Optional
+import os
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.storage.backends import LocalBackend, verify
+from app.storage.blobstore import processed_store, upload_store
+from app.storage.serving import file_response
+from app.storage.uploads import is_incoming
+
+router = APIRouter()
+
+STORES = {store.namespace: store for store in (upload_store, processed_store)}
+
+def local_backend(namespace: str) -> LocalBackend:
+    store = STORES.get(namespace)
+    if store is None or not isinstance(store.backend, LocalBackend):
+        raise HTTPException(status_code=404, detail="Not found")
+    return store.backend
+
+@router.api_route("/{namespace}/{key:path}", methods=["GET", "HEAD"])
+async def download_file(
+    namespace: str,
+    key: str,
+    request: Request,
+    expires: int,
+    signature: str,
+    filename: Optional[str] = None
+):
+    """Serve a file to the holder of a signed download URL."""
+    backend = local_backend(namespace)
+    if not verify("GET", namespace, key, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+    return file_response(request, backend, key, filename)
+
+@router.put("/{namespace}/{key:path}", status_code=204)
+async def upload_file(
+    namespace: str,
+    key: str,
+    request: Request,
+    expires: int,
+    signature: str,
+    size: int = Query(..., gt=0)
+):
+    """Store exactly ``size`` bytes from the holder of a signed upload URL."""
+    backend = local_backend(namespace)
+    if not verify("PUT", namespace, key, expires, signature, size) or not is_incoming(key):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    staged = upload_store.temp_path()
+    received = 0
+    try:
+        with open(staged, "wb") as out:
+            buffer = bytearray()
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > size:
+                    raise HTTPException(status_code=413, detail=f"Upload is larger than the signed size of {size} bytes")
+                buffer += chunk
+                # Write in UPLOAD_CHUNK_SIZE pieces, off the event loop
+                if len(buffer) >= settings.UPLOAD_CHUNK_SIZE:
+                    await run_in_threadpool(out.write, bytes(buffer))
+                    buffer.clear()
+            await run_in_threadpool(out.write, bytes(buffer))
+        if received != size:
+            raise HTTPException(status_code=400, detail=f"Expected {size} bytes, received {received}")
+        await run_in_threadpool(backend.put_file, key, staged)
+    except BaseException:
+        try:
+            os.unlink(staged)
+        except FileNotFoundError:
+            pass
+        raise
@@ -1,74 +1,64 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.db.session import get_db
-from app.core.config import settings
-import redis
-import psycopg2
-from celery import Celery
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core import redis as redis_pools
+from app.db.pool_metrics import pool_stats
+from app.services.health import health_monitor
 
 router = APIRouter()
 
-def check_database(db: Session) -> bool:
-    """Check database connection."""
-    try:
-        db.execute("SELECT 1")
-        return True
-    except Exception:
-        return False
-
-def check_redis() -> bool:
-    """Check Redis connection."""
-    try:
-        r = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            password=settings.REDIS_PASSWORD
-        )
-        return r.ping()
-    except Exception:
-        return False
-
-def check_celery() -> bool:
-    """Check Celery connection."""
-    try:
-        celery_app = Celery(
-            "worker",
-            broker=settings.CELERY_BROKER_URL,
-            backend=settings.CELERY_RESULT_BACKEND
-        )
-        return celery_app.control.inspect().active() is not None
-    except Exception:
-        return False
+def dependency_health(name: str) -> dict:
+    report = health_monitor.report()
+    if name not in report:
+        # Before the first probe round has finished
+        return {"status": "unknown"}
+    return report[name]
 
 @router.get("/health")
-async def health_check(db: Session = Depends(get_db)):
-    """Check the health of all services."""
-    db_status = check_database(db)
-    redis_status = check_redis()
-    celery_status = check_celery()
-
-    status = "healthy" if all([db_status, redis_status, celery_status]) else "unhealthy"
-
+async def health_check():
+    """Cached health of all dependencies, from the last background probe."""
+    report = health_monitor.report()
+    healthy = bool(report) and all(service["status"] == "healthy" for service in report.values())
     return {
-        "status": status,
-        "services": {
-            "database": "healthy" if db_status else "unhealthy",
-            "redis": "healthy" if redis_status else "unhealthy",
-            "celery": "healthy" if celery_status else "unhealthy"
-        }
+        "status": "healthy" if healthy else "unhealthy",
+        "services": {name: service["status"] for name, service in report.items()},
+        "probes": report
     }
 
+@router.get("/health/live")
+async def liveness():
+    """The process is up and its event loop is responsive; checks nothing else."""
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness():
+    """503 unless every dependency the API needs to serve requests passed a recent probe."""
+    ready, report = health_monitor.ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not ready", "probes": report}
+    )
+
 @router.get("/health/database")
-async def database_health(db: Session = Depends(get_db)):
-    """Check database health."""
-    return {"status": "healthy" if check_database(db) else "unhealthy"}
+async def database_health():
+    """Cached database health."""
+    return dependency_health("database")
+
+@router.get("/health/database/pool")
+async def database_pool_stats():
+    """Connection pool usage, churn and checkout wait times for this process."""
+    return pool_stats()
 
 @router.get("/health/redis")
 async def redis_health():
-    """Check Redis health."""
-    return {"status": "healthy" if check_redis() else "unhealthy"}
+    """Cached Redis health."""
+    return dependency_health("redis")
+
+@router.get("/health/redis/pool")
+async def redis_pool_stats():
+    """Usage of every shared Redis connection pool in this process."""
+    return redis_pools.pool_stats()
 
 @router.get("/health/celery")
 async def celery_health():
-    """Check Celery health."""
-    return {"status": "healthy" if check_celery() else "unhealthy"} 
\ No newline at end of file
+    """Cached Celery worker health."""
+    return dependency_health("celery")
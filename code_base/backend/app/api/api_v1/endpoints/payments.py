@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
-from app.db.session import get_db
-from app.models.user import User
-from app.core.security import get_current_user
+from app.db.session import get_async_db
+from app.api.deps import CurrentUser, get_current_user, rate_limit
+from app.services import credits
 import razorpay
 import hmac
 import hashlib
@@ -18,8 +18,8 @@ client = razorpay.Client(
 @router.post("/create")
 async def create_payment(
     amount: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new payment order."""
     try:
@@ -38,13 +38,13 @@ async def create_payment(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/verify")
+@router.post("/verify", dependencies=[Depends(rate_limit("payments.verify"))])
 async def verify_payment(
     order_id: str,
     payment_id: str,
     signature: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Verify the payment and add credits to user account."""
     try:
@@ -61,8 +61,13 @@ async def verify_payment(
         amount = client.order.fetch(order_id)["amount"]
         credits_to_add = amount // 10000  # Convert from paise to INR, then to credits
 
-        current_user.credits += credits_to_add
-        db.commit()
+        # Recorded against the payment id, so verifying twice adds nothing
+        balance = await credits.purchase(
+            db, current_user.id, credits_to_add, f"payment:{payment_id}"
+        )
+        await db.commit()
+        if balance is None:
+            return {"message": "Payment already processed", "credits_added": 0}
 
         return {"message": "Payment verified successfully", "credits_added": credits_to_add}
     except Exception as e:
@@ -1,77 +1,640 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, UploadFile, File, Form, Query
+from fastapi.responses import RedirectResponse, StreamingResponse
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
+from datetime import datetime, timezone
+from fastapi.concurrency import run_in_threadpool
 from app.core.config import settings
-from app.db.session import get_db
+from app.db.session import get_async_db
+from app.models.credit_transaction import CreditTransaction
 from app.models.user import User
-from app.models.task import Task, TaskStatus
-from app.core.security import get_current_user
-from app.workers.tasks import process_image
+from app.models.task import ProcessingMode, Task, TaskStatus
+from app.api.deps import CurrentUser, get_current_user, get_stream_user, rate_limit
+from app.services import credits
+from app.services.derivatives import FORMAT_CHOICES, derivative_cache
+from app.services.scheduler import Lane, lane_for
+from app.services.task_events import broker, event_stream, parse_event_id
+from app.storage.backends import LocalBackend
+from app.storage.blobstore import BlobStore, processed_store, upload_store
+from app.storage.serving import etag_matches, file_response, key_etag
+from app.storage.uploads import check_image, incoming_key, save_upload
+from app.transforms.operations import InvalidTransformSpec
+from app.transforms.pipeline import parse_spec
+from app.workers.tasks import enqueue
+import asyncio
+import base64
+import binascii
 import os
 import json
+import re
+import time
+import uuid
 
 router = APIRouter()
 
-@router.post("/")
+# Fields a task is serialized with, by API name. The transform spec is
+# exposed as "metadata" even though the model maps it as task_metadata.
+TASK_FIELDS = {
+    "id": Task.id,
+    "batch_id": Task.batch_id,
+    "original_filename": Task.original_filename,
+    "image_path": Task.image_path,
+    "processed_filename": Task.processed_filename,
+    "content_hash": Task.content_hash,
+    "status": Task.status,
+    "error_message": Task.error_message,
+    "metadata": Task.task_metadata,
+    "result": Task.result,
+    "credits_used": Task.credits_used,
+    "processing_mode": Task.processing_mode,
+    "created_at": Task.created_at,
+    "updated_at": Task.updated_at,
+}
+
+# Always selected in listings because the next cursor is built from them
+CURSOR_FIELDS = ("created_at", "id")
+
+def serialize_task(task: Task) -> dict:
+    return {name: getattr(task, column.key) for name, column in TASK_FIELDS.items()}
+
+def naive_utc(value: datetime) -> datetime:
+    """``created_at`` holds naive UTC; convert aware datetimes to match."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def encode_cursor(created_at: datetime, task_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), task_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; 400 on anything a client could have mangled."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, task_id = json.loads(raw)
+        return naive_utc(datetime.fromisoformat(created_at)), int(task_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """Resolve a comma-separated sparse field list, keeping the cursor fields."""
+    if not fields:
+        return list(TASK_FIELDS)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in TASK_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return list(dict.fromkeys([*CURSOR_FIELDS, *names]))
+
+def parse_metadata(metadata: Optional[str]) -> dict:
+    """Parse the JSON transform spec sent with a task."""
+    if not metadata:
+        return {}
+    try:
+        spec = json.loads(metadata)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="metadata must be valid JSON")
+    if not isinstance(spec, dict):
+        raise HTTPException(status_code=400, detail="metadata must be a JSON object")
+    # Reject bad specs before any credits are taken
+    try:
+        parse_spec(spec)
+    except InvalidTransformSpec as e:
+        raise HTTPException(status_code=400, detail=f"Invalid transform spec: {e}")
+    return spec
+
+def processing_mode(size: int) -> str:
+    """Small uploads go to the vectorized batch worker when it is enabled."""
+    if settings.VECTOR_BATCH_ENABLED and size <= settings.VECTOR_BATCH_MAX_BYTES:
+        return ProcessingMode.VECTORIZED
+    return ProcessingMode.STANDARD
+
+async def check_credits(db: AsyncSession, current_user: CurrentUser) -> None:
+    """
+    Turn away users who cannot pay before their upload is handled.
+
+    The balance in the token is trusted when it suffices; the ledger debit
+    has the final say anyway. Only a token balance that looks too low
+    (credits may have been bought since it was issued) is checked against
+    the database.
+    """
+    if current_user.credits is not None and current_user.credits >= settings.MIN_CREDITS_FOR_TASK:
+        return
+    balance = (
+        await db.execute(select(User.credits).where(User.id == current_user.id))
+    ).scalar_one_or_none()
+    if balance is None or balance < settings.MIN_CREDITS_FOR_TASK:
+        raise HTTPException(
+            status_code=400,
+            detail="Not enough credits to process image"
+        )
+
+async def stage_image(image: UploadFile):
+    """Stream an upload to a staging path and check its image header."""
+    stored = await save_upload(image, upload_store.temp_path())
+    await check_image(stored)
+    return stored
+
+@router.post("/", dependencies=[Depends(rate_limit("tasks.create"))])
 async def create_task(
     image: UploadFile = File(...),
-    metadata: str = None,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    metadata: Optional[str] = Form(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new image processing task."""
-    if current_user.credits < settings.MIN_CREDITS_FOR_TASK:
+    await check_credits(db, current_user)
+
+    # Stream uploaded file to a staging path, hashing as we go
+    spec = parse_metadata(metadata)
+    stored = await stage_image(image)
+
+    # Create task record
+    task = Task(
+        user_id=current_user.id,
+        original_filename=image.filename,
+        image_path=upload_store.relative_path(stored.sha256),
+        content_hash=stored.sha256,
+        task_metadata=spec,
+        credits_used=settings.CREDITS_PER_TASK,
+        processing_mode=processing_mode(stored.size)
+    )
+    db.add(task)
+    await db.flush()
+
+    # Deduct credits through the ledger; fails if the balance no longer covers it
+    balance = await credits.debit(
+        db, current_user.id, settings.CREDITS_PER_TASK, f"task:{task.id}"
+    )
+    if balance is None:
+        await db.rollback()
+        await run_in_threadpool(os.unlink, stored.path)
         raise HTTPException(
             status_code=400,
             detail="Not enough credits to process image"
         )
 
-    # Save uploaded file
-    file_path = f"{current_user.id}_{image.filename}"
-    file_location = os.path.join(settings.UPLOAD_FOLDER, file_path)
-    
-    with open(file_location, "wb+") as file_object:
-        file_object.write(await image.read())
+    # Move the upload into the content-addressed store (identical uploads
+    # share one file)
+    relative_path = await db.run_sync(upload_store.reference, stored.sha256, stored.size)
+    await run_in_threadpool(upload_store.place, relative_path, stored.path)
+    await db.commit()
 
-    # Create task record
+    # Start processing; vectorized tasks are picked up by the batch worker
+    if task.processing_mode == ProcessingMode.STANDARD:
+        await run_in_threadpool(enqueue, current_user.id, [task.id], Lane.INTERACTIVE)
+
+    return serialize_task(task)
+
+@router.post("/uploads", dependencies=[Depends(rate_limit("tasks.upload"))])
+async def create_upload(
+    filename: str,
+    size: int = Query(..., gt=0),
+    content_type: str = "application/octet-stream",
+    current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Get a signed URL to upload one image straight to storage.
+
+    Send exactly ``size`` bytes with the returned method, URL and headers
+    before ``expires_at``, then create the task with
+    ``POST /tasks/uploads/{upload_id}``. With S3 storage the bytes go to
+    the bucket and never pass through the API.
+    """
+    if size > settings.MAX_CONTENT_LENGTH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File exceeds maximum upload size of {settings.MAX_CONTENT_LENGTH} bytes"
+        )
+    upload_id = uuid.uuid4().hex
+    signed = await run_in_threadpool(
+        upload_store.backend.upload_url,
+        incoming_key(current_user.id, upload_id),
+        settings.STORAGE_URL_EXPIRES,
+        size,
+        content_type
+    )
+    return {
+        "upload_id": upload_id,
+        "filename": filename,
+        "method": signed.method,
+        "url": signed.url,
+        "headers": signed.headers,
+        "expires_at": signed.expires_at
+    }
+
+@router.post("/uploads/{upload_id}", dependencies=[Depends(rate_limit("tasks.create"))])
+async def create_task_from_upload(
+    upload_id: str,
+    filename: str,
+    metadata: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Create a task for an image uploaded with a signed URL.
+
+    The file is hashed and its header checked by the worker before it is
+    rendered; a file that turns out not to be an image fails the task and
+    refunds its credits.
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    await check_credits(db, current_user)
+    spec = parse_metadata(metadata)
+
+    key = incoming_key(current_user.id, upload_id)
+    size = await run_in_threadpool(upload_store.backend.size, key)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if size > settings.MAX_CONTENT_LENGTH:
+        await run_in_threadpool(upload_store.backend.delete, key)
+        raise HTTPException(
+            status_code=413,
+            detail=f"File exceeds maximum upload size of {settings.MAX_CONTENT_LENGTH} bytes"
+        )
+    existing = (
+        await db.execute(select(Task.id).where(Task.user_id == current_user.id, Task.image_path == key))
+    ).first()
+    if existing:
+        raise HTTPException(status_code=409, detail="A task was already created for this upload")
+
+    # The worker fills in content_hash and the store path when it ingests
+    # the file. Always standard mode: the batch worker reads the store only.
     task = Task(
         user_id=current_user.id,
-        image_path=file_path,
-        metadata=metadata,
-        credits_used=settings.CREDITS_PER_TASK
+        original_filename=filename,
+        image_path=key,
+        task_metadata=spec,
+        credits_used=settings.CREDITS_PER_TASK,
+        processing_mode=ProcessingMode.STANDARD
     )
     db.add(task)
-    
-    # Deduct credits
-    current_user.credits -= settings.CREDITS_PER_TASK
-    db.commit()
+    await db.flush()
+
+    # Charged against the upload, so the ledger's unique reference lets
+    # only one of two concurrent requests for it through
+    reference = f"upload:{current_user.id}:{upload_id}"
+    balance = await credits.debit(db, current_user.id, settings.CREDITS_PER_TASK, reference)
+    if balance is None:
+        await db.rollback()
+        charged = (
+            await db.execute(
+                select(CreditTransaction.id).where(
+                    CreditTransaction.kind == credits.DEBIT,
+                    CreditTransaction.reference == reference
+                )
+            )
+        ).first()
+        if charged:
+            raise HTTPException(status_code=409, detail="A task was already created for this upload")
+        raise HTTPException(
+            status_code=400,
+            detail="Not enough credits to process image"
+        )
+    await db.commit()
 
-    # Start processing
-    process_image.delay(task.id)
+    await run_in_threadpool(enqueue, current_user.id, [task.id], Lane.INTERACTIVE)
+    return serialize_task(task)
 
-    return task
+@router.post("/batch", dependencies=[Depends(rate_limit("tasks.batch"))])
+async def create_batch(
+    images: List[UploadFile] = File(...),
+    metadata: Optional[str] = Form(None),
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create one processing task per image, sharing a single transform spec."""
+    if len(images) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most {settings.MAX_BATCH_SIZE} images"
+        )
+    spec = parse_metadata(metadata)
+    credits_needed = len(images) * settings.CREDITS_PER_TASK
+
+    # Stage every upload before touching the database so the user row is
+    # only locked for the short transaction below
+    staged = await asyncio.gather(
+        *(stage_image(image) for image in images),
+        return_exceptions=True
+    )
+    failures = [result for result in staged if isinstance(result, BaseException)]
+    if failures:
+        for result in staged:
+            if not isinstance(result, BaseException):
+                await run_in_threadpool(os.unlink, result.path)
+        raise failures[0]
+
+    # Reserve credits for the whole batch in one conditional ledger debit
+    batch_id = uuid.uuid4().hex
+    balance = await credits.debit(db, current_user.id, credits_needed, f"batch:{batch_id}")
+    if balance is None:
+        await db.rollback()
+        for stored in staged:
+            await run_in_threadpool(os.unlink, stored.path)
+        raise HTTPException(
+            status_code=400,
+            detail="Not enough credits to process batch"
+        )
+
+    # Take the references in the transaction, then move the files into the
+    # store concurrently from worker threads
+    paths = await db.run_sync(
+        lambda session: [upload_store.reference(session, stored.sha256, stored.size) for stored in staged]
+    )
+    await asyncio.gather(*(
+        run_in_threadpool(upload_store.place, relative_path, stored.path)
+        for relative_path, stored in zip(paths, staged)
+    ))
+
+    rows = []
+    for image, stored, relative_path in zip(images, staged, paths):
+        rows.append({
+            "user_id": current_user.id,
+            "batch_id": batch_id,
+            "original_filename": image.filename,
+            "image_path": relative_path,
+            "content_hash": stored.sha256,
+            "task_metadata": spec,
+            "credits_used": settings.CREDITS_PER_TASK,
+            "status": "pending",
+            "processing_mode": processing_mode(stored.size),
+        })
+
+    # Insert all task rows in a single statement
+    task_ids = (
+        await db.execute(
+            insert(Task).returning(Task.id, sort_by_parameter_order=True),
+            rows
+        )
+    ).scalars().all()
+    await db.commit()
+
+    # Hand the batch to the scheduler; large batches go to the bulk lane
+    standard_ids = [
+        task_id for task_id, row in zip(task_ids, rows)
+        if row["processing_mode"] == ProcessingMode.STANDARD
+    ]
+    if standard_ids:
+        await run_in_threadpool(enqueue, current_user.id, standard_ids, lane_for(len(images)))
+
+    return {
+        "batch_id": batch_id,
+        "task_ids": task_ids,
+        "credits_used": credits_needed
+    }
+
+@router.get("/batches/{batch_id}")
+async def get_batch(
+    batch_id: str,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get aggregate progress of a batch."""
+    counts = dict(
+        (
+            await db.execute(
+                select(Task.status, func.count())
+                .where(Task.batch_id == batch_id, Task.user_id == current_user.id)
+                .group_by(Task.status)
+            )
+        ).all()
+    )
+    total = sum(counts.values())
+    if not total:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    finished = counts.get("completed", 0) + counts.get("failed", 0)
+    return {
+        "batch_id": batch_id,
+        "total": total,
+        "counts": counts,
+        "progress": finished / total,
+        "done": finished == total
+    }
 
 @router.get("/")
 async def get_tasks(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Query(settings.TASK_PAGE_SIZE, ge=1, le=settings.TASK_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the current user's tasks, newest first, one page at a time.
+
+    Pages are keyed on (created_at, id) rather than an offset, so every page
+    is a range scan of ix_tasks_user_created_id (or
+    ix_tasks_user_status_created_id when filtering by status) no matter how
+    deep the client has paged. Pass ``next_cursor`` from a response as
+    ``cursor`` to get the following page; it is null on the last page.
+    ``fields`` is a comma-separated subset of the task fields to return.
+    """
+    if status is not None and status not in TaskStatus.ALL:
+        raise HTTPException(
+            status_code=400,
+            detail=f"status must be one of: {', '.join(TaskStatus.ALL)}"
+        )
+    names = parse_fields(fields)
+
+    query = select(*(TASK_FIELDS[name].label(name) for name in names)).where(
+        Task.user_id == current_user.id
+    )
+    if status is not None:
+        query = query.where(Task.status == status)
+    if created_after is not None:
+        query = query.where(Task.created_at >= naive_utc(created_after))
+    if created_before is not None:
+        query = query.where(Task.created_at < naive_utc(created_before))
+    if cursor:
+        query = query.where(tuple_(Task.created_at, Task.id) < tuple_(*decode_cursor(cursor)))
+
+    # One extra row tells us whether there is a next page
+    query = query.order_by(Task.created_at.desc(), Task.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).mappings().all()
+
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/events")
+async def task_events(
+    last_event_id: Optional[str] = Header(None),
+    current_user: CurrentUser = Depends(get_stream_user)
 ):
-    """Get all tasks for the current user."""
-    tasks = db.query(Task).filter(Task.user_id == current_user.id).all()
-    return tasks
+    """
+    Stream status changes of all the current user's tasks as Server-Sent Events.
+
+    Each event carries the task's id, status, result and error. Reconnecting
+    clients send the standard Last-Event-ID header to receive the events
+    they missed (up to TASK_EVENTS_STREAM_MAXLEN per user).
+    """
+    if last_event_id:
+        try:
+            parse_event_id(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    return StreamingResponse(
+        event_stream(broker, current_user.id, last_event_id, settings.TASK_EVENTS_HEARTBEAT),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Keep nginx from buffering the stream
+        }
+    )
 
 @router.get("/{task_id}")
 async def get_task(
     task_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific task."""
-    task = db.query(Task).filter(
-        Task.id == task_id,
-        Task.user_id == current_user.id
-    ).first()
+    task = (
+        await db.execute(
+            select(Task).where(
+                Task.id == task_id,
+                Task.user_id == current_user.id
+            )
+        )
+    ).scalar_one_or_none()
     
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return task 
\ No newline at end of file
+    return serialize_task(task)
+
+async def task_file(db: AsyncSession, user_id: int, task_id: int, original: bool) -> Tuple[BlobStore, str, str]:
+    """
+    Store, key and download filename of a task's processed image (or upload).
+
+    One primary-key lookup that also checks ownership; 404 for other
+    users' tasks, 409 while the file does not exist yet.
+    """
+    task = (
+        await db.execute(
+            select(
+                Task.image_path,
+                Task.content_hash,
+                Task.original_filename,
+                Task.result["processed_image"].as_string().label("processed_image")
+            ).where(
+                Task.id == task_id,
+                Task.user_id == user_id
+            )
+        )
+    ).first()
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    if original:
+        if not task.content_hash:
+            raise HTTPException(status_code=409, detail="Upload has not been processed yet")
+        store, key = upload_store, task.image_path
+        filename = task.original_filename
+    else:
+        if not task.processed_image:
+            raise HTTPException(status_code=409, detail="Task has no processed image yet")
+        store, key = processed_store, task.processed_image
+        stem = os.path.splitext(task.original_filename or f"task-{task_id}")[0]
+        filename = f"{stem}-processed{os.path.splitext(key)[1]}"
+    return store, key, filename
+
+@router.get("/{task_id}/download")
+async def get_download_url(
+    task_id: int,
+    original: bool = False,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Signed URL of a task's processed image, or of its upload with ``original``.
+
+    The URL works without credentials until ``expires_at``.
+    """
+    store, key, filename = await task_file(db, current_user.id, task_id, original)
+    url = await run_in_threadpool(store.backend.download_url, key, settings.STORAGE_URL_EXPIRES, filename)
+    return {"url": url, "expires_at": int(time.time()) + settings.STORAGE_URL_EXPIRES}
+
+@router.api_route("/{task_id}/file", methods=["GET", "HEAD"])
+async def get_task_file(
+    task_id: int,
+    request: Request,
+    original: bool = False,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    A task's processed image, or its upload with ``original``, for its owner.
+
+    Supports Range, If-None-Match (the ETag is the file's SHA-256) and
+    long-lived immutable caching; see ``app.storage.serving``. With S3
+    storage this redirects to a signed URL instead.
+    """
+    store, key, filename = await task_file(db, current_user.id, task_id, original)
+    if not isinstance(store.backend, LocalBackend):
+        url = await run_in_threadpool(store.backend.download_url, key, settings.STORAGE_URL_EXPIRES, filename)
+        return RedirectResponse(url, status_code=307)
+    return file_response(request, store.backend, key, filename)
+
+@router.api_route(
+    "/{task_id}/derivative",
+    methods=["GET", "HEAD"],
+    dependencies=[Depends(rate_limit("tasks.derivative"))]
+)
+async def get_derivative(
+    task_id: int,
+    request: Request,
+    size: int,
+    format: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    A completed task's output fitted within ``size`` x ``size`` pixels.
+
+    ``size`` must be one of DERIVATIVE_SIZES; ``format`` (jpeg, png or
+    webp) converts it, otherwise it keeps the output's format. Derivatives
+    are free, rendered on first request and cached; see
+    ``app.services.derivatives``.
+    """
+    if size not in settings.DERIVATIVE_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"size must be one of: {', '.join(map(str, settings.DERIVATIVE_SIZES))}"
+        )
+    if format is not None and format not in FORMAT_CHOICES:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMAT_CHOICES)}")
+
+    store, source_key, filename = await task_file(db, current_user.id, task_id, original=False)
+    key = derivative_cache.key(source_key, size, format)
+    download_name = f"{os.path.splitext(filename)[0]}-{size}{os.path.splitext(key)[1]}"
+    # Revalidation needs neither the file nor a render
+    if etag_matches(request.headers.get("if-none-match", ""), key_etag(key)):
+        return file_response(request, derivative_cache.backend, key, download_name)
+    for attempt in range(2):
+        try:
+            await derivative_cache.get(store, source_key, size, format)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Processed image not found")
+        try:
+            # Holds the file open, so eviction after this point is harmless
+            return file_response(request, derivative_cache.backend, key, download_name)
+        except HTTPException as e:
+            # Evicted between the render and opening it: render it again once
+            if e.status_code != 404 or attempt:
+                raise
@@ -1,50 +1,124 @@
-from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from dataclasses import dataclass
+from typing import Callable, Optional
+import math
+from fastapi import Depends, HTTPException, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
-from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.core.config import settings
-from app.db.session import SessionLocal
+from app.core.rate_limit import RateLimitResult, get_policy, limiter
+from app.core.tokens import InvalidToken, token_verifier, token_versions
+from app.db.session import AsyncSessionLocal, get_db, get_async_db
 from app.models.user import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(
+    tokenUrl=f"{settings.API_V1_STR}/auth/login",
+    auto_error=False
+)
 
-def get_db() -> Generator:
-    """Get database session."""
-    try:
-        db = SessionLocal()
-        yield db
-    finally:
-        db.close()
-
-async def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-) -> User:
-    """Get current user from JWT token."""
+@dataclass(frozen=True)
+class CurrentUser:
+    """The authenticated user, as described by their access token."""
+    id: int
+    email: str
+    credits: Optional[int] = None  # Balance when the token was issued; a hint only
+
+async def _user_from_token(token: str) -> CurrentUser:
     try:
-        payload = jwt.decode(
-            token,
-            settings.SECRET_KEY,
-            algorithms=[settings.ALGORITHM]
-        )
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-            )
-    except (JWTError, ValidationError):
+        claims = token_verifier.verify(token)
+        if "uid" in claims:
+            await token_versions.check(claims)
+    except InvalidToken:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
         )
+    if "uid" in claims:
+        return CurrentUser(claims["uid"], claims["sub"], claims.get("credits"))
 
-    user = db.query(User).filter(User.email == email).first()
+    # Issued before tokens carried the user id: look the user up
+    async with AsyncSessionLocal() as db:
+        user = (
+            await db.execute(select(User.id, User.email, User.credits).where(User.email == claims["sub"]))
+        ).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
         )
-    return user 
\ No newline at end of file
+    return CurrentUser(user.id, user.email, user.credits)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    """
+    Get current user from JWT token.
+
+    Verified tokens are cached (see app.core.tokens) and carry the user id,
+    so this normally costs no signature check and no database query; the
+    revocation check reads a per-user version that is itself cached briefly.
+    """
+    return await _user_from_token(token)
+
+async def get_stream_user(
+    header_token: Optional[str] = Depends(optional_oauth2_scheme),
+    token: Optional[str] = Query(None)
+) -> CurrentUser:
+    """
+    Get the current user for a long-lived streaming response.
+
+    Browsers' EventSource cannot set headers, so the token may also come in
+    the ``token`` query parameter. No session is held for the stream; the
+    rare lookup for an old token opens and closes its own.
+    """
+    token = header_token or token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await _user_from_token(token)
+
+def _apply_rate_limit(result: RateLimitResult, limit: int, response: Response) -> None:
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={
+                "Retry-After": str(max(1, math.ceil(result.retry_after))),
+                "X-RateLimit-Limit": str(limit),
+                "X-RateLimit-Remaining": "0",
+            },
+        )
+    response.headers["X-RateLimit-Limit"] = str(limit)
+    response.headers["X-RateLimit-Remaining"] = str(result.remaining)
+
+def rate_limit(name: str) -> Callable:
+    """
+    Dependency enforcing the ``name`` policy from settings.RATE_LIMITS.
+
+    User-scoped policies reuse the request's get_current_user result, so
+    they add no extra token check.
+    """
+    policy = get_policy(name)
+
+    if policy is None or not settings.RATE_LIMIT_ENABLED:
+        async def no_limit() -> None:
+            return None
+        return no_limit
+
+    if policy.scope == "user":
+        async def limit_user(
+            response: Response,
+            current_user: CurrentUser = Depends(get_current_user)
+        ) -> None:
+            result = await limiter.hit(name, policy, f"user:{current_user.id}")
+            _apply_rate_limit(result, policy.limit, response)
+        return limit_user
+
+    async def limit_ip(request: Request, response: Response) -> None:
+        client_ip = request.client.host if request.client else "unknown"
+        result = await limiter.hit(name, policy, f"ip:{client_ip}")
+        _apply_rate_limit(result, policy.limit, response)
+    return limit_ip
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseSettings, PostgresDsn, validator
 import secrets
 from pathlib import Path
@@ -12,6 +12,23 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
 
+    # Access tokens. HS* algorithms sign with SECRET_KEY. RS*/ES* sign with
+    # JWT_PRIVATE_KEY_FILE under JWT_KEY_ID and verify by the token's "kid"
+    # against JWT_PUBLIC_KEY_FILES, so tokens from a retired key keep
+    # working while listed there.
+    JWT_KEY_ID: str = "default"
+    JWT_PRIVATE_KEY_FILE: Optional[str] = None  # PEM
+    JWT_PUBLIC_KEY_FILES: Dict[str, str] = {}  # kid -> PEM; the signing key's own is derived
+    JWT_CLAIMS_CACHE_SIZE: int = 10000  # Verified tokens remembered per process
+    JWT_VERSION_CHECK_INTERVAL: float = 5.0  # Seconds a user's token version (revocation) is trusted locally
+    JWT_VERSION_REDIS_TIMEOUT: float = 0.1  # Seconds before using the locally known version
+
+    # Password hashing. bcrypt runs on a dedicated bounded thread pool; once
+    # PASSWORD_HASH_MAX_QUEUE hashes are waiting, new requests get a 503.
+    BCRYPT_ROUNDS: int = 12  # Changing this rehashes passwords on next login
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 32
+
     # Database settings
     POSTGRES_SERVER: str = "localhost"
     POSTGRES_USER: str = "postgres"
@@ -31,6 +48,41 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
 
+    DATABASE_URL: Optional[str] = None
+    ASYNC_DATABASE_URL: Optional[str] = None
+
+    @validator("DATABASE_URL", pre=True)
+    def assemble_database_url(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
+        if isinstance(v, str):
+            return v
+        return str(values.get("SQLALCHEMY_DATABASE_URI"))
+
+    @validator("ASYNC_DATABASE_URL", pre=True)
+    def assemble_async_database_url(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
+        if isinstance(v, str):
+            return v
+        # Same database, reached through the asyncpg driver
+        scheme, _, rest = values.get("DATABASE_URL", "").partition("://")
+        return f"postgresql+asyncpg://{rest}"
+
+    # Connection pool profiles. API processes serve many concurrent requests;
+    # each Celery process runs one task at a time and needs only a few.
+    DB_POOL_PROFILE: str = "api"  # api, worker
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 30 * 60  # Seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 15 * 1000
+    # No pooling for the async engine: each session opens its own connection,
+    # so code that runs several event loops (the test suite) never reuses a
+    # connection across loops
+    DB_ASYNC_NULL_POOL: bool = False
+    WORKER_DB_POOL_SIZE: int = 2
+    WORKER_DB_MAX_OVERFLOW: int = 2
+    WORKER_DB_POOL_TIMEOUT: int = 60
+    WORKER_DB_STATEMENT_TIMEOUT_MS: int = 2 * 60 * 1000
+
     # Redis settings
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
@@ -45,6 +97,29 @@ class Settings(BaseSettings):
         auth = f":{password}@" if password else ""
         return f"redis://{auth}{values.get('REDIS_HOST')}:{values.get('REDIS_PORT')}"
 
+    # Shared Redis pools (app.core.redis), per process and Redis URL
+    REDIS_MAX_CONNECTIONS: int = 50  # Per pool; callers beyond it wait for a free connection
+    REDIS_POOL_TIMEOUT: float = 2.0  # Seconds to wait for a free connection
+    REDIS_SOCKET_TIMEOUT: float = 1.0
+    REDIS_CONNECT_TIMEOUT: float = 1.0
+    REDIS_RETRIES: int = 2  # On connection errors and timeouts, with exponential backoff
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30  # Seconds idle before a connection is pinged on checkout
+
+    # Rate limiting. Policies are keyed by route name; scope "ip" limits per
+    # client address, "user" per authenticated user.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_REDIS_TIMEOUT: float = 0.1  # Seconds before falling back to local buckets
+    RATE_LIMIT_REDIS_RETRY_INTERVAL: float = 5.0  # Seconds before retrying Redis after a failure
+    RATE_LIMITS: Dict[str, Dict[str, Any]] = {
+        "auth.login": {"limit": 10, "window": 60, "scope": "ip"},
+        "auth.signup": {"limit": 5, "window": 60, "scope": "ip"},
+        "tasks.create": {"limit": 60, "window": 60, "scope": "user"},
+        "tasks.upload": {"limit": 60, "window": 60, "scope": "user"},
+        "tasks.derivative": {"limit": 300, "window": 60, "scope": "user"},
+        "tasks.batch": {"limit": 10, "window": 60, "scope": "user"},
+        "payments.verify": {"limit": 10, "window": 60, "scope": "user"},
+    }
+
     # Celery settings
     CELERY_BROKER_URL: Optional[str] = None
     CELERY_RESULT_BACKEND: Optional[str] = None
@@ -55,6 +130,58 @@ class Settings(BaseSettings):
             return v
         return values.get("REDIS_URL")
 
+    # Celery worker profile (app.workers.celery_app.WORKER_PROFILES).
+    # "production" acks late, prefetches one task at a time and stores no
+    # results; "default" keeps Celery's own defaults.
+    CELERY_WORKER_PROFILE: str = "production"
+    CELERY_TASK_SOFT_TIME_LIMIT: int = 5 * 60  # Task fails with SoftTimeLimitExceeded
+    CELERY_TASK_TIME_LIMIT: int = 6 * 60  # Worker process is killed; keep below SCHEDULER_LEASE_SECONDS
+    CELERY_MAX_TASKS_PER_CHILD: int = 500  # Recycle worker processes to contain leaks
+    CELERY_MAX_MEMORY_PER_CHILD_MB: int = 1536  # Checked after each task
+    CELERY_RESULT_EXPIRES: int = 60 * 60  # For results that are still stored
+
+    # Health monitor (app.services.health). Dependencies are probed in the
+    # background; the health endpoints serve the cached results.
+    HEALTH_CHECK_INTERVAL: float = 10.0  # Seconds between probe rounds
+    HEALTH_CHECK_TIMEOUT: float = 2.0  # Per probe
+    HEALTH_READINESS_DEPENDENCIES: List[str] = ["database", "redis"]  # /health/ready fails without these
+
+    # Prometheus metrics on /metrics (app.core.metrics); restrict access at
+    # the proxy. Multiprocess mode is enabled by PROMETHEUS_MULTIPROC_DIR,
+    # which must be private to each container.
+    METRICS_ENABLED: bool = True
+    WORKER_METRICS_PORT: int = 0  # Celery and batch worker containers serve their metrics here when set
+
+    # Task scheduling (app.services.scheduler). Tasks wait in per-user
+    # queues and reach Celery only when a slot in their lane is free; the
+    # lane capacities should match the worker slots consuming each queue.
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_INTERACTIVE_MAX_BATCH: int = 10  # Larger batches run in the bulk lane
+    SCHEDULER_LANE_CAPACITY: Dict[str, int] = {"interactive": 4, "bulk": 8}
+    SCHEDULER_USER_CONCURRENCY: int = 4  # Running tasks per user across lanes
+    SCHEDULER_USER_WEIGHTS: Dict[int, float] = {}  # Relative share by user id; default 1
+    SCHEDULER_LEASE_SECONDS: int = 15 * 60  # Slots of tasks that never report back are reclaimed
+    SCHEDULER_DISPATCH_INTERVAL: float = 5.0  # Seconds between dispatcher sweeps
+
+    # Worker result cache settings
+    RESULT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Local LRU cap per worker process
+    RESULT_CACHE_MAX_ITEM_BYTES: int = 16 * 1024 * 1024  # Larger outputs are not cached
+    RESULT_CACHE_REDIS_ENABLED: bool = False  # Shared tier across all workers
+    RESULT_CACHE_REDIS_TTL: int = 60 * 60  # 1 hour
+
+    # Worker process pool. Pixel work runs in this many processes per
+    # Celery worker process (so a node runs concurrency x processes); 0
+    # renders inline in the Celery process.
+    IMAGE_POOL_PROCESSES: int = 0
+    IMAGE_POOL_TILE_MIN_PIXELS: int = 16_000_000  # Resizes of larger sources run as parallel bands
+
+    # Large images. Headers are checked before any pixels are decoded:
+    # images over IMAGE_MAX_PIXELS are rejected outright, and a task whose
+    # estimated working set exceeds the budget is drafted down (JPEG) or
+    # rejected.
+    IMAGE_MAX_PIXELS: int = 200_000_000
+    IMAGE_MEMORY_BUDGET_MB: int = 1024  # Per task
+
     # Razorpay settings
     RAZORPAY_KEY_ID: str = ""
     RAZORPAY_KEY_SECRET: str = ""
@@ -62,9 +189,61 @@ class Settings(BaseSettings):
     # Storage settings
     UPLOAD_DIR: Path = Path("uploads")
     PROCESSED_DIR: Path = Path("processed")
+    MAX_CONTENT_LENGTH: int = 64 * 1024 * 1024  # 64MB per uploaded file
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MB read/write chunks when streaming uploads
+    BLOB_GC_INTERVAL: float = 60 * 60  # Seconds between sweeps for unreferenced blobs (app.workers.blob_gc)
+    # Where file bytes live: "local" (UPLOAD_DIR/PROCESSED_DIR) or "s3".
+    # Either way clients can move files with signed URLs; with S3 those
+    # go straight to the bucket instead of through the API.
+    STORAGE_BACKEND: str = "local"
+    STORAGE_URL_EXPIRES: int = 300  # Seconds a signed upload or download URL stays valid
+    STORAGE_PUBLIC_URL: str = "http://localhost:8000"  # Base of the local backend's signed URLs
+    S3_BUCKET: str = "images"  # Holds uploads/ and processed/ prefixes
+    S3_ENDPOINT_URL: Optional[str] = None  # MinIO or another S3-compatible service; None for AWS
+    S3_REGION: str = "us-east-1"
+    S3_ACCESS_KEY_ID: str = ""  # Empty uses boto3's default credential chain
+    S3_SECRET_ACCESS_KEY: str = ""
+    S3_ADDRESSING_STYLE: str = "auto"  # "path" for MinIO
+    # Serving files (local backend). Keys are content addressed, so
+    # clients may cache them for good.
+    FILES_CACHE_MAX_AGE: int = 365 * 24 * 60 * 60
+    # Set (e.g. "/internal-files/") when nginx fronts the API: responses
+    # then carry X-Accel-Redirect: <prefix><uploads|processed>/<key> and no
+    # body, and an internal location aliasing the storage directories
+    # sends the file
+    FILES_ACCEL_REDIRECT_PREFIX: Optional[str] = None
+
+    # On-demand derivatives (GET /tasks/{id}/derivative), cached on local disk
+    DERIVATIVE_CACHE_DIR: Path = Path("derivatives")
+    DERIVATIVE_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # LRU-evicted past this
+    DERIVATIVE_SIZES: List[int] = [64, 128, 256, 512, 1024]  # Allowed longest sides
+    DERIVATIVE_QUALITY: int = 80  # JPEG/WebP quality when converting
+    DERIVATIVE_RENDER_THREADS: int = 2  # Concurrent renders per API process
 
     # Credits settings
     CREDITS_PER_RUPEE: int = 1  # Number of credits per rupee spent
+    CREDITS_PER_TASK: int = 1
+    MIN_CREDITS_FOR_TASK: int = 1
+
+    # Batch settings
+    MAX_BATCH_SIZE: int = 500  # Images per POST /tasks/batch
+
+    # Task listing
+    TASK_PAGE_SIZE: int = 50
+    TASK_PAGE_MAX_SIZE: int = 200
+
+    # Vectorized batch worker settings
+    VECTOR_BATCH_ENABLED: bool = False  # Route small uploads to the batch worker
+    VECTOR_BATCH_MAX_BYTES: int = 256 * 1024  # Uploads up to this size count as small
+    VECTOR_BATCH_SIZE: int = 256  # Tasks claimed per batch
+    VECTOR_BATCH_POLL_INTERVAL: float = 0.5  # Seconds to wait when the queue is empty
+    VECTOR_BATCH_LEASE_SECONDS: int = 300  # Claimed tasks not finished by then are reclaimed
+
+    # Task event stream settings
+    TASK_EVENTS_STREAM_MAXLEN: int = 1000  # Events kept per user for Last-Event-ID resume
+    TASK_EVENTS_STREAM_TTL: int = 24 * 60 * 60  # Idle users' streams expire after a day
+    TASK_EVENTS_HEARTBEAT: float = 15.0  # Seconds between keep-alive comments
+    TASK_EVENTS_QUEUE_SIZE: int = 256  # Buffered events per connection before it is dropped
 
     class Config:
         case_sensitive = True
@@ -0,0 +1,111 @@
+"""
+Prometheus metrics.
+
+Metrics are defined next to the code they measure (the database pools,
+the result cache, the credit ledger, the worker); this module holds the
+HTTP metrics and builds the ``/metrics`` response.
+
+With several uvicorn or Celery processes, set ``PROMETHEUS_MULTIPROC_DIR``
+to a directory the processes of one container can write before they
+start. Each process then writes its samples to files there, named by
+PID, and a scrape aggregates all of them. The directory must never be
+shared between containers (PIDs repeat across PID namespaces, so their
+files would collide) and must start empty; ``docker-entrypoint.sh``
+empties it. Each container is scraped on its own: the API on
+``/metrics``, workers on WORKER_METRICS_PORT (see ``serve``). Without the
+variable, ``/metrics`` shows only the process that serves it.
+"""
+from typing import Iterator, Optional, Tuple
+import logging
+import os
+import redis
+from fastapi import Request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest, multiprocess, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+from app.core.config import settings
+from app.core.redis import batched, get_redis
+from app.services.scheduler import Lane, scheduler
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time to the response headers, by route template",
+    ["method", "route", "status"],
+    buckets=REQUEST_BUCKETS
+)
+
+requests_in_progress = Gauge(
+    "http_requests_in_progress",
+    "Requests being handled",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+
+def route_name(request: Request) -> str:
+    """Route template of a request (``/api/v1/tasks/{task_id}``), so paths don't explode cardinality."""
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+class QueueCollector:
+    """Celery queue lengths and scheduler depths, read from Redis at scrape time."""
+
+    def __init__(self, broker_url: str):
+        self.broker_url = broker_url
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        queue_length = GaugeMetricFamily(
+            "celery_queue_length", "Messages waiting in a Celery queue", labels=["queue"]
+        )
+        scheduled = GaugeMetricFamily(
+            "scheduler_tasks", "Tasks held by the fair scheduler, by lane", labels=["lane", "state"]
+        )
+        try:
+            lengths = batched(get_redis(self.broker_url), (("llen", (lane,)) for lane in Lane.ALL))
+            for lane, length in zip(Lane.ALL, lengths):
+                queue_length.add_metric([lane], length)
+            for lane in Lane.ALL:
+                for state, count in scheduler.depth(lane).items():
+                    scheduled.add_metric([lane, state], count)
+        except redis.RedisError as e:
+            logger.warning(f"Queue depths unavailable for metrics: {e}")
+            return
+        yield queue_length
+        yield scheduled
+
+queue_collector = QueueCollector(settings.CELERY_BROKER_URL)
+
+def process_registry() -> CollectorRegistry:
+    """Metrics of every process in this container."""
+    registry = CollectorRegistry()
+    if MULTIPROC_DIR:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    return registry
+
+def latest() -> Tuple[bytes, str]:
+    """Body and content type of a scrape."""
+    registry = process_registry()
+    registry.register(queue_collector)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def serve(port: int) -> None:
+    """
+    Serve this container's metrics on ``port`` from a background thread.
+
+    For worker containers, which have no API. Call it in the parent
+    process before it forks children; queue depths are left to the API.
+    """
+    if port:
+        start_http_server(port, registry=process_registry())
+        logger.info(f"Serving worker metrics on port {port}")
+
+def process_exited(pid: Optional[int] = None) -> None:
+    """Drop a finished process's live gauges from the multiprocess directory."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+import asyncio
+import logging
+import time
+import uuid
+import redis.asyncio as aioredis
+from app.core.config import settings
+from app.core.redis import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Sliding-window log: one sorted-set entry per accepted request, scored by
+# its timestamp. Trimming, counting and recording run in a single script so
+# a check is one atomic round trip. Time comes from the Redis server so all
+# API nodes share one clock.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local member = ARGV[3]
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now, member)
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1, 0}
+end
+
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, 0, tonumber(oldest[2]) + window - now}
+"""
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    limit: int  # Requests allowed per window
+    window: float  # Window length in seconds
+    scope: str = "ip"  # ip, user
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    remaining: int
+    retry_after: float  # Seconds until the next request would be allowed
+
+class TokenBucket:
+    """Classic token bucket refilling ``limit`` tokens per ``window``."""
+
+    def __init__(self, policy: RateLimitPolicy):
+        self.capacity = policy.limit
+        self.rate = policy.limit / policy.window
+        self.tokens = float(policy.limit)
+        self.updated = time.monotonic()
+
+    def take(self) -> RateLimitResult:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return RateLimitResult(True, int(self.tokens), 0.0)
+        return RateLimitResult(False, 0, (1 - self.tokens) / self.rate)
+
+class LocalRateLimiter:
+    """
+    In-process fallback used while Redis is unreachable.
+
+    Limits are enforced per process rather than globally, so with several
+    API processes the effective limit is multiplied accordingly; that is
+    deliberately lenient but keeps a floor under abusive clients.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def hit(self, key: str, policy: RateLimitPolicy) -> RateLimitResult:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(policy)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take()
+
+class RateLimiter:
+    """Redis sliding-window limiter with an in-process token bucket fallback."""
+
+    def __init__(self, client: aioredis.Redis, timeout: float, retry_interval: float):
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.local = LocalRateLimiter()
+        self._redis = client
+        self._script = self._redis.register_script(SLIDING_WINDOW_SCRIPT)
+        self._redis_down_until = 0.0
+
+    async def hit(self, name: str, policy: RateLimitPolicy, identity: str) -> RateLimitResult:
+        """Record a request by ``identity`` against policy ``name``."""
+        key = f"rate-limit:{name}:{identity}"
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                # Bounded here rather than by the shared pool's timeouts
+                # and retries, which are sized for background work
+                allowed, remaining, retry_after_ms = await asyncio.wait_for(
+                    self._script(
+                        keys=[key],
+                        args=[int(policy.window * 1000), policy.limit, uuid.uuid4().hex]
+                    ),
+                    self.timeout
+                )
+                return RateLimitResult(bool(allowed), int(remaining), retry_after_ms / 1000)
+            except Exception as e:
+                # Any client failure (connection, timeout, pool or script
+                # errors) must not fail the request. Stop trying Redis for a
+                # while instead of paying for the failure on every request.
+                logger.warning(f"Rate limiter falling back to local buckets: {e!r}")
+                self._redis_down_until = time.monotonic() + self.retry_interval
+        return self.local.hit(key, policy)
+
+def get_policy(name: str) -> Optional[RateLimitPolicy]:
+    """Policy configured for ``name`` in settings.RATE_LIMITS, if any."""
+    policy = settings.RATE_LIMITS.get(name)
+    return RateLimitPolicy(**policy) if policy else None
+
+limiter = RateLimiter(
+    get_async_redis(),
+    timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
+    retry_interval=settings.RATE_LIMIT_REDIS_RETRY_INTERVAL
+)
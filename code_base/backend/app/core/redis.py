@@ -0,0 +1,330 @@
+"""
+Shared Redis connections.
+
+Every subsystem (rate limiting, task events, the scheduler, the result
+cache, health checks, metrics) gets its clients here instead of building
+its own, so a process holds at most REDIS_MAX_CONNECTIONS connections per
+pool however many subsystems it runs. Each Redis URL gets one blocking
+sync pool and one asyncio pool per ``decode_responses`` setting (split
+per event loop, see LoopLocalAsyncPool); callers that would exceed the
+limit wait up to REDIS_POOL_TIMEOUT for a free connection instead of
+opening another.
+
+Connection errors and timeouts are retried REDIS_RETRIES times with
+exponential backoff. Callers that need a tighter bound than that (the
+rate limiter) wrap their calls in their own timeout.
+
+Celery's broker and result connections are managed by kombu and are not
+part of these pools.
+"""
+from itertools import islice
+from urllib.parse import urlparse
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import asyncio
+import time
+import weakref
+import redis
+import redis.asyncio as aioredis
+from prometheus_client import Counter, Gauge, Histogram
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+from app.core.config import settings
+
+# Commands per pipeline round trip in ``batched``
+PIPELINE_BATCH = 500
+
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+connections_in_use = Gauge(
+    "redis_pool_connections_in_use", "Connections checked out of the pool", ["pool"], multiprocess_mode="livesum"
+)
+connections_max = Gauge(
+    "redis_pool_max_connections", "Connection limit of the pool", ["pool"], multiprocess_mode="livesum"
+)
+connections_opened = Counter(
+    "redis_pool_connections_opened_total", "Connections the pool has opened", ["pool"]
+)
+checkout_errors = Counter(
+    "redis_pool_checkout_errors_total", "Checkouts that failed (pool exhausted or Redis unreachable)", ["pool"]
+)
+checkout_wait = Histogram(
+    "redis_pool_checkout_wait_seconds", "Time waiting for a pooled connection", ["pool"], buckets=WAIT_BUCKETS
+)
+
+class PoolStats:
+    """Usage counters of one pool, kept alongside the Prometheus series."""
+
+    def __init__(self, label: str, max_connections: int):
+        self.label = label
+        self.max_connections = max_connections
+        self.in_use = 0
+        self.opened = 0
+        self.errors = 0
+        self._checked_out: Set[int] = set()
+        connections_max.labels(label).set(max_connections)
+
+    def checked_out(self, connection, waited: float) -> None:
+        self._checked_out.add(id(connection))
+        self.in_use += 1
+        connections_in_use.labels(self.label).inc()
+        checkout_wait.labels(self.label).observe(waited)
+
+    def checkout_failed(self, waited: float) -> None:
+        self.errors += 1
+        checkout_errors.labels(self.label).inc()
+        checkout_wait.labels(self.label).observe(waited)
+
+    def released(self, connection) -> None:
+        # The pool also releases connections whose checkout failed
+        if id(connection) not in self._checked_out:
+            return
+        self._checked_out.discard(id(connection))
+        self.in_use -= 1
+        connections_in_use.labels(self.label).dec()
+
+    def connection_opened(self) -> None:
+        self.opened += 1
+        connections_opened.labels(self.label).inc()
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "max_connections": self.max_connections,
+            "in_use": self.in_use,
+            "opened": self.opened,
+            "checkout_errors": self.errors,
+        }
+
+class InstrumentedPool(redis.BlockingConnectionPool):
+    stats: PoolStats
+
+    def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except Exception:
+            self.stats.checkout_failed(time.perf_counter() - start)
+            raise
+        self.stats.checked_out(connection, time.perf_counter() - start)
+        return connection
+
+    def release(self, connection) -> None:
+        super().release(connection)
+        self.stats.released(connection)
+
+    def make_connection(self):
+        self.stats.connection_opened()
+        return super().make_connection()
+
+class InstrumentedAsyncPool(aioredis.BlockingConnectionPool):
+    stats: PoolStats
+
+    async def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        try:
+            connection = await super().get_connection(command_name, *keys, **options)
+        except Exception:
+            self.stats.checkout_failed(time.perf_counter() - start)
+            raise
+        self.stats.checked_out(connection, time.perf_counter() - start)
+        return connection
+
+    async def release(self, connection) -> None:
+        await super().release(connection)
+        self.stats.released(connection)
+
+    def make_connection(self):
+        self.stats.connection_opened()
+        return super().make_connection()
+
+class LoopLocalAsyncPool(aioredis.ConnectionPool):
+    """
+    Asyncio pool that keeps one InstrumentedAsyncPool per event loop.
+
+    asyncio connections and the blocking pool's wait condition belong to
+    the loop that created them, and the clients built here are held by
+    module-level singletons (the rate limiter, the task event broker), so
+    any second loop in the process (a TestClient, ``asyncio.run`` in a
+    script) would otherwise reuse the first loop's connections. A loop's
+    pool goes away with the loop. The pools share one PoolStats, and
+    REDIS_MAX_CONNECTIONS applies to each loop.
+    """
+    stats: PoolStats
+
+    def __init__(self, **kwargs):
+        self._pool_kwargs = dict(kwargs)
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, InstrumentedAsyncPool]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._loops_lock = Lock()
+        kwargs.pop("timeout", None)  # The per-loop pools wait, this one never does
+        super().__init__(**kwargs)
+
+    def _current(self) -> InstrumentedAsyncPool:
+        loop = asyncio.get_running_loop()
+        with self._loops_lock:
+            pool = self._loops.get(loop)
+            if pool is None:
+                pool = InstrumentedAsyncPool(**self._pool_kwargs)
+                pool.stats = self.stats
+                self._loops[loop] = pool
+            return pool
+
+    async def get_connection(self, command_name, *keys, **options):
+        return await self._current().get_connection(command_name, *keys, **options)
+
+    async def release(self, connection) -> None:
+        await self._current().release(connection)
+
+    async def disconnect(self, inuse_connections: bool = True) -> None:
+        """Disconnect the running loop's pool (other loops' connections cannot be awaited here)."""
+        with self._loops_lock:
+            pool = self._loops.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool.disconnect(inuse_connections)
+
+class RedisPools:
+    """The sync and asyncio connection pools of one Redis URL, created on first use."""
+
+    def __init__(
+        self,
+        url: str,
+        name: str = "default",
+        max_connections: int = settings.REDIS_MAX_CONNECTIONS,
+        pool_timeout: float = settings.REDIS_POOL_TIMEOUT,
+        socket_timeout: float = settings.REDIS_SOCKET_TIMEOUT,
+        connect_timeout: float = settings.REDIS_CONNECT_TIMEOUT,
+        retries: int = settings.REDIS_RETRIES,
+        health_check_interval: int = settings.REDIS_HEALTH_CHECK_INTERVAL
+    ):
+        self.url = url
+        self.name = name
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.retries = retries
+        self.connection_kwargs = {
+            "socket_timeout": socket_timeout,
+            "socket_connect_timeout": connect_timeout,
+            "health_check_interval": health_check_interval,
+            "retry_on_error": [redis.ConnectionError, redis.TimeoutError],
+        }
+        self._sync: Optional[redis.Redis] = None
+        self._async: Dict[bool, aioredis.Redis] = {}
+        self._lock = Lock()
+
+    def _backoff(self) -> ExponentialBackoff:
+        return ExponentialBackoff(cap=0.5, base=0.05)
+
+    def _stats(self, kind: str) -> PoolStats:
+        return PoolStats(f"{self.name}:{kind}", self.max_connections)
+
+    def client(self) -> redis.Redis:
+        """Sync client on this URL's shared pool (reset automatically after fork)."""
+        with self._lock:
+            if self._sync is None:
+                pool = InstrumentedPool.from_url(
+                    self.url,
+                    max_connections=self.max_connections,
+                    timeout=self.pool_timeout,
+                    retry=Retry(self._backoff(), self.retries),
+                    **self.connection_kwargs
+                )
+                pool.stats = self._stats("sync")
+                self._sync = redis.Redis(connection_pool=pool)
+            return self._sync
+
+    def async_client(self, decode_responses: bool = False) -> aioredis.Redis:
+        """Asyncio client on this URL's shared pool for ``decode_responses``."""
+        with self._lock:
+            if decode_responses not in self._async:
+                pool = LoopLocalAsyncPool.from_url(
+                    self.url,
+                    max_connections=self.max_connections,
+                    timeout=self.pool_timeout,
+                    retry=AsyncRetry(self._backoff(), self.retries),
+                    decode_responses=decode_responses,
+                    **self.connection_kwargs
+                )
+                pool.stats = self._stats("async-decoded" if decode_responses else "async")
+                self._async[decode_responses] = aioredis.Redis(connection_pool=pool)
+            return self._async[decode_responses]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        clients = ([self._sync] if self._sync else []) + list(self._async.values())
+        return {
+            client.connection_pool.stats.label: client.connection_pool.stats.snapshot()
+            for client in clients
+        }
+
+    async def aclose(self) -> None:
+        """Disconnect the running loop's asyncio connections (app shutdown)."""
+        for client in self._async.values():
+            await client.connection_pool.disconnect()
+
+_pools: Dict[str, RedisPools] = {}
+_pools_lock = Lock()
+
+def _pool_name(url: str) -> str:
+    if url == settings.REDIS_URL:
+        return "default"
+    parsed = urlparse(url)  # Without the password
+    return f"{parsed.hostname}:{parsed.port or 6379}{parsed.path or '/0'}"
+
+def pools_for(url: Optional[str] = None) -> RedisPools:
+    """The process-wide pools of ``url`` (default REDIS_URL)."""
+    url = url or settings.REDIS_URL
+    with _pools_lock:
+        if url not in _pools:
+            _pools[url] = RedisPools(url, _pool_name(url))
+        return _pools[url]
+
+def get_redis(url: Optional[str] = None) -> redis.Redis:
+    return pools_for(url).client()
+
+def get_async_redis(url: Optional[str] = None, decode_responses: bool = False) -> aioredis.Redis:
+    return pools_for(url).async_client(decode_responses)
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Usage of every Redis pool in this process."""
+    stats: Dict[str, Dict[str, int]] = {}
+    for pools in list(_pools.values()):
+        stats.update(pools.stats())
+    return stats
+
+async def close_async_pools() -> None:
+    for pools in list(_pools.values()):
+        await pools.aclose()
+
+Call = Tuple[str, Sequence[Any]]  # (client method name, positional arguments)
+
+def batched(client: redis.Redis, calls: Iterable[Call], batch_size: int = PIPELINE_BATCH) -> List[Any]:
+    """
+    Run many commands with one round trip per ``batch_size`` of them.
+
+    ``calls`` are ``(method, args)`` pairs such as ``("llen", (key,))``.
+    Pipelines are not transactional; results come back in call order.
+    """
+    results: List[Any] = []
+    calls = iter(calls)
+    while True:
+        chunk = list(islice(calls, batch_size))
+        if not chunk:
+            return results
+        with client.pipeline(transaction=False) as pipe:
+            for method, args in chunk:
+                getattr(pipe, method)(*args)
+            results.extend(pipe.execute())
+
+async def abatched(client: aioredis.Redis, calls: Iterable[Call], batch_size: int = PIPELINE_BATCH) -> List[Any]:
+    """Asyncio counterpart of ``batched``."""
+    results: List[Any] = []
+    calls = iter(calls)
+    while True:
+        chunk = list(islice(calls, batch_size))
+        if not chunk:
+            return results
+        async with client.pipeline(transaction=False) as pipe:
+            for method, args in chunk:
+                getattr(pipe, method)(*args)
+            results.extend(await pipe.execute())
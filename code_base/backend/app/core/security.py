@@ -1,32 +1,27 @@
-from datetime import datetime, timedelta
-from typing import Any, Union
-from jose import jwt
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Optional, Tuple, TypeVar, Union
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
 from app.core.config import settings
+from app.core.tokens import token_verifier
+import asyncio
 import re
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
+T = TypeVar("T")
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
 
 def create_access_token(
     data: dict,
     expires_delta: Union[timedelta, None] = None
 ) -> str:
     """Create a new JWT access token."""
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(
-        to_encode,
-        settings.SECRET_KEY,
-        algorithm=settings.ALGORITHM
-    )
-    return encoded_jwt
+    return token_verifier.issue(data, expires_delta or timedelta(minutes=15))
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -36,6 +31,63 @@ def get_password_hash(password: str) -> str:
     """Generate password hash."""
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, bounded thread pool.
+
+    bcrypt releases the GIL, so hashing in threads keeps the event loop free
+    and uses several cores. At most ``max_workers + max_queue`` hashes may be
+    in flight; beyond that callers get a 503 immediately rather than
+    queueing without bound behind a login burst.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.capacity = max_workers + max_queue
+        self.in_flight = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="password-hash"
+        )
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        # Only touched from the event loop thread, so no lock is needed
+        if self.in_flight >= self.capacity:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is temporarily overloaded, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE
+)
+
+async def hash_password(password: str) -> str:
+    """Generate a password hash without blocking the event loop."""
+    return await password_hasher.run(pwd_context.hash, password)
+
+async def verify_and_update_password(
+    plain_password: str,
+    hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password without blocking the event loop.
+
+    Returns ``(valid, new_hash)``; ``new_hash`` is set when the stored hash
+    was made with outdated parameters (e.g. fewer bcrypt rounds) and should
+    replace it.
+    """
+    return await password_hasher.run(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
 def validate_password(password: str) -> bool:
     """
     Validate password strength.
@@ -67,11 +119,3 @@ def validate_email(email: str) -> bool:
     """Validate email format."""
     email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return bool(re.match(email_pattern, email))
-
-def check_rate_limit(ip: str, endpoint: str) -> bool:
-    """
-    Check if the request exceeds rate limit.
-    This is a simple implementation. In production, use Redis or a similar solution.
-    """
-    # TODO: Implement proper rate limiting with Redis
-    return True 
\ No newline at end of file
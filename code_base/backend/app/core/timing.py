@@ -0,0 +1,13 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+import time
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str) -> Iterator[None]:
+    """Add the block's wall-clock seconds to ``timings[stage]``; a no-op when ``timings`` is None."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + time.perf_counter() - start, 6)
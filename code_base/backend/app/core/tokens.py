@@ -0,0 +1,257 @@
+"""
+Access tokens: issuing them and verifying them on every request.
+
+Tokens carry what most endpoints need to know about the caller, so
+authenticating a request needs no database query:
+
+    sub      email
+    uid      user id
+    credits  balance when the token was issued; only a hint; the ledger
+             debit decides whether a task is paid for
+    ver      the user's token version when the token was issued
+
+Verification results are kept in a bounded LRU keyed by the SHA-256 of
+the token. A client sends the same token on every request, so after the
+first request it costs a hash and a dict lookup instead of a signature
+check and JSON parsing. Entries hold the token's ``exp`` and are
+dropped once it passes, so a cached token stops working when an
+uncached one would.
+
+Because a cached token is never looked up again, revocation goes through
+a per-user version in Redis (``TokenVersions``): bumping it, which
+deleting a user does, rejects every token issued before.
+
+Keys are parsed once and kept by key id. With an asymmetric ALGORITHM the
+signing key's id goes in the token header, and verification picks the
+public key by that id.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import time
+import asyncio
+import logging
+import redis
+import redis.asyncio as aioredis
+from jose import jwk, jwt
+from jose.exceptions import JOSEError
+from jose.backends.base import Key
+from prometheus_client import Counter
+from sqlalchemy import event
+from app.core.config import settings
+from app.core.redis import get_async_redis, get_redis
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+token_verifications = Counter(
+    "auth_token_verifications_total",
+    "Access token verifications by outcome (cached, decoded, invalid, revoked)",
+    ["outcome"]
+)
+
+class InvalidToken(Exception):
+    pass
+
+class TokenKeys:
+    """Signing and verification keys, parsed on first use and cached by key id."""
+
+    def __init__(
+        self,
+        algorithm: str,
+        secret: str,
+        key_id: str,
+        private_key_file: Optional[str] = None,
+        public_key_files: Optional[Dict[str, str]] = None
+    ):
+        self.algorithm = algorithm
+        self.symmetric = algorithm.startswith("HS")
+        self.secret = secret
+        self.key_id = key_id
+        self.private_key_file = private_key_file
+        self.public_key_files = public_key_files or {}
+        self._signing: Optional[Key] = None
+        self._verifying: Dict[Optional[str], Key] = {}
+
+    def signing_key(self) -> Key:
+        if self._signing is None:
+            if self.symmetric:
+                self._signing = jwk.construct(self.secret, self.algorithm)
+            elif self.private_key_file:
+                self._signing = jwk.construct(Path(self.private_key_file).read_text(), self.algorithm)
+            else:
+                raise RuntimeError(f"{self.algorithm} needs JWT_PRIVATE_KEY_FILE to sign tokens")
+        return self._signing
+
+    def headers(self) -> Optional[Dict[str, str]]:
+        return None if self.symmetric else {"kid": self.key_id}
+
+    def verifying_key(self, key_id: Optional[str]) -> Key:
+        if self.symmetric:
+            key_id = None  # One secret, whatever the header says
+        key = self._verifying.get(key_id)
+        if key is None:
+            if self.symmetric:
+                key = self.signing_key()
+            elif key_id in self.public_key_files:
+                key = jwk.construct(Path(self.public_key_files[key_id]).read_text(), self.algorithm)
+            elif key_id == self.key_id and self.private_key_file:
+                key = self.signing_key().public_key()
+            else:
+                raise InvalidToken(f"Unknown key id {key_id!r}")
+            self._verifying[key_id] = key
+        return key
+
+class TokenVerifier:
+    """
+    Issues access tokens and verifies them through a bounded claims cache.
+
+    Only touched from the event loop thread, so the cache needs no lock.
+    Claims are returned from the cache as-is; callers must not modify them.
+    """
+
+    def __init__(self, keys: TokenKeys, cache_size: int):
+        self.keys = keys
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    def issue(self, claims: Dict[str, Any], expires_delta: timedelta) -> str:
+        to_encode = {**claims, "exp": datetime.utcnow() + expires_delta}
+        return jwt.encode(
+            to_encode,
+            self.keys.signing_key(),
+            algorithm=self.keys.algorithm,
+            headers=self.keys.headers()
+        )
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """The claims of a valid, unexpired token; raises InvalidToken otherwise."""
+        digest = hashlib.sha256(token.encode()).digest()
+        cached = self._cache.get(digest)
+        if cached is not None:
+            claims, expires_at = cached
+            if time.time() < expires_at:
+                self._cache.move_to_end(digest)
+                token_verifications.labels("cached").inc()
+                return claims
+            del self._cache[digest]
+            token_verifications.labels("invalid").inc()
+            raise InvalidToken("Token has expired")
+
+        try:
+            claims = self.decode(token)
+        except InvalidToken:
+            token_verifications.labels("invalid").inc()
+            raise
+        token_verifications.labels("decoded").inc()
+        if self.cache_size > 0:
+            self._cache[digest] = (claims, float(claims["exp"]))
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return claims
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """Check a token's signature and claims without the cache."""
+        try:
+            key = self.keys.verifying_key(jwt.get_unverified_header(token).get("kid"))
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[self.keys.algorithm],
+                options={"require_exp": True}
+            )
+        except JOSEError as e:
+            raise InvalidToken(str(e))
+        if not claims.get("sub"):
+            raise InvalidToken("Token has no subject")
+        return claims
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+def version_key(user_id: int) -> str:
+    return f"user:{user_id}:ver"
+
+class TokenVersions:
+    """
+    Per-user token versions, kept in Redis under ``user:{id}:ver``.
+
+    A token is valid while its ``ver`` claim (0 if absent) matches the
+    user's current version. Versions are remembered per process for
+    ``check_interval`` seconds, so a revocation reaches other processes
+    within that time; ``revoke`` updates its own process's copy at once.
+    Like the rate limiter, a Redis failure falls back to what is known
+    locally (the last version seen, else 0) rather than failing requests.
+    """
+
+    def __init__(
+        self,
+        client: aioredis.Redis,
+        sync_client: redis.Redis,
+        check_interval: float,
+        timeout: float,
+        cache_size: int
+    ):
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._redis = client
+        self._sync_redis = sync_client
+        self._cache: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+
+    async def current(self, user_id: int) -> int:
+        cached = self._cache.get(user_id)
+        if cached is not None and time.monotonic() < cached[1]:
+            self._cache.move_to_end(user_id)
+            return cached[0]
+        try:
+            value = await asyncio.wait_for(self._redis.get(version_key(user_id)), self.timeout)
+            version = int(value or 0)
+        except Exception as e:
+            logger.warning(f"Token version check for user {user_id} fell back to the local copy: {e!r}")
+            version = cached[0] if cached is not None else 0
+        self._cache[user_id] = (version, time.monotonic() + self.check_interval)
+        self._cache.move_to_end(user_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return version
+
+    async def check(self, claims: Dict[str, Any]) -> None:
+        """Raise InvalidToken if the token's version has been revoked."""
+        if claims.get("ver", 0) != await self.current(claims["uid"]):
+            token_verifications.labels("revoked").inc()
+            raise InvalidToken("Token has been revoked")
+
+    def revoke(self, user_id: int) -> None:
+        """Reject every token issued to ``user_id`` so far (sync; callable from workers and flushes)."""
+        version = self._sync_redis.incr(version_key(user_id))
+        self._cache[user_id] = (version, time.monotonic() + self.check_interval)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+token_verifier = TokenVerifier(
+    TokenKeys(
+        settings.ALGORITHM,
+        settings.SECRET_KEY,
+        settings.JWT_KEY_ID,
+        settings.JWT_PRIVATE_KEY_FILE,
+        settings.JWT_PUBLIC_KEY_FILES
+    ),
+    settings.JWT_CLAIMS_CACHE_SIZE
+)
+
+token_versions = TokenVersions(
+    get_async_redis(),
+    get_redis(),
+    check_interval=settings.JWT_VERSION_CHECK_INTERVAL,
+    timeout=settings.JWT_VERSION_REDIS_TIMEOUT,
+    cache_size=settings.JWT_CLAIMS_CACHE_SIZE
+)
+
+@event.listens_for(User, "after_delete")
+def revoke_deleted_user(mapper, connection, user: User) -> None:
+    # Before commit: a rolled back delete only logs the user out
+    token_versions.revoke(user.id)
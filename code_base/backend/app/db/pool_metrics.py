@@ -0,0 +1,179 @@
+from typing import Dict, Optional
+import time
+import prometheus_client
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Checkout wait buckets in seconds
+WAIT_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Labelled by pool name and profile. These series are the only record of
+# pool activity: /metrics exports them and PoolMetrics.snapshot reads them
+# back. Per-process gauges are summed over live processes in multiprocess mode.
+POOL_LABELS = ["pool", "profile"]
+pool_size = prometheus_client.Gauge(
+    "db_pool_size", "Configured connections per pool", POOL_LABELS, multiprocess_mode="livesum"
+)
+pool_checked_out = prometheus_client.Gauge(
+    "db_pool_checked_out", "Connections in use", POOL_LABELS, multiprocess_mode="livesum"
+)
+pool_overflow = prometheus_client.Gauge(
+    "db_pool_overflow", "Connections open beyond the pool size", POOL_LABELS, multiprocess_mode="livesum"
+)
+pool_events = prometheus_client.Counter(
+    "db_pool_events_total",
+    "Checkouts, checkout failures, and connections opened, closed and invalidated",
+    POOL_LABELS + ["event"]
+)
+pool_timeouts = prometheus_client.Counter(
+    "db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after the pool timeout",
+    POOL_LABELS
+)
+pool_wait_seconds = prometheus_client.Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time callers wait for a connection, including opening one",
+    POOL_LABELS,
+    buckets=WAIT_TIME_BUCKETS
+)
+
+EVENTS = ("checkout", "checkout_failure", "connect", "close", "invalidate")
+
+def _samples(metric, labels: Dict[str, str]) -> Dict[str, float]:
+    """This process's samples of ``metric`` carrying ``labels``, by sample name and extra labels."""
+    values = {}
+    for family in metric.collect():
+        for sample in family.samples:
+            if all(sample.labels.get(key) == value for key, value in labels.items()):
+                extra = [value for key, value in sample.labels.items() if key not in labels]
+                values[":".join([sample.name] + extra)] = sample.value
+    return values
+
+class PoolMetrics:
+    """The Prometheus series of one connection pool."""
+
+    def __init__(self, name: str, profile: str):
+        self.name = name
+        self.profile = profile
+        self.labels = {"pool": name, "profile": profile}
+        self.checked_out = pool_checked_out.labels(name, profile)
+        self.overflow = pool_overflow.labels(name, profile)
+        self.timeouts = pool_timeouts.labels(name, profile)
+        self.wait_seconds = pool_wait_seconds.labels(name, profile)
+        self.events = {kind: pool_events.labels(name, profile, kind) for kind in EVENTS}
+        self.pool: Optional[QueuePool] = None
+
+    def attach(self, pool: QueuePool) -> None:
+        self.pool = pool
+        pool.metrics = self
+        pool_size.labels(self.name, self.profile).set(pool.size())
+
+    def event(self, name: str) -> None:
+        self.events[name].inc()
+
+    def track_overflow(self) -> None:
+        if self.pool is not None:
+            self.overflow.set(max(self.pool.overflow(), 0))
+
+    def snapshot(self) -> Dict[str, object]:
+        events = _samples(pool_events, self.labels)
+        waits = _samples(pool_wait_seconds, self.labels)
+        pool = self.pool
+        return {
+            "profile": self.profile,
+            "size": pool.size() if pool else 0,
+            "checked_out": pool.checkedout() if pool else 0,
+            "checked_in": pool.checkedin() if pool else 0,
+            "overflow": int(_samples(pool_overflow, self.labels).get("db_pool_overflow", 0)),
+            "checkouts": int(events.get("db_pool_events_total:checkout", 0)),
+            "checkout_failures": int(events.get("db_pool_events_total:checkout_failure", 0)),
+            "checkout_timeouts": int(_samples(pool_timeouts, self.labels).get("db_pool_checkout_timeouts_total", 0)),
+            "connections_opened": int(events.get("db_pool_events_total:connect", 0)),
+            "connections_closed": int(events.get("db_pool_events_total:close", 0)),
+            "invalidations": int(events.get("db_pool_events_total:invalidate", 0)),
+            "wait_time_seconds": {
+                "buckets": {
+                    key.rpartition(":")[2]: int(value)
+                    for key, value in waits.items()
+                    if key.startswith("db_pool_checkout_wait_seconds_bucket:")
+                },
+                "count": int(waits.get("db_pool_checkout_wait_seconds_count", 0)),
+                "sum": waits.get("db_pool_checkout_wait_seconds_sum", 0.0),
+            },
+        }
+
+class InstrumentedPoolMixin:
+    """Times checkouts (including opening a connection) and tracks overflow and timeouts."""
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception as e:
+            if self.metrics:
+                self.metrics.event("checkout_failure")
+                if isinstance(e, PoolTimeoutError):
+                    self.metrics.timeouts.inc()
+            raise
+        finally:
+            if self.metrics:
+                self.metrics.wait_seconds.observe(time.perf_counter() - start)
+                self.metrics.track_overflow()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        if self.metrics:
+            self.metrics.track_overflow()
+
+    def recreate(self):
+        # engine.dispose() replaces the pool; carry the metrics over
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics:
+            self.metrics.attach(pool)
+        return pool
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+_registry: Dict[str, PoolMetrics] = {}
+
+def instrument(engine: Engine, name: str, profile: str) -> PoolMetrics:
+    """Attach metrics to an engine built with one of the instrumented pools."""
+    metrics = PoolMetrics(name, profile)
+    metrics.attach(engine.pool)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.event("connect")
+
+    @event.listens_for(engine, "close")
+    def on_close(dbapi_connection, connection_record):
+        metrics.event("close")
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.event("invalidate")
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.event("checkout")
+        metrics.checked_out.inc()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        metrics.checked_out.dec()
+
+    _registry[name] = metrics
+    return metrics
+
+def pool_stats() -> Dict[str, Dict[str, object]]:
+    """Snapshot of every instrumented pool in this process."""
+    return {name: metrics.snapshot() for name, metrics in _registry.items()}
@@ -1,13 +1,75 @@
+from typing import Any, AsyncGenerator, Dict
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
+from app.db.pool_metrics import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    instrument
+)
 
-engine = create_engine(str(settings.DATABASE_URL))
+POOL_PROFILES: Dict[str, Dict[str, Any]] = {
+    "api": {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "statement_timeout_ms": settings.DB_STATEMENT_TIMEOUT_MS,
+    },
+    "worker": {
+        "pool_size": settings.WORKER_DB_POOL_SIZE,
+        "max_overflow": settings.WORKER_DB_MAX_OVERFLOW,
+        "pool_timeout": settings.WORKER_DB_POOL_TIMEOUT,
+        "statement_timeout_ms": settings.WORKER_DB_STATEMENT_TIMEOUT_MS,
+    },
+}
+
+def engine_options(profile: str, is_async: bool = False) -> Dict[str, Any]:
+    """Keyword arguments for create_engine/create_async_engine for a pool profile."""
+    options = dict(POOL_PROFILES[profile])
+    statement_timeout = str(options.pop("statement_timeout_ms"))
+    if is_async:
+        connect_args = {"server_settings": {"statement_timeout": statement_timeout}}
+    else:
+        connect_args = {"options": f"-c statement_timeout={statement_timeout}"}
+    if is_async and settings.DB_ASYNC_NULL_POOL:
+        return {"poolclass": NullPool, "connect_args": connect_args}
+    return {
+        **options,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "connect_args": connect_args,
+    }
+
+engine = create_engine(
+    str(settings.DATABASE_URL),
+    **engine_options(settings.DB_POOL_PROFILE)
+)
+instrument(engine, "sync", settings.DB_POOL_PROFILE)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the API, so queries never block the event loop
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    **engine_options(settings.DB_POOL_PROFILE, is_async=True)
+)
+if not settings.DB_ASYNC_NULL_POOL:
+    instrument(async_engine.sync_engine, "async", settings.DB_POOL_PROFILE)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
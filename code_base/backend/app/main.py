@@ -1,12 +1,17 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
 import os
 import time
 from app.core.config import settings
 from app.api.api_v1.api import api_router
 from app.core.logging import setup_logging
+from app.core.redis import close_async_pools
+from app.db.session import async_engine
+from app.core.metrics import latest, process_exited, request_seconds, requests_in_progress, route_name
+from app.services.health import health_monitor
+from app.services.task_events import broker as task_event_broker
 import logging
 
 # Set up logging
@@ -34,9 +39,17 @@ app.add_middleware(
 # Add request timing middleware
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    start_time = time.perf_counter()
+    status = 500
+    in_progress = requests_in_progress.labels(request.method)
+    in_progress.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        in_progress.dec()
+        process_time = time.perf_counter() - start_time
+        request_seconds.labels(request.method, route_name(request), status).observe(process_time)
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
@@ -49,12 +62,40 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": "Internal server error"},
     )
 
+@app.on_event("startup")
+async def start_health_monitor():
+    health_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_health_monitor():
+    await health_monitor.stop()
+
+@app.on_event("shutdown")
+async def close_task_event_broker():
+    await task_event_broker.close()
+
+@app.on_event("shutdown")
+async def close_redis_pools():
+    await close_async_pools()
+
+@app.on_event("shutdown")
+async def close_database_connections():
+    # Pooled connections belong to this event loop
+    await async_engine.dispose()
+
+@app.on_event("shutdown")
+async def drop_process_metrics():
+    process_exited()
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
-# Mount static files
-app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
-app.mount("/processed", StaticFiles(directory=settings.PROCESSED_DIR), name="processed")
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus scrape endpoint."""
+        body, content_type = await run_in_threadpool(latest)
+        return Response(body, media_type=content_type)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, UniqueConstraint
+from datetime import datetime
+from app.db.base_class import Base
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    namespace = Column(String, primary_key=True)  # uploads, processed
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)  # Relative to the store root
+    size = Column(BigInteger, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class BlobDerivative(Base):
+    __tablename__ = "blob_derivatives"
+    __table_args__ = (
+        UniqueConstraint("source_sha256", "transform_key", name="uq_blob_derivative"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_sha256 = Column(String(64), nullable=False)
+    transform_key = Column(String(64), nullable=False)
+    output_sha256 = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint
+from datetime import datetime
+from app.db.base_class import Base
+
+class CreditTransaction(Base):
+    """Append-only ledger entry; a user's balance is the sum of their amounts."""
+    __tablename__ = "credit_transactions"
+    __table_args__ = (
+        # One entry per (kind, reference) makes credits, debits and refunds idempotent
+        UniqueConstraint("kind", "reference", name="uq_credit_transaction_reference"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    amount = Column(Integer, nullable=False)  # Positive for credits, negative for debits
+    balance_after = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)  # purchase, debit, refund
+    reference = Column(String, nullable=False)  # e.g. task:42, batch:<id>, payment:<id>
+    created_at = Column(DateTime, default=datetime.utcnow)
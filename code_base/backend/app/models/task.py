@@ -1,20 +1,53 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, JSON, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.base_class import Base
 
+class TaskStatus:
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    ALL = (PENDING, PROCESSING, COMPLETED, FAILED)
+
+class ProcessingMode:
+    STANDARD = "standard"  # One Celery process_image task per task
+    VECTORIZED = "vectorized"  # Claimed in bulk by the batch worker (app.workers.batch)
+
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Keyset pagination of a user's task list, newest first, optionally
+        # narrowed to one status
+        Index("ix_tasks_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_tasks_user_status_created_id", "user_id", "status", "created_at", "id"),
+        # Claim queue of the batch worker; finished tasks drop out of it
+        Index(
+            "ix_tasks_vectorized_queue",
+            "created_at",
+            "id",
+            postgresql_where=text("processing_mode = 'vectorized' AND status IN ('pending', 'processing')")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    batch_id = Column(String(32), index=True)  # Set for tasks created through /tasks/batch
     original_filename = Column(String, nullable=False)
+    image_path = Column(String)  # Relative to the upload store root
     processed_filename = Column(String)
-    status = Column(String, default="pending")  # pending, processing, completed, failed
+    content_hash = Column(String(64))  # SHA-256 of the uploaded file
+    status = Column(String, default=TaskStatus.PENDING)  # pending, processing, completed, failed
     error_message = Column(String)
-    metadata = Column(JSON)
+    # "metadata" is reserved on declarative classes, so the column keeps its
+    # name but is mapped under another attribute
+    task_metadata = Column("metadata", JSON)  # Transform spec
+    result = Column(JSON)
+    credits_used = Column(Integer, nullable=False, default=0)
+    processing_mode = Column(String(16), nullable=False, default=ProcessingMode.STANDARD, server_default=ProcessingMode.STANDARD)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
-    user = relationship("User", back_populates="tasks") 
\ No newline at end of file
+    user = relationship("User", back_populates="tasks")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 
@@ -9,7 +9,7 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     full_name = Column(String)
-    credits = Column(Float, default=0)
+    credits = Column(Integer, nullable=False, default=0)  # Whole credit units, changed only through the ledger
 
     # Relationships
     tasks = relationship("Task", back_populates="user") 
\ No newline at end of file
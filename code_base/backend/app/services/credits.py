@@ -0,0 +1,114 @@
+from typing import Optional
+import logging
+from prometheus_client import Counter
+from sqlalchemy import exists, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models.credit_transaction import CreditTransaction
+from app.models.task import Task
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+DEBIT = "debit"
+PURCHASE = "purchase"
+REFUND = "refund"
+
+credits_moved = Counter(
+    "credits_total",
+    "Credits moved through the ledger, by entry kind (debit, purchase, refund)",
+    ["kind"]
+)
+
+def ledger_statement(user_id: int, amount: int, kind: str, reference: str):
+    """
+    Build a single statement that moves a balance and appends the ledger entry.
+
+    The balance change is a conditional ``UPDATE ... RETURNING`` in a CTE and
+    the ledger row is inserted from its result, so both happen atomically in
+    one round trip without reading the balance into Python first. Debits
+    (negative amounts) only apply when the balance covers them. Entries that
+    already exist for (kind, reference) are not applied again; if two
+    transactions race on the same reference, the unique constraint fails one
+    of them. The statement returns the new balance, or no row when nothing
+    was applied.
+    """
+    conditions = [
+        User.id == user_id,
+        ~exists().where(
+            CreditTransaction.kind == kind,
+            CreditTransaction.reference == reference
+        ),
+    ]
+    if amount < 0:
+        conditions.append(User.credits >= -amount)
+
+    changed = (
+        update(User)
+        .where(*conditions)
+        .values(credits=User.credits + amount)
+        .returning(User.id, User.credits)
+        .cte("changed")
+    )
+    return (
+        insert(CreditTransaction)
+        .from_select(
+            ["user_id", "amount", "balance_after", "kind", "reference"],
+            select(
+                changed.c.id,
+                literal(amount),
+                changed.c.credits,
+                literal(kind),
+                literal(reference)
+            )
+        )
+        .returning(CreditTransaction.balance_after)
+    )
+
+async def apply(db: AsyncSession, user_id: int, amount: int, kind: str, reference: str) -> Optional[int]:
+    """
+    Apply a ledger entry inside the caller's transaction.
+
+    Returns the new balance, or None when the entry was not applied (not
+    enough credits, or already applied). The caller commits.
+    """
+    try:
+        async with db.begin_nested():
+            result = await db.execute(ledger_statement(user_id, amount, kind, reference))
+            balance = result.scalar_one_or_none()
+    except IntegrityError:
+        logger.info(f"Ledger entry {kind} {reference} was already applied")
+        return None
+    if balance is not None:
+        credits_moved.labels(kind).inc(abs(amount))
+    return balance
+
+async def debit(db: AsyncSession, user_id: int, amount: int, reference: str) -> Optional[int]:
+    """Take ``amount`` credits if the balance covers them."""
+    return await apply(db, user_id, -amount, DEBIT, reference)
+
+async def purchase(db: AsyncSession, user_id: int, amount: int, reference: str) -> Optional[int]:
+    """Add purchased credits; replaying the same payment reference is a no-op."""
+    return await apply(db, user_id, amount, PURCHASE, reference)
+
+def refund_task(db: Session, task: Task) -> Optional[int]:
+    """
+    Give back the credits charged for a failed task, at most once.
+
+    Runs in the worker on a sync session. The caller commits.
+    """
+    if not task.credits_used:
+        return None
+    try:
+        with db.begin_nested():
+            result = db.execute(
+                ledger_statement(task.user_id, task.credits_used, REFUND, f"task:{task.id}")
+            )
+            balance = result.scalar_one_or_none()
+    except IntegrityError:
+        logger.info(f"Task {task.id} was already refunded")
+        return None
+    if balance is not None:
+        credits_moved.labels(REFUND).inc(task.credits_used)
+    return balance
@@ -0,0 +1,181 @@
+"""
+On-demand derivatives (previews) of processed images.
+
+A derivative is a task's processed output fitted within a standard size
+(DERIVATIVE_SIZES) and optionally converted to another format. It is
+rendered with the same ``parse_spec``/``image_pool.render`` path as
+``process_image``, then kept in a local disk cache:
+
+* Keys are content addressed: a digest of the source output's digest and
+  the derivative parameters. Tasks with the same output share entries.
+* The cache is bounded to DERIVATIVE_CACHE_MAX_BYTES. Hits bump the
+  file's mtime, and when the total goes over the limit the least recently
+  used files are deleted down to 90% of it. mtimes live on disk, so every
+  API process on the host shares one LRU order.
+* Concurrent requests for the same derivative coalesce: within a process
+  they await one render, and across processes a per-key-stripe file lock
+  makes later renderers find the finished file instead of rendering again.
+
+Renders run on their own small thread pool so a burst of previews cannot
+take over the threadpool request handlers use.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Union
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import time
+from prometheus_client import Counter
+from app.core.config import settings
+from app.storage.backends import LocalBackend
+from app.storage.blobstore import BlobStore
+from app.transforms.parallel import image_pool
+from app.transforms.pipeline import FORMATS, output_suffix, parse_spec
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CHOICES = ("jpeg", "png", "webp")
+
+# Hits only move a file up the LRU order when its mtime is older than this
+TOUCH_INTERVAL = 60
+
+# Eviction deletes down to this fraction of the limit so it runs rarely
+EVICT_TO = 0.9
+
+derivative_requests = Counter(
+    "derivative_requests_total",
+    "Derivative requests by outcome (hit, render, coalesced)",
+    ["outcome"]
+)
+
+class DerivativeCache:
+    """Rendered derivatives on local disk, bounded in size with LRU eviction."""
+
+    def __init__(self, root: Union[str, Path], max_bytes: int, render_threads: int, quality: int):
+        self.backend = LocalBackend(root, "derivatives", settings.STORAGE_PUBLIC_URL)
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=render_threads, thread_name_prefix="derivative")
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._bytes: Optional[int] = None  # Scanned on the first render
+        self._lock = Lock()
+
+    def key(self, source_key: str, size: int, image_format: Optional[str]) -> str:
+        """Cache key of a derivative; also its path under the root."""
+        source_digest = Path(source_key).name.split(".")[0]
+        digest = hashlib.sha256(f"{source_digest}:{size}:{image_format}:{self.quality}".encode()).hexdigest()
+        suffix = output_suffix(FORMATS[image_format]) if image_format else Path(source_key).suffix
+        return f"{digest[:2]}/{digest}{suffix}"
+
+    def spec(self, size: int, image_format: Optional[str]) -> dict:
+        steps = [{"op": "thumbnail", "width": size, "height": size}]
+        if image_format:
+            steps.append({"op": "format", "format": image_format, "quality": self.quality})
+        return {"steps": steps}
+
+    def lookup(self, key: str) -> bool:
+        """Whether ``key`` is cached, marking it recently used."""
+        path = self.backend.path(key)
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        if time.time() - modified > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return False  # Evicted just now
+        return True
+
+    async def get(self, store: BlobStore, source_key: str, size: int, image_format: Optional[str]) -> str:
+        """Key of the derivative of ``source_key`` in ``store``, rendering it if needed."""
+        key = self.key(source_key, size, image_format)
+        if self.lookup(key):
+            derivative_requests.labels("hit").inc()
+            return key
+
+        render = self._pending.get(key)
+        if render is None:
+            derivative_requests.labels("render").inc()
+            render = asyncio.get_running_loop().run_in_executor(
+                self.executor, self._render, store, source_key, self.spec(size, image_format), key
+            )
+            self._pending[key] = render
+            render.add_done_callback(lambda future: self._finished(key, future))
+        else:
+            derivative_requests.labels("coalesced").inc()
+        # Shielded so one client disconnecting does not cancel the others' render
+        await asyncio.shield(render)
+        return key
+
+    def _finished(self, key: str, future: asyncio.Future) -> None:
+        self._pending.pop(key, None)
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Derivative {key} failed: {future.exception()}")
+
+    def _render(self, store: BlobStore, source_key: str, spec: dict, key: str) -> None:
+        path = self.backend.path(key)
+        lock_dir = self.root / ".locks"
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        # Striped by key prefix so lock files never need cleaning up
+        with open(lock_dir / key[:2], "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if path.exists():
+                    return  # Another process rendered it while we waited
+                with store.local_path(source_key) as source:
+                    _, data = image_pool.render(source, parse_spec(spec))
+                self.backend.put_bytes(key, data)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._added(len(data))
+
+    def _files(self):
+        for directory, subdirectories, files in os.walk(self.root):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+            for name in files:
+                if not name.startswith("."):
+                    path = os.path.join(directory, name)
+                    try:
+                        yield path, os.stat(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _added(self, size: int) -> None:
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(stat.st_size for _, stat in self._files())
+            else:
+                self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Rescan: other processes add and evict files too
+        files = sorted(self._files(), key=lambda entry: entry[1].st_mtime)
+        total = sum(stat.st_size for _, stat in files)
+        target = self.max_bytes * EVICT_TO
+        evicted = 0
+        for path, stat in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= stat.st_size
+            evicted += 1
+        self._bytes = total
+        logger.info(f"Evicted {evicted} derivatives, {total} bytes cached")
+
+derivative_cache = DerivativeCache(
+    settings.DERIVATIVE_CACHE_DIR,
+    settings.DERIVATIVE_CACHE_MAX_BYTES,
+    settings.DERIVATIVE_RENDER_THREADS,
+    settings.DERIVATIVE_QUALITY
+)
@@ -0,0 +1,138 @@
+"""
+Dependency health, probed in the background.
+
+Each API process runs one ``HealthMonitor``. It probes every dependency
+concurrently, each under a timeout, every HEALTH_CHECK_INTERVAL seconds
+and keeps the latest results. Health endpoints only read those results,
+so a load balancer probing every few seconds costs nothing and a slow
+dependency can never hold a request.
+"""
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+import asyncio
+import logging
+import time
+from prometheus_client import Gauge
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.redis import get_async_redis
+from app.db.session import async_engine
+from app.workers.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+# Results older than this many intervals count as failed; the monitor
+# itself has stalled
+STALE_INTERVALS = 3
+
+probe_up = Gauge(
+    "health_probe_up",
+    "1 if the dependency passed its last probe",
+    ["dependency"],
+    multiprocess_mode="livemostrecent"
+)
+probe_latency = Gauge(
+    "health_probe_latency_seconds",
+    "Duration of the dependency's last probe",
+    ["dependency"],
+    multiprocess_mode="livemostrecent"
+)
+
+Probe = Callable[[], Awaitable[None]]
+
+@dataclass
+class ProbeResult:
+    healthy: bool
+    latency: float  # Seconds
+    checked_at: float  # Unix time
+    error: Optional[str] = None
+
+class HealthMonitor:
+    """Runs dependency probes on an interval and caches their results."""
+
+    def __init__(self, probes: Dict[str, Probe], interval: float, timeout: float, required: Sequence[str]):
+        self.probes = probes
+        self.interval = interval
+        self.timeout = timeout
+        self.required = tuple(required)
+        self.results: Dict[str, ProbeResult] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe(self, name: str, probe: Probe) -> ProbeResult:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), self.timeout)
+            error = None
+        except asyncio.TimeoutError:
+            error = f"timed out after {self.timeout}s"
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        result = ProbeResult(error is None, round(time.perf_counter() - start, 6), time.time(), error)
+        probe_up.labels(name).set(1 if result.healthy else 0)
+        probe_latency.labels(name).set(result.latency)
+        if error and (name not in self.results or self.results[name].healthy):
+            logger.warning(f"Health probe {name} failed: {error}")
+        return result
+
+    async def check(self) -> Dict[str, ProbeResult]:
+        """Probe every dependency concurrently and store the results."""
+        results = await asyncio.gather(*(self._probe(name, probe) for name, probe in self.probes.items()))
+        self.results = dict(zip(self.probes, results))
+        return self.results
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def healthy(self, name: str) -> bool:
+        """Whether the dependency passed a probe recently enough to trust."""
+        result = self.results.get(name)
+        return (
+            result is not None
+            and result.healthy
+            and time.time() - result.checked_at <= self.interval * STALE_INTERVALS
+        )
+
+    def report(self) -> Dict[str, dict]:
+        return {
+            name: {**asdict(result), "status": "healthy" if self.healthy(name) else "unhealthy"}
+            for name, result in self.results.items()
+        }
+
+    def ready(self) -> Tuple[bool, Dict[str, dict]]:
+        """Whether every required dependency is healthy, with the report."""
+        return all(self.healthy(name) for name in self.required), self.report()
+
+async def probe_database() -> None:
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+async def probe_redis() -> None:
+    await get_async_redis().ping()
+
+async def probe_celery() -> None:
+    # A broadcast ping; the reply wait blocks, so it runs in a thread
+    replies = await asyncio.to_thread(celery_app.control.ping, timeout=settings.HEALTH_CHECK_TIMEOUT / 2)
+    if not replies:
+        raise RuntimeError("No Celery worker replied")
+
+health_monitor = HealthMonitor(
+    {"database": probe_database, "redis": probe_redis, "celery": probe_celery},
+    interval=settings.HEALTH_CHECK_INTERVAL,
+    timeout=settings.HEALTH_CHECK_TIMEOUT,
+    required=settings.HEALTH_READINESS_DEPENDENCIES
+)
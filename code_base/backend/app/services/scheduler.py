@@ -0,0 +1,234 @@
+"""
+Fair scheduling of processing tasks across users.
+
+Tasks do not go to Celery when they are created. They wait in per-user
+Redis queues, one set per priority lane, and are handed to Celery only
+when a worker slot in their lane is free. That way one user's 10k-image
+batch occupies at most their share of the workers instead of the whole
+broker queue.
+
+* Lanes: single uploads and small batches run in the interactive lane,
+  large batches in the bulk lane. Each lane has its own Celery queue and
+  slot count, so bulk work can never delay interactive work.
+* Fairness: within a lane, users are served by start-time fair queueing.
+  Each user's next task is tagged with the user's virtual finish time
+  (advancing by 1 / weight per dispatched task), and the lowest tag goes
+  next. A user who was idle rejoins at the current virtual time rather
+  than with banked credit.
+* Caps: a user never has more than SCHEDULER_USER_CONCURRENCY tasks
+  running across both lanes.
+
+Running slots are leases. Workers release them when a task finishes, and
+a slot whose worker died frees itself after SCHEDULER_LEASE_SECONDS.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import time
+import redis
+from app.core.config import settings
+from app.core.redis import batched, get_redis
+
+logger = logging.getLogger(__name__)
+
+class Lane:
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
+
+    ALL = (INTERACTIVE, BULK)
+
+def lane_for(batch_size: int) -> str:
+    """Lane for a submission of ``batch_size`` tasks."""
+    if batch_size <= settings.SCHEDULER_INTERACTIVE_MAX_BATCH:
+        return Lane.INTERACTIVE
+    return Lane.BULK
+
+# ARGV: lane, user, weight, task ids...
+SUBMIT_SCRIPT = """
+local prefix = 'scheduler:' .. ARGV[1]
+local user = ARGV[2]
+local queue = prefix .. ':queue:' .. user
+local was_idle = redis.call('LLEN', queue) == 0
+for i = 4, #ARGV do
+    redis.call('RPUSH', queue, ARGV[i])
+end
+redis.call('HSET', 'scheduler:weights', user, ARGV[3])
+if was_idle and redis.call('SISMEMBER', prefix .. ':capped', user) == 0 then
+    local vtime = tonumber(redis.call('GET', prefix .. ':vtime') or '0')
+    local finish = tonumber(redis.call('HGET', prefix .. ':finish', user) or '0')
+    redis.call('ZADD', prefix .. ':ready', math.max(vtime, finish), user)
+end
+return redis.call('LLEN', queue)
+"""
+
+# ARGV: lane, now, lease seconds, lane capacity, per-user cap, max tasks
+DISPATCH_SCRIPT = """
+local prefix = 'scheduler:' .. ARGV[1]
+local now, lease = tonumber(ARGV[2]), tonumber(ARGV[3])
+local capacity, user_cap, limit = tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6])
+local ready, capped, running = prefix .. ':ready', prefix .. ':capped', prefix .. ':running'
+
+local function user_running(user)
+    local key = 'scheduler:user:' .. user .. ':running'
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+    return redis.call('ZCARD', key)
+end
+
+local function tag(user)
+    local vtime = tonumber(redis.call('GET', prefix .. ':vtime') or '0')
+    local finish = tonumber(redis.call('HGET', prefix .. ':finish', user) or '0')
+    return math.max(vtime, finish)
+end
+
+-- Capped users whose running tasks have since finished or expired
+for _, user in ipairs(redis.call('SMEMBERS', capped)) do
+    if user_running(user) < user_cap then
+        redis.call('SREM', capped, user)
+        redis.call('ZADD', ready, tag(user), user)
+    end
+end
+
+redis.call('ZREMRANGEBYSCORE', running, '-inf', now)
+local free = capacity - redis.call('ZCARD', running)
+local dispatched = {}
+while free > 0 and #dispatched < 2 * limit do
+    local head = redis.call('ZRANGE', ready, 0, 0, 'WITHSCORES')
+    if #head == 0 then
+        break
+    end
+    local user, start = head[1], tonumber(head[2])
+    local queue = prefix .. ':queue:' .. user
+    if user_running(user) >= user_cap then
+        redis.call('ZREM', ready, user)
+        redis.call('SADD', capped, user)
+    else
+        local task = redis.call('LPOP', queue)
+        local weight = tonumber(redis.call('HGET', 'scheduler:weights', user) or '1')
+        local finish = start + 1 / weight
+        if task then
+            redis.call('ZADD', running, now + lease, task)
+            redis.call('ZADD', 'scheduler:user:' .. user .. ':running', now + lease, task)
+            redis.call('SET', prefix .. ':vtime', tostring(start))
+            redis.call('HSET', prefix .. ':finish', user, tostring(finish))
+            dispatched[#dispatched + 1] = task
+            dispatched[#dispatched + 1] = user
+            free = free - 1
+        end
+        if redis.call('LLEN', queue) > 0 then
+            redis.call('ZADD', ready, finish, user)
+        else
+            redis.call('ZREM', ready, user)
+        end
+    end
+end
+-- Flat task, user pairs
+return dispatched
+"""
+
+# ARGV: lane, user, task ids... (in queue order)
+REQUEUE_SCRIPT = """
+local prefix = 'scheduler:' .. ARGV[1]
+local user = ARGV[2]
+local queue = prefix .. ':queue:' .. user
+for i = #ARGV, 3, -1 do
+    redis.call('ZREM', prefix .. ':running', ARGV[i])
+    redis.call('ZREM', 'scheduler:user:' .. user .. ':running', ARGV[i])
+    redis.call('LPUSH', queue, ARGV[i])
+end
+if redis.call('SISMEMBER', prefix .. ':capped', user) == 0 then
+    local vtime = tonumber(redis.call('GET', prefix .. ':vtime') or '0')
+    local finish = tonumber(redis.call('HGET', prefix .. ':finish', user) or '0')
+    redis.call('ZADD', prefix .. ':ready', 'NX', math.max(vtime, finish), user)
+end
+return redis.call('LLEN', queue)
+"""
+
+# ARGV: user, task id, lanes...
+RELEASE_SCRIPT = """
+redis.call('ZREM', 'scheduler:user:' .. ARGV[1] .. ':running', ARGV[2])
+for i = 3, #ARGV do
+    redis.call('ZREM', 'scheduler:' .. ARGV[i] .. ':running', ARGV[2])
+end
+return 1
+"""
+
+class TaskScheduler:
+    """Per-user, per-lane task queues in Redis with weighted fair dispatch."""
+
+    def __init__(
+        self,
+        lane_capacity: Dict[str, int],
+        user_concurrency: int,
+        lease_seconds: int,
+        weights: Optional[Dict[int, float]] = None,
+        client: Optional[redis.Redis] = None
+    ):
+        self.lane_capacity = lane_capacity
+        self.user_concurrency = user_concurrency
+        self.lease_seconds = lease_seconds
+        self.weights = weights or {}
+        self._redis = client or get_redis()
+        self._submit = self._redis.register_script(SUBMIT_SCRIPT)
+        self._dispatch = self._redis.register_script(DISPATCH_SCRIPT)
+        self._release = self._redis.register_script(RELEASE_SCRIPT)
+        self._requeue = self._redis.register_script(REQUEUE_SCRIPT)
+
+    def submit(self, user_id: int, lane: str, task_ids: Iterable[int]) -> int:
+        """Queue tasks behind the user's earlier ones; returns the user's queue length."""
+        weight = self.weights.get(user_id, 1.0)
+        return self._submit(args=[lane, user_id, weight, *task_ids])
+
+    def dispatch(self, now: Optional[float] = None, limit: int = 100) -> List[Tuple[int, str, int]]:
+        """
+        Take the tasks that should start now, as (task id, lane, user id).
+
+        Each returned task is out of its queue and holds a running slot
+        until ``release`` or its lease runs out, so the caller must hand it
+        to a worker, or give it back with ``requeue``.
+        """
+        now = time.time() if now is None else now
+        dispatched = []
+        for lane in Lane.ALL:
+            picked = self._dispatch(args=[
+                lane,
+                now,
+                self.lease_seconds,
+                self.lane_capacity.get(lane, 0),
+                self.user_concurrency,
+                limit,
+            ])
+            dispatched.extend(
+                (int(task_id), lane, int(user_id)) for task_id, user_id in zip(picked[::2], picked[1::2])
+            )
+        return dispatched
+
+    def requeue(self, dispatched: Iterable[Tuple[int, str, int]]) -> None:
+        """
+        Give back dispatched tasks that never reached a worker.
+
+        They return to the front of their user's queue, in order, and
+        their running slots are freed. The user's virtual finish time is
+        not wound back, so they lose a little of their share.
+        """
+        groups: Dict[Tuple[str, int], List[int]] = {}
+        for task_id, lane, user_id in dispatched:
+            groups.setdefault((lane, user_id), []).append(task_id)
+        for (lane, user_id), task_ids in groups.items():
+            self._requeue(args=[lane, user_id, *task_ids])
+
+    def release(self, user_id: int, task_id: int) -> None:
+        """Free the running slot of a finished task."""
+        self._release(args=[user_id, task_id, *Lane.ALL])
+
+    def depth(self, lane: str) -> Dict[str, int]:
+        """Queued and running task counts of a lane."""
+        prefix = f"scheduler:{lane}"
+        users = self._redis.zrange(f"{prefix}:ready", 0, -1) + list(self._redis.smembers(f"{prefix}:capped"))
+        queued = sum(batched(self._redis, (("llen", (f"{prefix}:queue:{user.decode()}",)) for user in users)))
+        return {"queued": queued, "running": self._redis.zcard(f"{prefix}:running")}
+
+scheduler = TaskScheduler(
+    settings.SCHEDULER_LANE_CAPACITY,
+    settings.SCHEDULER_USER_CONCURRENCY,
+    settings.SCHEDULER_LEASE_SECONDS,
+    settings.SCHEDULER_USER_WEIGHTS
+)
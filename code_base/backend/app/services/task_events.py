@@ -0,0 +1,217 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import redis
+import redis.asyncio as aioredis
+from app.core.config import settings
+from app.core.redis import get_async_redis, get_redis
+from app.models.task import Task
+
+logger = logging.getLogger(__name__)
+
+# Each event is appended to the user's stream, which is what Last-Event-ID
+# resume reads from, and published on the user's channel, which is how live
+# events reach the API processes. Doing both in one script keeps the stream
+# order and the published order identical and costs the worker one round
+# trip. The published message is "<stream id> <json>".
+PUBLISH_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'data', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('PUBLISH', KEYS[2], id .. ' ' .. ARGV[3])
+return id
+"""
+
+Event = Tuple[str, str]  # (stream id, JSON payload)
+
+def stream_key(user_id: int) -> str:
+    return f"task-events:{user_id}"
+
+def channel(user_id: int) -> str:
+    return f"task-events:{user_id}:live"
+
+def parse_event_id(event_id: str) -> Tuple[int, int]:
+    """Redis stream ids ("<ms>-<seq>") as comparable tuples."""
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+def task_event(task: Task) -> dict:
+    return {
+        "task_id": task.id,
+        "batch_id": task.batch_id,
+        "status": task.status,
+        "result": task.result,
+        "error_message": task.error_message,
+    }
+
+class TaskEventPublisher:
+    """Worker side: records task state transitions for the owner's streams."""
+
+    def __init__(self, client: redis.Redis):
+        self._redis = client
+        self._script = self._redis.register_script(PUBLISH_SCRIPT)
+
+    def publish(self, task: Task) -> Optional[str]:
+        """
+        Publish the task's current state; returns the event id.
+
+        Events are best effort: a Redis failure is logged and never fails
+        the task, and clients fall back to GET /tasks/{task_id}.
+        """
+        try:
+            event_id = self._script(
+                keys=[stream_key(task.user_id), channel(task.user_id)],
+                args=[
+                    settings.TASK_EVENTS_STREAM_MAXLEN,
+                    settings.TASK_EVENTS_STREAM_TTL,
+                    json.dumps(task_event(task), default=str)
+                ]
+            )
+            return event_id.decode() if isinstance(event_id, bytes) else event_id
+        except (redis.RedisError, OSError) as e:
+            logger.warning(f"Could not publish event for task {task.id}: {e}")
+            return None
+
+class Subscription:
+    def __init__(self, maxsize: int):
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=maxsize)
+        # Set when events may have been missed (slow consumer, lost Redis
+        # connection); the stream then ends so the client reconnects and
+        # catches up from its Last-Event-ID.
+        self.lagging = False
+
+class TaskEventBroker:
+    """
+    API side: fans published events out to the connections in this process.
+
+    Every connection of every user shares one pub/sub connection. A user's
+    channel is subscribed while at least one of their connections is open,
+    so a process only receives events for users connected to it.
+    """
+
+    def __init__(self, client: aioredis.Redis, queue_size: int):
+        self.queue_size = queue_size
+        self._redis = client  # Must decode responses
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = asyncio.Lock()
+        self._closing = False
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int) -> AsyncIterator[Subscription]:
+        subscription = Subscription(self.queue_size)
+        async with self._lock:
+            if self._listener is None or self._listener.done():
+                self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                self._listener = asyncio.create_task(self._listen())
+            subscribers = self._subscribers.setdefault(user_id, set())
+            if not subscribers:
+                await self._pubsub.subscribe(channel(user_id))
+            subscribers.add(subscription)
+        try:
+            yield subscription
+        finally:
+            async with self._lock:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+                    try:
+                        await self._pubsub.unsubscribe(channel(user_id))
+                    except (redis.RedisError, OSError) as e:
+                        logger.warning(f"Could not unsubscribe from {channel(user_id)}: {e}")
+
+    async def close(self) -> None:
+        """Stop the listener and drop the pub/sub connection (app shutdown)."""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            # The listener wakes at least once a second; letting it return
+            # avoids cancelling it halfway through reading a reply
+            self._closing = True
+            await listener
+            self._closing = False
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def history(self, user_id: int, last_event_id: str, count: int) -> List[Event]:
+        """Events after ``last_event_id`` still held in the user's stream."""
+        response = await self._redis.xread({stream_key(user_id): last_event_id}, count=count)
+        if not response:
+            return []
+        _, entries = response[0]
+        return [(event_id, fields["data"]) for event_id, fields in entries]
+
+    async def _listen(self) -> None:
+        while not self._closing:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self._pubsub.get_message(timeout=1.0)
+            except (redis.RedisError, OSError) as e:
+                # The pub/sub connection resubscribes when it reconnects, but
+                # anything published meanwhile was lost
+                logger.warning(f"Task event listener lost Redis: {e}")
+                self._mark_all_lagging()
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            self.dispatch(message["channel"], message["data"])
+
+    def dispatch(self, channel_name: str, message: str) -> None:
+        user_id = int(channel_name.split(":")[1])
+        event_id, _, data = message.partition(" ")
+        for subscription in self._subscribers.get(user_id, ()):
+            try:
+                subscription.queue.put_nowait((event_id, data))
+            except asyncio.QueueFull:
+                subscription.lagging = True
+
+    def _mark_all_lagging(self) -> None:
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                subscription.lagging = True
+
+def format_event(event_id: str, data: str) -> str:
+    return f"id: {event_id}\nevent: task\ndata: {data}\n\n"
+
+async def event_stream(
+    broker: TaskEventBroker,
+    user_id: int,
+    last_event_id: Optional[str],
+    heartbeat: float
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events for all of a user's tasks.
+
+    Subscribes before reading the stream backlog so no event falls between
+    the two; events seen in both are skipped by id. A comment line is sent
+    whenever the connection has been idle for ``heartbeat`` seconds so
+    proxies keep it open and dead clients are noticed.
+    """
+    async with broker.subscribe(user_id) as subscription:
+        yield "retry: 3000\n\n"
+        last_seen = parse_event_id(last_event_id) if last_event_id else (0, 0)
+        if last_event_id:
+            for event_id, data in await broker.history(
+                user_id, last_event_id, settings.TASK_EVENTS_STREAM_MAXLEN
+            ):
+                last_seen = parse_event_id(event_id)
+                yield format_event(event_id, data)
+
+        while not subscription.lagging:
+            try:
+                event_id, data = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if parse_event_id(event_id) <= last_seen:
+                continue
+            last_seen = parse_event_id(event_id)
+            yield format_event(event_id, data)
+
+publisher = TaskEventPublisher(get_redis())
+broker = TaskEventBroker(get_async_redis(decode_responses=True), queue_size=settings.TASK_EVENTS_QUEUE_SIZE)
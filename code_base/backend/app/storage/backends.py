@@ -0,0 +1,287 @@
+"""
+Where stored files live.
+
+A ``StorageBackend`` holds the files of one namespace ("uploads" or
+"processed") under relative keys such as ``ab/cd/abcd....png``. The blob
+stores keep their refcounts in Postgres and their bytes in a backend:
+
+* ``LocalBackend``: a directory, shared by the API and workers through a
+  volume. Signed URLs point at the API's own ``/files`` endpoint.
+* ``S3Backend``: a bucket on S3 or any S3-compatible service (MinIO in
+  development). Signed URLs are S3 presigned URLs, so file bytes go
+  straight between the client and the bucket and never through the API.
+
+Signed URLs let a client upload or download one key until they expire,
+without any other credentials.
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, ContextManager, Dict, Iterator, Optional, Union
+from urllib.parse import quote, urlencode
+import hashlib
+import hmac
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from app.core.config import settings
+
+@dataclass(frozen=True)
+class SignedUpload:
+    """How a client sends one file straight to storage."""
+    url: str
+    method: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    expires_at: int = 0  # Unix time
+
+class StorageBackend(ABC):
+    """Files of one namespace, addressed by relative key."""
+
+    namespace: str
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def size(self, key: str) -> Optional[int]:
+        """Size in bytes, or None when the key does not exist."""
+        ...
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Readable binary stream of the file; the caller closes it."""
+        ...
+
+    @abstractmethod
+    def local_path(self, key: str) -> ContextManager[Path]:
+        """A filesystem path holding the file for the duration of the block."""
+        ...
+
+    @abstractmethod
+    def put_file(self, key: str, path: Path) -> None:
+        """Store a local file under ``key``, consuming it."""
+        ...
+
+    @abstractmethod
+    def put_bytes(self, key: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove ``key``; missing keys are ignored."""
+        ...
+
+    @abstractmethod
+    def keys(self) -> Iterator[str]:
+        """Every stored key, in no particular order."""
+        ...
+
+    @abstractmethod
+    def download_url(self, key: str, expires: int, filename: Optional[str] = None) -> str:
+        """URL that serves the file until ``expires`` seconds from now."""
+        ...
+
+    @abstractmethod
+    def upload_url(self, key: str, expires: int, size: int, content_type: str) -> SignedUpload:
+        """Signed request that stores exactly ``size`` bytes under ``key``."""
+        ...
+
+def sign(method: str, namespace: str, key: str, expires_at: int, size: Optional[int] = None) -> str:
+    """HMAC of a local-backend URL's parameters with SECRET_KEY."""
+    message = f"{method}\n{namespace}\n{key}\n{expires_at}\n{'' if size is None else size}"
+    return hmac.new(settings.SECRET_KEY.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+def verify(method: str, namespace: str, key: str, expires_at: int, signature: str, size: Optional[int] = None) -> bool:
+    if expires_at < time.time():
+        return False
+    return hmac.compare_digest(sign(method, namespace, key, expires_at, size), signature)
+
+class LocalBackend(StorageBackend):
+    """Files in a local directory tree."""
+
+    def __init__(self, root: Union[str, Path], namespace: str, base_url: str):
+        self.root = Path(root)
+        self.namespace = namespace
+        self.base_url = base_url.rstrip("/")
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f"Key escapes the storage root: {key}")
+        return path
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).is_file()
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return self.path(key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[Path]:
+        yield self.path(key)
+
+    def put_file(self, key: str, path: Path) -> None:
+        destination = self.path(key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Staging paths are under the root, so this is a rename
+        os.replace(path, destination)
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        destination = self.path(key)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=destination.parent, prefix=".put-")
+        with os.fdopen(fd, "wb") as file_object:
+            file_object.write(data)
+        os.replace(tmp_path, destination)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self) -> Iterator[str]:
+        for directory, subdirectories, files in os.walk(self.root):
+            # Staging and lock directories
+            subdirectories[:] = [name for name in subdirectories if not name.startswith(".")]
+            relative = Path(directory).relative_to(self.root)
+            for name in files:
+                if not name.startswith("."):
+                    yield (relative / name).as_posix()
+
+    def _url(self, method: str, key: str, expires: int, size: Optional[int] = None, **params) -> str:
+        expires_at = int(time.time()) + expires
+        query = {"expires": expires_at, **params}
+        if size is not None:
+            query["size"] = size
+        query["signature"] = sign(method, self.namespace, key, expires_at, size)
+        return f"{self.base_url}{settings.API_V1_STR}/files/{self.namespace}/{quote(key)}?{urlencode(query)}"
+
+    def download_url(self, key: str, expires: int, filename: Optional[str] = None) -> str:
+        return self._url("GET", key, expires, **({"filename": filename} if filename else {}))
+
+    def upload_url(self, key: str, expires: int, size: int, content_type: str) -> SignedUpload:
+        return SignedUpload(
+            url=self._url("PUT", key, expires, size),
+            method="PUT",
+            headers={"Content-Type": content_type},
+            expires_at=int(time.time()) + expires
+        )
+
+class S3Backend(StorageBackend):
+    """Files in an S3 bucket, under ``<namespace>/`` keys."""
+
+    def __init__(self, bucket: str, namespace: str, client=None, staging_dir: Optional[Path] = None):
+        if client is None:
+            # Only needed with STORAGE_BACKEND=s3
+            import boto3
+            from botocore.config import Config
+
+            client = boto3.client(
+                "s3",
+                endpoint_url=settings.S3_ENDPOINT_URL,
+                region_name=settings.S3_REGION,
+                aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+                aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None,
+                config=Config(signature_version="s3v4", s3={"addressing_style": settings.S3_ADDRESSING_STYLE})
+            )
+        self.client = client
+        self.bucket = bucket
+        self.namespace = namespace
+        self.staging_dir = Path(staging_dir or tempfile.gettempdir())
+
+    def object_key(self, key: str) -> str:
+        return f"{self.namespace}/{key}"
+
+    def _head(self, key: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def size(self, key: str) -> Optional[int]:
+        head = self._head(key)
+        return None if head is None else head["ContentLength"]
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"]
+
+    @contextmanager
+    def local_path(self, key: str) -> Iterator[Path]:
+        # Decoders and the image pool need a seekable file, so download it
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        path = self.staging_dir / f"{uuid.uuid4().hex}{Path(key).suffix}"
+        try:
+            with open(path, "wb") as file_object, self.open(key) as body:
+                shutil.copyfileobj(body, file_object, settings.UPLOAD_CHUNK_SIZE)
+            yield path
+        finally:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def put_file(self, key: str, path: Path) -> None:
+        # Multipart for large files, parts uploaded concurrently
+        self.client.upload_file(str(path), self.bucket, self.object_key(key))
+        os.unlink(path)
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=data)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def keys(self) -> Iterator[str]:
+        prefix = self.object_key("")
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(prefix):]
+
+    def download_url(self, key: str, expires: int, filename: Optional[str] = None) -> str:
+        params = {"Bucket": self.bucket, "Key": self.object_key(key)}
+        if filename:
+            params["ResponseContentDisposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires)
+
+    def upload_url(self, key: str, expires: int, size: int, content_type: str) -> SignedUpload:
+        # Content-Length is signed, so the bucket rejects any other size
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.object_key(key),
+                "ContentLength": size,
+                "ContentType": content_type,
+            },
+            ExpiresIn=expires
+        )
+        return SignedUpload(
+            url=url,
+            method="PUT",
+            headers={"Content-Type": content_type},
+            expires_at=int(time.time()) + expires
+        )
+
+def make_backend(namespace: str, root: Path) -> StorageBackend:
+    """The configured backend for a namespace; ``root`` is its local directory."""
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Backend(settings.S3_BUCKET, namespace, staging_dir=root / ".tmp")
+    return LocalBackend(root, namespace, settings.STORAGE_PUBLIC_URL)
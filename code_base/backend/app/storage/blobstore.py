@@ -0,0 +1,226 @@
+from contextlib import contextmanager
+from itertools import islice
+import hashlib
+import logging
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.blob import Blob, BlobDerivative
+from app.storage.backends import StorageBackend, make_backend
+
+logger = logging.getLogger(__name__)
+
+# Keys of the sharded layout; anything else in a backend (incoming
+# uploads, staging) is not the store's to collect
+BLOB_KEY = re.compile(r"[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.\w+)?")
+
+class BlobStore:
+    """
+    Content-addressed file store keyed by SHA-256.
+
+    Files live under a two-level sharded layout (``ab/cd/abcd...``) so no
+    directory grows unbounded. Every stored file has a row in ``blobs`` with
+    a reference count; the file is removed when the last reference goes away.
+    Refcount changes take a row lock, so a concurrent ``add`` and ``release``
+    of the same digest are serialized by the database.
+
+    ``add`` writes the file before the caller commits, so a transaction
+    that rolls back afterwards leaves a file with no row. ``collect``
+    deletes those, and files whose refcount has dropped to zero.
+
+    File bytes live in ``backend``; ``root`` is the local directory used
+    for staging (and, with the local backend, the files themselves).
+    """
+
+    def __init__(self, root: Union[str, Path], namespace: str, backend: Optional[StorageBackend] = None):
+        self.root = Path(root)
+        self.namespace = namespace
+        self.backend = backend or make_backend(namespace, self.root)
+
+    @staticmethod
+    def relative_path(digest: str, suffix: str = "") -> str:
+        """Sharded path of a digest relative to the store root."""
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+    @contextmanager
+    def local_path(self, relative_path: str) -> Iterator[Path]:
+        """A local path of a stored file, downloaded first when the backend is remote."""
+        with self.backend.local_path(relative_path) as path:
+            yield path
+
+    def temp_path(self) -> Path:
+        """A fresh staging path on the same filesystem as the store."""
+        staging = self.root / ".tmp"
+        staging.mkdir(parents=True, exist_ok=True)
+        return staging / uuid.uuid4().hex
+
+    def add(self, db: Session, staged_path: Path, digest: str, size: int, suffix: str = "") -> str:
+        """
+        Take a reference on ``digest`` and move a staged file into place.
+
+        If the content is already stored the staged copy is discarded. The
+        reference is only durable once the caller commits ``db``.
+        """
+        relative_path = self.reference(db, digest, size, suffix)
+        self.place(relative_path, staged_path)
+        return relative_path
+
+    def reference(self, db: Session, digest: str, size: int, suffix: str = "") -> str:
+        """
+        The database half of ``add``: take a reference on ``digest``.
+
+        Async callers run this through ``AsyncSession.run_sync`` and then
+        ``place`` in a worker thread, so backend I/O stays off the event loop.
+        """
+        relative_path = self.relative_path(digest, suffix)
+        self._incref(db, digest, relative_path, size)
+        return relative_path
+
+    def place(self, relative_path: str, staged_path: Path) -> None:
+        """The storage half of ``add``: move a staged file into place unless already stored."""
+        if self.backend.exists(relative_path):
+            os.unlink(staged_path)
+        else:
+            self.backend.put_file(relative_path, staged_path)
+
+    def add_bytes(self, db: Session, data: bytes, suffix: str = "") -> Tuple[str, str]:
+        """Store an in-memory payload, returning its digest and relative path."""
+        digest = hashlib.sha256(data).hexdigest()
+        relative_path = self.relative_path(digest, suffix)
+        self._incref(db, digest, relative_path, len(data))
+        if not self.backend.exists(relative_path):
+            self.backend.put_bytes(relative_path, data)
+        return digest, relative_path
+
+    def retain(self, db: Session, digest: str) -> Optional[str]:
+        """
+        Take another reference on content that is already stored.
+
+        Returns the relative path, or None when the blob is unknown or its
+        file has gone missing.
+        """
+        relative_path = db.execute(
+            select(Blob.path).where(Blob.namespace == self.namespace, Blob.sha256 == digest)
+        ).scalar_one_or_none()
+        if relative_path is None or not self.backend.exists(relative_path):
+            return None
+
+        result = db.execute(
+            update(Blob)
+            .where(Blob.namespace == self.namespace, Blob.sha256 == digest)
+            .values(refcount=Blob.refcount + 1)
+        )
+        return relative_path if result.rowcount else None
+
+    def release(self, db: Session, digest: str) -> None:
+        """Drop a reference, deleting the row and file when none remain."""
+        blob = db.execute(
+            update(Blob)
+            .where(Blob.namespace == self.namespace, Blob.sha256 == digest)
+            .values(refcount=Blob.refcount - 1)
+            .returning(Blob.refcount, Blob.path)
+        ).first()
+        if blob is None or blob.refcount > 0:
+            return
+
+        # Delete while the row lock is held so a concurrent add() waits for us
+        self.backend.delete(blob.path)
+        db.execute(
+            delete(Blob).where(Blob.namespace == self.namespace, Blob.sha256 == digest)
+        )
+
+    def collect(self, db: Session, batch_size: int = 500) -> int:
+        """
+        Delete files no reference holds; returns how many were deleted.
+
+        Digests with a live row are skipped with one query per batch. Each
+        remaining one is reclaimed in its own transaction (see
+        ``_reclaim``), which commits or rolls back ``db``.
+        """
+        deleted = 0
+        keys = (match for match in map(BLOB_KEY.fullmatch, self.backend.keys()) if match)
+        while batch := list(islice(keys, batch_size)):
+            by_digest = {match.group(1): match.group(0) for match in batch}
+            live = set(db.execute(
+                select(Blob.sha256).where(
+                    Blob.namespace == self.namespace,
+                    Blob.sha256.in_(by_digest),
+                    Blob.refcount > 0
+                )
+            ).scalars())
+            db.rollback()
+            for digest, key in by_digest.items():
+                if digest not in live and self._reclaim(db, digest, key):
+                    deleted += 1
+        logger.info(f"Collected {deleted} unreferenced {self.namespace} blobs")
+        return deleted
+
+    def _reclaim(self, db: Session, digest: str, key: str) -> bool:
+        # Hold the digest's row first: a fresh row with no references, or
+        # the existing one if its refcount is zero. An add() that inserted
+        # the row but has not committed makes the insert wait for it, and
+        # adds after this wait for our commit, then re-upload the file.
+        claimed = db.execute(
+            insert(Blob)
+            .values(namespace=self.namespace, sha256=digest, path=key, size=0, refcount=0)
+            .on_conflict_do_nothing(index_elements=[Blob.namespace, Blob.sha256])
+            .returning(Blob.sha256)
+        ).first() or db.execute(
+            select(Blob.sha256)
+            .where(Blob.namespace == self.namespace, Blob.sha256 == digest, Blob.refcount <= 0)
+            .with_for_update()
+        ).first()
+        if claimed is None:
+            db.rollback()
+            return False
+        self.backend.delete(key)
+        db.execute(
+            delete(Blob).where(Blob.namespace == self.namespace, Blob.sha256 == digest)
+        )
+        db.commit()
+        return True
+
+    def _incref(self, db: Session, digest: str, relative_path: str, size: int) -> None:
+        statement = insert(Blob).values(
+            namespace=self.namespace,
+            sha256=digest,
+            path=relative_path,
+            size=size,
+            refcount=1
+        )
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[Blob.namespace, Blob.sha256],
+                set_={"refcount": Blob.refcount + 1}
+            )
+        )
+
+def find_derivative(db: Session, source_digest: str, transform_key: str) -> Optional[str]:
+    """Digest of a previously processed output for (source, transform), if any."""
+    return db.execute(
+        select(BlobDerivative.output_sha256).where(
+            BlobDerivative.source_sha256 == source_digest,
+            BlobDerivative.transform_key == transform_key
+        )
+    ).scalar_one_or_none()
+
+def record_derivative(db: Session, source_digest: str, transform_key: str, output_digest: str) -> None:
+    """Remember that ``transform_key`` applied to the source produced the output."""
+    db.execute(
+        insert(BlobDerivative)
+        .values(
+            source_sha256=source_digest,
+            transform_key=transform_key,
+            output_sha256=output_digest
+        )
+        .on_conflict_do_nothing(constraint="uq_blob_derivative")
+    )
+
+upload_store = BlobStore(settings.UPLOAD_DIR, namespace="uploads")
+processed_store = BlobStore(settings.PROCESSED_DIR, namespace="processed")
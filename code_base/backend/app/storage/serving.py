@@ -0,0 +1,165 @@
+"""
+HTTP responses for stored files.
+
+Store keys are content addressed (``ab/cd/<sha256><suffix>``), so the
+bytes behind a key never change. That makes the digest a strong ETag and
+lets clients cache files for good:
+
+* ``If-None-Match`` with the digest answers 304 without touching the file.
+* A single ``Range`` answers 206 with just those bytes (416 when it lies
+  past the end); ``If-Range`` with a different validator gets the whole
+  file. Multi-range requests get the whole file too.
+* ``Cache-Control`` is ``private, max-age=..., immutable``: private
+  because files are per user.
+
+Bodies leave the process by the cheapest route available:
+``X-Accel-Redirect`` to the reverse proxy when FILES_ACCEL_REDIRECT_PREFIX
+is set (nginx then sends the file itself, with sendfile), else the ASGI
+``zerocopysend`` extension when the server offers it, else chunked reads
+off the event loop.
+"""
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+from urllib.parse import quote
+import mimetypes
+import os
+import anyio
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from app.core.config import settings
+from app.storage.backends import LocalBackend
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) of a single byte-range ``Range`` header.
+
+    None means serve the whole file (no range, a unit other than bytes,
+    several ranges, or a header that does not parse).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    candidates = [candidate.strip().removeprefix("W/") for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+def key_etag(key: str) -> str:
+    """The digest in a content-addressed key, quoted."""
+    return f'"{Path(key).name.split(".")[0]}"'
+
+class FileRangeResponse(Response):
+    """
+    ``length`` bytes of an open file from ``offset``.
+
+    The response owns ``file_object`` and closes it once sent. Holding it
+    open from the existence check on means a file deleted in between
+    (an evicted derivative) is still served whole.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, file_object: BinaryIO, offset: int, length: int, status_code: int, headers: dict, media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.file_object = file_object
+        self.offset = offset
+        self.length = length
+        self.raw_headers = [
+            (name, value) for name, value in self.raw_headers if name != b"content-length"
+        ] + [(b"content-length", str(length).encode())]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        with self.file_object:
+            await self._send(scope, send)
+
+    async def _send(self, scope: Scope, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or not self.length:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": self.file_object.fileno(),
+                "offset": self.offset,
+                "count": self.length,
+                "more_body": False,
+            })
+        else:
+            file_object = anyio.wrap_file(self.file_object)
+            await file_object.seek(self.offset)
+            remaining = self.length
+            while remaining:
+                chunk = await file_object.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break  # Truncated underneath us; the client sees a short body
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def file_response(
+    request: Request,
+    backend: LocalBackend,
+    key: str,
+    filename: Optional[str] = None,
+    etag: Optional[str] = None
+) -> Response:
+    """Serve ``key`` from ``backend`` with caching, conditional and range support."""
+    etag = etag or key_etag(key)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.FILES_CACHE_MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if filename:
+        # Inline so images display; the name is used when saving
+        headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        file_object = open(backend.path(key), "rb")
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="File not found")
+    size = os.fstat(file_object.fileno()).st_size
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    if settings.FILES_ACCEL_REDIRECT_PREFIX:
+        file_object.close()
+        # The proxy handles Range itself and sends the file with sendfile
+        headers["X-Accel-Redirect"] = f"{settings.FILES_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{backend.namespace}/{quote(key)}"
+        return Response(headers=headers, media_type=media_type)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            file_object.close()
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return FileRangeResponse(file_object, 0, size, 200, headers, media_type)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(file_object, start, end - start + 1, 206, headers, media_type)
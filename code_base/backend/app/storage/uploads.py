@@ -0,0 +1,152 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional, Tuple, Union
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.storage.blobstore import upload_store
+from app.transforms.memory import ImageTooLarge, check_pixels
+
+@dataclass(frozen=True)
+class StoredUpload:
+    """Result of streaming an upload to disk."""
+    path: Path
+    size: int
+    sha256: str
+
+class UploadTooLarge(Exception):
+    """Raised when an upload grows past the configured size limit."""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"Upload exceeds maximum size of {max_size} bytes")
+        self.max_size = max_size
+
+def copy_stream(
+    source: BinaryIO,
+    destination: Path,
+    max_size: int,
+    chunk_size: int
+) -> StoredUpload:
+    """
+    Copy a file object to disk in fixed-size chunks.
+
+    The SHA-256 digest is computed while copying and the size limit is
+    enforced per chunk, so an oversized upload is abandoned as soon as it
+    crosses the limit. Data is written to a temporary file in the target
+    directory and renamed into place, so readers never see a partial file.
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=destination.parent, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(max_size)
+                hasher.update(chunk)
+                out.write(chunk)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return StoredUpload(path=destination, size=size, sha256=hasher.hexdigest())
+
+async def save_upload(
+    upload: UploadFile,
+    destination: Union[str, Path],
+    max_size: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> StoredUpload:
+    """
+    Stream an UploadFile to ``destination`` without blocking the event loop.
+
+    The whole copy runs in the threadpool, so the event loop only pays for a
+    single hop regardless of file size and memory use stays at one chunk.
+    """
+    max_size = max_size or settings.MAX_CONTENT_LENGTH
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+
+    # Reject early when the multipart parser already knows the size
+    if upload.size is not None and upload.size > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds maximum upload size of {max_size} bytes"
+        )
+
+    await upload.seek(0)
+    try:
+        return await run_in_threadpool(
+            copy_stream, upload.file, Path(destination), max_size, chunk_size
+        )
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds maximum upload size of {max_size} bytes"
+        )
+
+def inspect_image(path: Path) -> None:
+    """Check an uploaded file's image header; no pixels are decoded."""
+    with Image.open(path) as img:
+        check_pixels(img.size)
+
+async def check_image(stored: StoredUpload) -> None:
+    """
+    Reject uploads that are not images or whose dimensions exceed
+    IMAGE_MAX_PIXELS, deleting the staged file.
+    """
+    try:
+        await run_in_threadpool(inspect_image, stored.path)
+    except (UnidentifiedImageError, ImageTooLarge, Image.DecompressionBombError) as e:
+        os.unlink(stored.path)
+        if isinstance(e, UnidentifiedImageError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Uploaded file is not a supported image"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+
+# Files clients upload with a signed URL land here, outside the
+# content-addressed layout, until a worker ingests them
+INCOMING_PREFIX = "incoming/"
+
+def incoming_key(user_id: int, upload_id: str) -> str:
+    return f"{INCOMING_PREFIX}{user_id}/{upload_id}"
+
+def is_incoming(key: str) -> bool:
+    return key.startswith(INCOMING_PREFIX)
+
+def ingest(db: Session, key: str) -> Tuple[str, str]:
+    """
+    Move a directly uploaded file into the upload store.
+
+    The file is copied to staging while it is hashed, its header checked
+    like any other upload, and a reference taken on its digest. Returns
+    the digest and store path. The incoming object is left for the caller
+    to delete once ``db`` is committed.
+    """
+    with upload_store.backend.open(key) as source:
+        stored = copy_stream(source, upload_store.temp_path(), settings.MAX_CONTENT_LENGTH, settings.UPLOAD_CHUNK_SIZE)
+    try:
+        inspect_image(stored.path)
+    except BaseException:
+        os.unlink(stored.path)
+        raise
+    return stored.sha256, upload_store.add(db, stored.path, stored.sha256, stored.size)
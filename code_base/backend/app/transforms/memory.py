@@ -0,0 +1,69 @@
+"""
+Memory accounting for image processing.
+
+Everything here works from image headers, before any pixels are decoded:
+how many bytes a decoded image occupies, the decompression-bomb guard,
+and measuring the peak RSS a task actually reached.
+"""
+from contextlib import contextmanager
+from typing import Callable, Iterator, Tuple
+import resource
+from PIL import Image
+from app.core.config import settings
+
+# Pillow's own guard raises DecompressionBombError at twice this; ours
+# (check_pixels) rejects at the limit itself
+Image.MAX_IMAGE_PIXELS = settings.IMAGE_MAX_PIXELS
+
+# Bytes per pixel of Pillow's in-memory storage. Three-band and two-band
+# modes are padded to four bytes per pixel.
+PIXEL_BYTES = {
+    "1": 1,
+    "L": 1,
+    "P": 1,
+    "I;16": 2,
+    "I;16B": 2,
+    "I;16L": 2,
+}
+DEFAULT_PIXEL_BYTES = 4
+
+Size = Tuple[int, int]
+
+class ImageTooLarge(ValueError):
+    """An image whose dimensions or estimated decode size exceed the limits."""
+
+def image_bytes(mode: str, size: Size) -> int:
+    """Bytes a decoded image of ``mode`` and ``size`` occupies."""
+    return size[0] * size[1] * PIXEL_BYTES.get(mode, DEFAULT_PIXEL_BYTES)
+
+def check_pixels(size: Size) -> None:
+    """Reject decompression bombs from the header dimensions alone."""
+    pixels = size[0] * size[1]
+    if pixels > settings.IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(
+            f"Image has {pixels} pixels; at most {settings.IMAGE_MAX_PIXELS} are allowed"
+        )
+
+def _high_water_mark_kb() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    raise OSError("VmHWM not reported")
+
+@contextmanager
+def peak_rss() -> Iterator[Callable[[], float]]:
+    """
+    Measure the peak RSS of this process over the block, in MB.
+
+    On Linux the kernel's high-water mark is reset on entry (via
+    ``/proc/self/clear_refs``), so the figure covers only the block.
+    Elsewhere it falls back to the lifetime peak from ``getrusage``.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        read = lambda: _high_water_mark_kb() / 1024
+    except OSError:
+        read = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    yield lambda: round(read(), 1)
@@ -0,0 +1,233 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Sequence
+import math
+from PIL import Image, ImageFilter, ImageOps
+
+class InvalidTransformSpec(ValueError):
+    """A transform spec that does not validate against the operation registry."""
+
+RESAMPLE = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+@dataclass(frozen=True)
+class Param:
+    kind: type  # int, float, bool or str
+    required: bool = False
+    default: Any = None
+    choices: Optional[Sequence[Any]] = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+
+    def validate(self, op: str, name: str, value: Any) -> Any:
+        """Return ``value`` coerced to this parameter's type, or raise."""
+        where = f"{op}.{name}"
+        if self.kind is bool:
+            if not isinstance(value, bool):
+                raise InvalidTransformSpec(f"{where} must be true or false")
+        elif self.kind in (int, float):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise InvalidTransformSpec(f"{where} must be a number")
+            if self.kind is int:
+                if not float(value).is_integer():
+                    raise InvalidTransformSpec(f"{where} must be a whole number")
+                value = int(value)
+            else:
+                value = float(value)
+                if not math.isfinite(value):
+                    raise InvalidTransformSpec(f"{where} must be finite")
+            if self.minimum is not None and value < self.minimum:
+                raise InvalidTransformSpec(f"{where} must be at least {self.minimum}")
+            if self.maximum is not None and value > self.maximum:
+                raise InvalidTransformSpec(f"{where} must be at most {self.maximum}")
+        elif self.kind is str:
+            if not isinstance(value, str):
+                raise InvalidTransformSpec(f"{where} must be a string")
+            value = value.lower()
+        if self.choices is not None and value not in self.choices:
+            raise InvalidTransformSpec(f"{where} must be one of: {', '.join(map(str, self.choices))}")
+        return value
+
+@dataclass(frozen=True)
+class Operation:
+    name: str
+    # (image, **params) -> image; None for output options
+    apply: Optional[Callable[..., Image.Image]]
+    params: Dict[str, Param] = field(default_factory=dict)
+    check: Optional[Callable[[Dict[str, Any]], None]] = None  # Cross-parameter validation
+    geometric: bool = False  # Moves pixels or changes the image size
+    output: bool = False  # Encoder setting rather than a pixel step
+
+    def validate(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate raw parameters, filling in defaults."""
+        unknown = set(raw) - set(self.params)
+        if unknown:
+            raise InvalidTransformSpec(f"Unknown {self.name} parameters: {', '.join(sorted(unknown))}")
+        params = {}
+        for name, param in self.params.items():
+            if name in raw:
+                params[name] = param.validate(self.name, name, raw[name])
+            elif param.required:
+                raise InvalidTransformSpec(f"{self.name}.{name} is required")
+            else:
+                params[name] = param.default
+        if self.check:
+            self.check(params)
+        return params
+
+OPERATIONS: Dict[str, Operation] = {}
+
+def register(
+    name: str,
+    params: Optional[Dict[str, Param]] = None,
+    check: Optional[Callable[[Dict[str, Any]], None]] = None,
+    geometric: bool = False
+) -> Callable:
+    """Register an image operation under ``name`` for use in transform specs."""
+    def decorator(fn: Callable[..., Image.Image]) -> Callable[..., Image.Image]:
+        OPERATIONS[name] = Operation(name, fn, params or {}, check, geometric)
+        return fn
+    return decorator
+
+def get_operation(name: str) -> Operation:
+    try:
+        return OPERATIONS[name]
+    except KeyError:
+        raise InvalidTransformSpec(f"Unknown operation: {name}")
+
+def _dimension() -> Param:
+    return Param(int, required=True, minimum=1, maximum=20000)
+
+@register(
+    "resize",
+    {
+        "width": _dimension(),
+        "height": _dimension(),
+        "resample": Param(str, default="bicubic", choices=tuple(RESAMPLE)),
+    },
+    geometric=True
+)
+def resize(
+    img: Image.Image,
+    width: int,
+    height: int,
+    resample: str = "bicubic",
+    box=None,
+    reducing_gap: Optional[float] = None
+) -> Image.Image:
+    # ``box`` and ``reducing_gap`` are set by the optimizer, not by specs
+    return img.resize((width, height), RESAMPLE[resample], box=box, reducing_gap=reducing_gap)
+
+def _check_crop(params: Dict[str, Any]) -> None:
+    if params["right"] <= params["left"] or params["bottom"] <= params["top"]:
+        raise InvalidTransformSpec("crop must have right > left and bottom > top")
+
+@register(
+    "crop",
+    {
+        "left": Param(int, required=True, minimum=0),
+        "top": Param(int, required=True, minimum=0),
+        "right": Param(int, required=True, minimum=1),
+        "bottom": Param(int, required=True, minimum=1),
+    },
+    check=_check_crop,
+    geometric=True
+)
+def crop(img: Image.Image, left: int, top: int, right: int, bottom: int) -> Image.Image:
+    return img.crop((left, top, right, bottom))
+
+@register(
+    "rotate",
+    {
+        "angle": Param(float, required=True),
+        "expand": Param(bool, default=False),
+    },
+    geometric=True
+)
+def rotate(img: Image.Image, angle: float, expand: bool = False) -> Image.Image:
+    # Pillow already uses a lossless transpose for multiples of 90 degrees
+    return img.rotate(angle, expand=expand)
+
+@register(
+    "convert",
+    {"mode": Param(str, required=True, choices=("1", "l", "la", "rgb", "rgba", "cmyk"))}
+)
+def convert(img: Image.Image, mode: str) -> Image.Image:
+    mode = mode.upper()
+    return img if img.mode == mode else img.convert(mode)
+
+@register("grayscale")
+def grayscale(img: Image.Image) -> Image.Image:
+    return convert(img, "l")
+
+@register(
+    "sharpen",
+    {
+        "radius": Param(float, default=2.0, minimum=0, maximum=100),
+        "percent": Param(int, default=150, minimum=0, maximum=1000),
+        "threshold": Param(int, default=3, minimum=0, maximum=255),
+    }
+)
+def sharpen(img: Image.Image, radius: float = 2.0, percent: int = 150, threshold: int = 3) -> Image.Image:
+    if img.mode not in ("L", "RGB", "RGBA", "CMYK"):
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+    return img.filter(ImageFilter.UnsharpMask(radius, percent, threshold))
+
+@register(
+    "flip",
+    {"direction": Param(str, required=True, choices=("horizontal", "vertical"))},
+    geometric=True
+)
+def flip(img: Image.Image, direction: str) -> Image.Image:
+    if direction == "horizontal":
+        return img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    return img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+
+@register("normalize")
+def normalize(img: Image.Image) -> Image.Image:
+    """Stretch each color channel to the full 0-255 range; alpha is kept."""
+    if img.mode in ("L", "RGB"):
+        return ImageOps.autocontrast(img)
+    alpha = img.getchannel("A") if "A" in img.getbands() else None
+    img = ImageOps.autocontrast(img.convert("L" if img.getbands()[0] in ("L", "1") else "RGB"))
+    if alpha is not None:
+        img.putalpha(alpha)
+    return img
+
+def thumbnail_size(size, width: int, height: int):
+    """Largest size within (width, height) keeping the aspect ratio; never upscales."""
+    scale = min(width / size[0], height / size[1], 1.0)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+@register(
+    "thumbnail",
+    {
+        "width": _dimension(),
+        "height": _dimension(),
+        "resample": Param(str, default="bicubic", choices=tuple(RESAMPLE)),
+    },
+    geometric=True
+)
+def thumbnail(img: Image.Image, width: int, height: int, resample: str = "bicubic") -> Image.Image:
+    size = thumbnail_size(img.size, width, height)
+    if size == img.size:
+        return img
+    return img.resize(size, RESAMPLE[resample], reducing_gap=2.0)
+
+# Encoder settings go through the same registry and validation as pixel
+# operations but are collected into the spec's output options
+OPERATIONS["format"] = Operation(
+    "format",
+    None,
+    {
+        "format": Param(str, choices=("jpeg", "png", "webp", "tiff", "gif")),
+        "quality": Param(int, minimum=1, maximum=100),
+        "optimize": Param(bool, default=False),
+    },
+    output=True
+)
@@ -0,0 +1,300 @@
+"""
+Multi-process rendering for CPU-bound transforms.
+
+A Celery process renders one image at a time and the GIL keeps Pillow's
+pure-Python glue single-threaded, so large decodes and resizes use one
+core. ``ImagePool`` sends the pixel work to a persistent
+``ProcessPoolExecutor`` instead:
+
+* Ordinary renders run whole in a pool process, which opens the source by
+  path and hands the encoded output back through shared memory.
+* Resizes of very large sources are split into horizontal bands. The
+  decoded pixels go into one shared memory block, each pool process
+  resamples its band straight into a shared output block, and nothing but
+  block names and coordinates is pickled. The bands only run when their
+  estimated peak, shared blocks included, fits the memory budget.
+
+The parent creates every shared memory block and unlinks it in a
+``finally``, so a pool process that dies mid-render leaks nothing.
+
+The pool is created on first use, after Celery has forked its worker
+processes, and uses the forkserver start method so pool processes never
+inherit database connections or broker sockets.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from threading import Lock
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+import logging
+import math
+from PIL import Image
+from app.core.config import settings
+from app.core.timing import timed
+from app.transforms.memory import image_bytes, peak_rss
+from app.transforms.operations import RESAMPLE
+from app.transforms.pipeline import (
+    Box,
+    Size,
+    Step,
+    TransformSpec,
+    encode,
+    estimate_peak,
+    execute,
+    is_luma,
+    prepare,
+    render,
+    resize_bands,
+    strip_bytes
+)
+
+logger = logging.getLogger(__name__)
+
+# Modes stored one byte per band, so raw rows are width * len(mode) bytes
+SHAREABLE_MODES = ("L", "RGB", "RGBA")
+
+# Rows copied into shared memory per tobytes() call
+COPY_CHUNK_BYTES = 16 * 1024 * 1024
+
+def _render_file(
+    source: str,
+    spec: TransformSpec,
+    budget: Optional[int],
+    output: str
+) -> Tuple[str, int, Optional[bytes], Dict[str, Any]]:
+    """
+    Pool side: render a file into the parent's ``output`` block.
+
+    Returns (suffix, size, overflow, stats); output larger than the block
+    comes back pickled as ``overflow`` instead.
+    """
+    stats: Dict[str, Any] = {}
+    with peak_rss() as peak:
+        suffix, data = render(source, spec, budget=budget, stats=stats)
+    stats["peak_rss_mb"] = peak()
+    block = SharedMemory(name=output)
+    try:
+        if len(data) > block.size:
+            return suffix, len(data), data, stats
+        block.buf[:len(data)] = data
+    finally:
+        block.close()
+    return suffix, len(data), None, stats
+
+def _resize_band(
+    source: str,
+    mode: str,
+    size: Size,
+    rows: Tuple[int, int],
+    box: Box,
+    output: str,
+    offset: int,
+    band_size: Size,
+    resample: str
+) -> None:
+    """
+    Pool side: resample one band of a resize into the shared output block.
+
+    Only source ``rows`` (the band's box plus the filter's reach) are
+    copied out of the shared source; ``box`` is relative to them.
+    """
+    source_block = SharedMemory(name=source)
+    output_block = SharedMemory(name=output)
+    try:
+        row_bytes = size[0] * len(mode)
+        view = source_block.buf[rows[0] * row_bytes:rows[1] * row_bytes]
+        try:
+            band = Image.frombytes(mode, (size[0], rows[1] - rows[0]), view)
+        finally:
+            view.release()
+        data = band.resize(band_size, RESAMPLE[resample], box=box).tobytes()
+        output_block.buf[offset:offset + len(data)] = data
+    finally:
+        source_block.close()
+        output_block.close()
+
+def _copy_rows(img: Image.Image, block: SharedMemory) -> None:
+    """Copy raw pixels into ``block`` a chunk of rows at a time, never holding a second full copy."""
+    row_bytes = img.size[0] * len(img.mode)
+    rows = max(1, COPY_CHUNK_BYTES // row_bytes)
+    for top in range(0, img.size[1], rows):
+        bottom = min(top + rows, img.size[1])
+        block.buf[top * row_bytes:bottom * row_bytes] = img.crop((0, top, img.size[0], bottom)).tobytes()
+
+def estimate_tiled_peak(mode: str, size: Size, steps: List[Step], index: int, strip: Optional[int] = None) -> int:
+    """
+    Estimated peak bytes of a banded resize, parent and pool processes together.
+
+    ``estimate_peak`` figures for each phase plus the shared blocks mapped
+    during it: decoding and copying rows into the source block; the bands,
+    which together copy at most the source rows and the output out of
+    shared memory; building the resized image from the output block; and
+    the remaining steps.
+    """
+    band_mode = "L" if index else mode
+    params = steps[index].params
+    target = (params["width"], params["height"])
+    source_block = size[0] * size[1] * len(band_mode)
+    output_block = target[0] * target[1] * len(band_mode)
+    return max(
+        estimate_peak(mode, size, steps[:index]) + source_block,
+        2 * (source_block + output_block),
+        output_block + image_bytes(band_mode, target),
+        estimate_peak(band_mode, target, steps[index + 1:], strip)
+    )
+
+def tiled_resize_index(steps: List[Step]) -> Optional[int]:
+    """Index of a resize that only grayscale conversions precede, if any."""
+    for index, step in enumerate(steps):
+        if step.op == "resize":
+            return index
+        if not is_luma(step):
+            return None
+    return None
+
+class ImagePool:
+    """Renders transform specs on a persistent pool of processes."""
+
+    def __init__(self, processes: int, tile_min_pixels: int, memory_budget: Optional[int] = None):
+        self.processes = processes
+        self.tile_min_pixels = tile_min_pixels
+        self.memory_budget = memory_budget
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                context = get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def render(
+        self,
+        source: Union[str, Path, BinaryIO],
+        spec: TransformSpec,
+        stats: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, bytes]:
+        """
+        Same contract as ``pipeline.render``; inline when the pool is disabled.
+
+        ``stats`` receives the decode figures from ``prepare`` and the peak
+        RSS of whichever process did the pixel work.
+        """
+        stats = {} if stats is None else stats
+        with peak_rss() as peak:
+            result = self._render(source, spec, stats)
+        stats["peak_rss_mb"] = max(peak(), stats.get("peak_rss_mb", 0))
+        return result
+
+    def _render(self, source: Union[str, Path, BinaryIO], spec: TransformSpec, stats: Dict[str, Any]) -> Tuple[str, bytes]:
+        if self.processes <= 0 or not isinstance(source, (str, Path)):
+            return render(source, spec, budget=self.memory_budget, stats=stats)
+        try:
+            # Opened from our own file object: the tiled path closes the
+            # image early, which breaks Image's own close on exit otherwise
+            with open(source, "rb") as file_object, Image.open(file_object) as img:
+                # Room for the encoded output; pages are only allocated as written
+                capacity = image_bytes(img.mode, img.size)
+                if img.size[0] * img.size[1] >= self.tile_min_pixels:
+                    steps = prepare(img, spec.steps, budget=self.memory_budget, stats=stats)
+                    index = tiled_resize_index(steps)
+                    if index is not None and ("L" if index else img.mode) in SHAREABLE_MODES:
+                        peak = estimate_tiled_peak(img.mode, img.size, steps, index, strip_bytes(self.memory_budget))
+                        # Otherwise one process renders it, as prepare checked
+                        if not self.memory_budget or peak <= self.memory_budget:
+                            stats["estimated_mb"] = round(peak / 2 ** 20, 1)
+                            return self._render_tiled(img, steps, index, spec, stats.setdefault("timings", {}))
+
+            output = SharedMemory(create=True, size=max(capacity, 1))
+            try:
+                suffix, size, overflow, pool_stats = self.executor.submit(
+                    _render_file, str(source), spec, self.memory_budget, output.name
+                ).result()
+                stats.update(pool_stats)
+                return suffix, overflow if overflow is not None else bytes(output.buf[:size])
+            finally:
+                output.close()
+                output.unlink()
+        except BrokenProcessPool:
+            # A pool process died (most likely killed for memory); start
+            # a fresh pool for the next task
+            logger.error("Image pool broke; restarting it")
+            self.shutdown()
+            raise
+
+    def _render_tiled(
+        self,
+        img: Image.Image,
+        steps: List[Step],
+        index: int,
+        spec: TransformSpec,
+        timings: Dict[str, float]
+    ) -> Tuple[str, bytes]:
+        source_format = img.format
+        with timed(timings, "decode"):
+            img = execute(img, steps[:index])
+        # Bands resample from full resolution; reducing_gap's integer
+        # pre-shrink would not line up across band boundaries
+        params = steps[index].params
+        box = params.get("box") or (0, 0, *img.size)
+        target = (params["width"], params["height"])
+        bands = min(self.processes, target[1])
+        bpp = len(img.mode)
+
+        blocks: List[SharedMemory] = []
+        try:
+            source_block = SharedMemory(create=True, size=img.size[0] * img.size[1] * bpp)
+            blocks.append(source_block)
+            output_block = SharedMemory(create=True, size=target[0] * target[1] * bpp)
+            blocks.append(output_block)
+            with timed(timings, "decode"):
+                _copy_rows(img, source_block)
+                img.close()  # The bands read from shared memory from here on
+            with timed(timings, "transform"):
+                futures = [
+                    self.executor.submit(
+                        _resize_band,
+                        source_block.name,
+                        img.mode,
+                        img.size,
+                        rows,
+                        (band_box[0], band_box[1] - rows[0], band_box[2], band_box[3] - rows[0]),
+                        output_block.name,
+                        first * target[0] * bpp,
+                        (target[0], last - first),
+                        params["resample"]
+                    )
+                    for (first, last), rows, band_box in resize_bands(box, img.size, target, bands, params["resample"])
+                ]
+                for future in futures:
+                    future.result()
+                view = output_block.buf[:target[0] * target[1] * bpp]
+                try:
+                    resized = Image.frombytes(img.mode, target, view)
+                finally:
+                    view.release()
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+        with timed(timings, "transform"):
+            output = execute(resized, steps[index + 1:], strip_bytes(self.memory_budget))
+        with timed(timings, "encode"):
+            return encode(output, spec.output, source_format)
+
+image_pool = ImagePool(
+    settings.IMAGE_POOL_PROCESSES,
+    settings.IMAGE_POOL_TILE_MIN_PIXELS,
+    settings.IMAGE_MEMORY_BUDGET_MB * 1024 * 1024
+)
@@ -0,0 +1,519 @@
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+import io
+import math
+from pathlib import Path
+from PIL import Image
+from app.core.timing import timed
+from app.transforms.memory import ImageTooLarge, check_pixels, image_bytes
+from app.transforms.operations import (
+    InvalidTransformSpec,
+    OPERATIONS,
+    RESAMPLE,
+    get_operation,
+    thumbnail_size
+)
+
+# Keys of the original flat spec format ({"resize": [w, h], "grayscale":
+# true, "rotate": 90}), in the order they have always been applied
+LEGACY_ORDER = ("resize", "grayscale", "rotate")
+
+MAX_STEPS = 32
+
+# Large downscales first shrink the image by an integer factor (JPEG draft
+# decoding or Image.reduce) and resample only the remaining factor, which
+# is at least this large. Same trade-off as Image.thumbnail.
+REDUCING_GAP = 2.0
+
+# Share of the memory budget one resize band may use for its resampling
+# intermediate when a large resize runs in strips
+STRIP_FRACTION = 8
+
+# Filter support radius in source pixels at 1:1 scale
+FILTER_SUPPORT = {
+    "nearest": 0.5,
+    "box": 0.5,
+    "bilinear": 1.0,
+    "hamming": 1.0,
+    "bicubic": 2.0,
+    "lanczos": 3.0,
+}
+
+Size = Tuple[int, int]
+Box = Tuple[float, float, float, float]
+
+@dataclass
+class Step:
+    op: str
+    params: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class TransformSpec:
+    steps: List[Step]
+    output: Dict[str, Any] = field(default_factory=dict)  # format, quality, optimize
+
+    def canonical(self) -> List[Tuple[str, Any]]:
+        """Steps as (op, params) pairs, with the output options last."""
+        steps = [(step.op, step.params) for step in self.steps]
+        if self.output:
+            steps.append(("format", self.output))
+        return steps
+
+def _legacy_steps(metadata: dict) -> List[dict]:
+    steps = []
+    for name in LEGACY_ORDER:
+        value = metadata.get(name)
+        if not value:
+            continue
+        if name == "resize":
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                raise InvalidTransformSpec("resize must be [width, height]")
+            steps.append({"op": "resize", "width": value[0], "height": value[1]})
+        elif name == "grayscale":
+            steps.append({"op": "grayscale"})
+        elif name == "rotate":
+            steps.append({"op": "rotate", "angle": value})
+    return steps
+
+def parse_spec(metadata: Optional[dict]) -> TransformSpec:
+    """
+    Validate a task's transform spec against the operation registry.
+
+    Specs are either ``{"steps": [{"op": "crop", ...}, ...]}``, applied in
+    order, or the original flat ``{"resize": ..., "grayscale": ...,
+    "rotate": ...}`` form. Defaults are filled in and no-op steps dropped,
+    so equivalent specs parse to the same steps.
+    """
+    metadata = metadata or {}
+    if not isinstance(metadata, dict):
+        raise InvalidTransformSpec("Transform spec must be an object")
+    if "steps" in metadata:
+        unknown = set(metadata) - {"steps"}
+        raw_steps = metadata["steps"]
+        if not isinstance(raw_steps, list):
+            raise InvalidTransformSpec("steps must be a list")
+    else:
+        unknown = set(metadata) - set(LEGACY_ORDER)
+        raw_steps = _legacy_steps(metadata)
+    if unknown:
+        raise InvalidTransformSpec(f"Unknown spec keys: {', '.join(sorted(unknown))}")
+    if len(raw_steps) > MAX_STEPS:
+        raise InvalidTransformSpec(f"A spec may have at most {MAX_STEPS} steps")
+
+    spec = TransformSpec(steps=[])
+    for raw in raw_steps:
+        if not isinstance(raw, dict) or "op" not in raw:
+            raise InvalidTransformSpec("Each step must be an object with an op")
+        raw = dict(raw)
+        operation = get_operation(raw.pop("op"))
+        params = operation.validate(raw)
+        if operation.output:
+            if spec.output:
+                raise InvalidTransformSpec("format may only be given once")
+            spec.output = params
+            continue
+        if operation.name == "rotate":
+            params["angle"] = params["angle"] % 360
+            if not params["angle"]:
+                continue
+        spec.steps.append(Step(operation.name, params))
+    return spec
+
+def is_luma(step: Step) -> bool:
+    return step.op == "grayscale" or (step.op == "convert" and step.params["mode"] == "l")
+
+def output_size(step: Step, size: Optional[Size]) -> Optional[Size]:
+    """Image size after ``step``, or None when it cannot be known up front."""
+    params = step.params
+    if step.op == "resize":
+        return params["width"], params["height"]
+    if size is None:
+        return None
+    if step.op == "crop":
+        return params["right"] - params["left"], params["bottom"] - params["top"]
+    if step.op == "thumbnail":
+        return thumbnail_size(size, params["width"], params["height"])
+    if step.op == "rotate" and params["expand"]:
+        if params["angle"] % 180 == 0:
+            return size
+        if params["angle"] % 90 == 0:
+            return size[1], size[0]
+        return None
+    return size
+
+def _resolve_thumbnails(steps: List[Step], size: Optional[Size]) -> List[Step]:
+    """Turn thumbnails into plain resizes so they can take part in fusion."""
+    resolved = []
+    for step in steps:
+        if step.op == "thumbnail" and size is not None:
+            target = output_size(step, size)
+            if target == size:
+                continue
+            step = Step("resize", {
+                "width": target[0],
+                "height": target[1],
+                "resample": step.params["resample"],
+            })
+        resolved.append(step)
+        size = output_size(step, size)
+    return resolved
+
+def _luma_first(steps: List[Step]) -> List[Step]:
+    """
+    Move grayscale conversions ahead of geometric steps.
+
+    Resampling and the luma transform are both linear, so the order does
+    not change the result beyond rounding, but every geometric step after
+    the conversion touches one channel instead of three or four.
+    """
+    ordered: List[Step] = []
+    for step in steps:
+        position = len(ordered)
+        if is_luma(step):
+            while position and OPERATIONS[ordered[position - 1].op].geometric:
+                position -= 1
+        ordered.insert(position, step)
+    return ordered
+
+def _map_box(outer, size: Size, inner) -> Tuple[float, float, float, float]:
+    """Map ``inner``, in the coordinates of an image of ``size`` resampled from region ``outer``, back into ``outer``'s coordinates."""
+    scale_x = (outer[2] - outer[0]) / size[0]
+    scale_y = (outer[3] - outer[1]) / size[1]
+    return (
+        outer[0] + inner[0] * scale_x,
+        outer[1] + inner[1] * scale_y,
+        outer[0] + inner[2] * scale_x,
+        outer[1] + inner[3] * scale_y,
+    )
+
+def _within(box, size: Optional[Size]) -> bool:
+    return size is not None and box[2] <= size[0] and box[3] <= size[1]
+
+def _fuse_geometry(steps: List[Step], size: Optional[Size]) -> List[Step]:
+    """
+    Collapse runs of crops and resizes into single steps.
+
+    A crop after a resize becomes a resize of the matching source region
+    (``Image.resize(box=...)``), so only the pixels that survive are
+    resampled; a crop followed by a resize becomes the same; consecutive
+    crops compose and consecutive resizes resample the source once.
+    """
+    fused: List[Step] = []
+    inputs: List[Optional[Size]] = []  # Input size of each fused step
+    for step in steps:
+        previous = fused[-1] if fused else None
+        previous_input = inputs[-1] if inputs else None
+        current = output_size(previous, previous_input) if previous else size
+
+        if previous is not None and step.op in ("crop", "resize") and previous.op in ("crop", "resize"):
+            params = step.params
+            if step.op == "crop":
+                inner = (params["left"], params["top"], params["right"], params["bottom"])
+                target = (inner[2] - inner[0], inner[3] - inner[1])
+                resample = previous.params.get("resample")
+            else:
+                inner = (params.get("box") or (0, 0, *current)) if current else None
+                target = (params["width"], params["height"])
+                resample = params["resample"]
+
+            if inner is not None and _within(inner, current):
+                if previous.op == "crop":
+                    pp = previous.params
+                    outer = (pp["left"], pp["top"], pp["right"], pp["bottom"])
+                    region = (outer[0] + inner[0], outer[1] + inner[1], outer[0] + inner[2], outer[1] + inner[3])
+                    if step.op == "crop":
+                        fused[-1] = Step("crop", dict(zip(("left", "top", "right", "bottom"), region)))
+                        continue
+                    # Unlike crop, resize cannot read outside the image
+                    if _within(outer, previous_input):
+                        fused[-1] = Step("resize", {
+                            "width": target[0],
+                            "height": target[1],
+                            "resample": resample,
+                            "box": region,
+                        })
+                        continue
+                else:
+                    outer = previous.params.get("box") or (
+                        (0, 0, *previous_input) if previous_input else None
+                    )
+                    if outer is not None:
+                        fused[-1] = Step("resize", {
+                            "width": target[0],
+                            "height": target[1],
+                            "resample": resample,
+                            "box": _map_box(outer, current, inner),
+                        })
+                        continue
+
+        fused.append(step)
+        inputs.append(current)
+    return fused
+
+def _reduce_large_downscales(steps: List[Step]) -> List[Step]:
+    planned = []
+    for step in steps:
+        if step.op == "resize" and "reducing_gap" not in step.params:
+            step = Step("resize", {**step.params, "reducing_gap": REDUCING_GAP})
+        planned.append(step)
+    return planned
+
+def plan(steps: List[Step], size: Size) -> List[Step]:
+    """
+    Rewrite steps into a cheaper equivalent for a source image of ``size``.
+
+    The output matches running the steps as written up to resampling
+    rounding; fused resizes resample once instead of repeatedly, so are
+    if anything sharper.
+    """
+    steps = _resolve_thumbnails(steps, size)
+    steps = _luma_first(steps)
+    steps = _fuse_geometry(steps, size)
+    return _reduce_large_downscales(steps)
+
+def _first_geometric(steps: List[Step]) -> int:
+    first = 0
+    while first < len(steps) and is_luma(steps[first]):
+        first += 1
+    return first
+
+def draft(img: Image.Image, steps: List[Step], limit: Optional[Size] = None) -> List[Step]:
+    """
+    Let the JPEG decoder do the first downscale and grayscale conversion.
+
+    ``Image.draft`` decodes at 1/2, 1/4 or 1/8 scale straight from the DCT
+    coefficients, so a large photo destined for a small output is never
+    fully decoded. ``limit`` caps the decoded size further, trading
+    resampling quality for memory. Must run before the image is loaded;
+    returns the steps adjusted to the drafted size.
+    """
+    if img.format != "JPEG":
+        return steps
+    first = _first_geometric(steps)
+    mode = "L" if first else None
+
+    if first == len(steps) or steps[first].op != "resize":
+        if mode:
+            img.draft(mode, img.size)
+        return steps
+
+    params = steps[first].params
+    full = img.size
+    box = params.get("box") or (0, 0, *full)
+    scale = min((box[2] - box[0]) / params["width"], (box[3] - box[1]) / params["height"])
+    requested = (
+        math.ceil(full[0] * REDUCING_GAP / scale),
+        math.ceil(full[1] * REDUCING_GAP / scale),
+    )
+    if limit is not None:
+        requested = (min(requested[0], limit[0]), min(requested[1], limit[1]))
+    img.draft(mode, requested)
+    if img.size == full:
+        return steps
+
+    factor_x = img.size[0] / full[0]
+    factor_y = img.size[1] / full[1]
+    drafted_box = (
+        box[0] * factor_x,
+        box[1] * factor_y,
+        min(box[2] * factor_x, img.size[0]),
+        min(box[3] * factor_y, img.size[1]),
+    )
+    steps = list(steps)
+    steps[first] = Step("resize", {**params, "box": drafted_box})
+    return steps
+
+def step_mode(step: Step, mode: str) -> str:
+    """Image mode after ``step``."""
+    if is_luma(step):
+        return "L"
+    if step.op == "convert":
+        return step.params["mode"].upper()
+    return mode
+
+def _resize_rows(step: Step, mode: str, size: Size) -> int:
+    """Bytes of a resize's horizontal pass: target width by source rows."""
+    box = step.params.get("box") or (0, 0, *size)
+    rows = min(math.ceil(box[3] - box[1]), size[1])
+    return image_bytes(mode, (step.params["width"], rows))
+
+def estimate_peak(mode: str, size: Size, steps: List[Step], strip_bytes: Optional[int] = None) -> int:
+    """
+    Estimated peak bytes to decode an image and run ``steps`` over it.
+
+    The decoded source stays resident for the whole render; on top of it
+    each step holds its input and output, and a resize its horizontal
+    pass intermediate, which ``strip_bytes`` bounds when large resizes run
+    in strips.
+    """
+    source = image_bytes(mode, size)
+    peak = source
+    current = 0  # The step's input, once it is no longer the source
+    for step in steps:
+        target = output_size(step, size)
+        if target is None:
+            # Arbitrary-angle rotation with expand: bounded by the diagonal
+            side = math.ceil(math.hypot(*size))
+            target = (side, side)
+        target_mode = step_mode(step, mode)
+        output = image_bytes(target_mode, target)
+        work = 0
+        if step.op == "resize":
+            work = _resize_rows(step, mode, size)
+            if strip_bytes:
+                work = min(work, strip_bytes)
+        peak = max(peak, source + current + work + output)
+        current, size, mode = output, target, target_mode
+    return peak
+
+def strip_bytes(budget: Optional[int]) -> Optional[int]:
+    return budget // STRIP_FRACTION if budget else None
+
+def _budget_limit(img: Image.Image, steps: List[Step], budget: int) -> Optional[Size]:
+    """Decode size of the least JPEG draft reduction that brings the plan within ``budget``."""
+    first = _first_geometric(steps)
+    if img.format != "JPEG" or first == len(steps) or steps[first].op != "resize":
+        return None
+    mode = "L" if first else img.mode
+    for shift in (1, 2, 3):
+        size = (math.ceil(img.size[0] / 2 ** shift), math.ceil(img.size[1] / 2 ** shift))
+        if estimate_peak(mode, size, steps, strip_bytes(budget)) <= budget:
+            return size
+    return size
+
+def prepare(
+    img: Image.Image,
+    steps: List[Step],
+    optimize: bool = True,
+    budget: Optional[int] = None,
+    stats: Optional[Dict[str, Any]] = None
+) -> List[Step]:
+    """
+    Plan ``steps`` for an opened, not yet loaded, image.
+
+    Works from the header alone. Decompression bombs are rejected first.
+    With a memory budget, a JPEG whose plan would not fit is drafted down
+    to a smaller decode that does (a quality downgrade: fewer source pixels
+    feed the first resize), and anything still over budget is rejected
+    with ``ImageTooLarge`` before a single pixel is decoded. Decode figures
+    and the estimate are recorded in ``stats`` when given.
+    """
+    check_pixels(img.size)
+    source_size = img.size
+    limit = None
+    if optimize:
+        steps = plan(steps, source_size)
+        # JPEGs whose plan starts with a grayscale conversion decode as L
+        decode_mode = "L" if img.format == "JPEG" and _first_geometric(steps) else img.mode
+        if budget and estimate_peak(decode_mode, source_size, steps, strip_bytes(budget)) > budget:
+            limit = _budget_limit(img, steps, budget)
+        steps = draft(img, steps, limit)
+
+    peak = estimate_peak(img.mode, img.size, steps, strip_bytes(budget))
+    if budget and peak > budget:
+        raise ImageTooLarge(
+            f"Processing needs an estimated {peak >> 20} MB; the budget is {budget >> 20} MB"
+        )
+    if stats is not None:
+        stats.update({
+            "source_size": list(source_size),
+            "decoded_size": list(img.size),
+            "estimated_mb": round(peak / 2 ** 20, 1),
+            "budget_draft": limit is not None,
+        })
+    return steps
+
+def resize_bands(box: Box, size: Size, target: Size, bands: int, resample: str) -> Iterator[Tuple[Tuple[int, int], Tuple[int, int], Box]]:
+    """
+    Split a resize into ``bands`` row ranges of the output.
+
+    Yields (output rows, source rows, source box) per band. The source
+    rows extend past the box by the filter's support, so resizing each
+    band's box matches the full resize up to rounding.
+    """
+    scale_y = (box[3] - box[1]) / target[1]
+    margin = math.ceil(FILTER_SUPPORT[resample] * max(scale_y, 1.0)) + 1
+    for band in range(bands):
+        first = target[1] * band // bands
+        last = target[1] * (band + 1) // bands
+        top = box[1] + first * scale_y
+        bottom = box[1] + last * scale_y
+        rows = (max(0, math.floor(top) - margin), min(size[1], math.ceil(bottom) + margin))
+        yield (first, last), rows, (box[0], top, box[2], bottom)
+
+def resize_in_strips(img: Image.Image, params: Dict[str, Any], max_bytes: int) -> Image.Image:
+    """
+    Resize in horizontal bands of the output.
+
+    Pillow resamples horizontally into a (target width x source rows)
+    intermediate first; banding keeps that under ``max_bytes``. Bands
+    resample from full resolution (``reducing_gap``'s integer pre-shrink
+    would not line up across bands) and match a single resize to within
+    one level.
+    """
+    box = params.get("box") or (0, 0, *img.size)
+    target = (params["width"], params["height"])
+    bands = min(target[1], math.ceil(_resize_rows(Step("resize", params), img.mode, img.size) / max_bytes))
+    resized = Image.new(img.mode, target)
+    for (first, last), _, band_box in resize_bands(box, img.size, target, bands, params["resample"]):
+        band = img.resize((target[0], last - first), RESAMPLE[params["resample"]], box=band_box)
+        resized.paste(band, (0, first))
+    return resized
+
+def execute(img: Image.Image, steps: List[Step], strip_bytes: Optional[int] = None) -> Image.Image:
+    for step in steps:
+        if (
+            strip_bytes
+            and step.op == "resize"
+            and img.mode not in ("1", "P")
+            and _resize_rows(step, img.mode, img.size) > strip_bytes
+        ):
+            img = resize_in_strips(img, step.params, strip_bytes)
+            continue
+        img = OPERATIONS[step.op].apply(img, **step.params)
+    return img
+
+FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP", "tiff": "TIFF", "gif": "GIF"}
+
+def output_suffix(image_format: str) -> str:
+    """File extension for an encoded output format."""
+    return {"JPEG": ".jpg", "TIFF": ".tif"}.get(image_format, f".{image_format.lower()}")
+
+def encode(img: Image.Image, output: Dict[str, Any], source_format: Optional[str]) -> Tuple[str, bytes]:
+    """Encode ``img`` per the spec's output options; returns (suffix, data)."""
+    image_format = FORMATS[output["format"]] if output.get("format") else (source_format or "PNG")
+    options = {}
+    if output.get("quality") is not None and image_format in ("JPEG", "WEBP"):
+        options["quality"] = output["quality"]
+    if output.get("optimize"):
+        options["optimize"] = True
+    if image_format == "JPEG" and img.mode not in ("1", "L", "RGB", "CMYK"):
+        img = img.convert("RGB")
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **options)
+    return output_suffix(image_format), buffer.getvalue()
+
+def render(
+    source: Union[str, Path, BinaryIO],
+    spec: TransformSpec,
+    optimize: bool = True,
+    budget: Optional[int] = None,
+    stats: Optional[Dict[str, Any]] = None
+) -> Tuple[str, bytes]:
+    """
+    Decode ``source``, run the spec over it and encode the result.
+
+    ``budget`` is the task's memory budget in bytes; see ``prepare``.
+    ``stats["timings"]`` receives the decode, transform and encode seconds.
+    """
+    timings = None if stats is None else stats.setdefault("timings", {})
+    with Image.open(source) as img:
+        with timed(timings, "decode"):
+            source_format = img.format
+            steps = prepare(img, spec.steps, optimize, budget, stats)
+            img.load()
+        with timed(timings, "transform"):
+            output = execute(img, steps, strip_bytes(budget))
+        with timed(timings, "encode"):
+            return encode(output, spec.output, source_format)
@@ -0,0 +1,106 @@
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from PIL import Image
+from app.transforms.operations import OPERATIONS
+from app.transforms.pipeline import Size, Step
+
+# Modes whose pixels map directly onto uint8 arrays: (H, W) or (H, W, C)
+STACKABLE_MODES = ("L", "RGB", "RGBA")
+
+# ITU-R 601-2 luma in the 16-bit fixed point Pillow uses, so the stacked
+# conversion matches Image.convert("L") exactly
+LUMA_WEIGHTS = np.array([19595, 38470, 7471], dtype=np.uint32)
+
+Kernel = Callable[[np.ndarray, str, dict], Tuple[np.ndarray, str]]
+
+def _luma(stack: np.ndarray, mode: str, params: dict) -> Tuple[np.ndarray, str]:
+    if mode == "L":
+        return stack, mode
+    luma = (stack[..., :3].astype(np.uint32) @ LUMA_WEIGHTS + 0x8000) >> 16
+    return luma.astype(np.uint8), "L"
+
+def _flip(stack: np.ndarray, mode: str, params: dict) -> Tuple[np.ndarray, str]:
+    axis = 2 if params["direction"] == "horizontal" else 1
+    return np.flip(stack, axis=axis), mode
+
+def _rotate(stack: np.ndarray, mode: str, params: dict) -> Tuple[np.ndarray, str]:
+    # Counter-clockwise, like Image.rotate
+    return np.rot90(stack, k=int(params["angle"]) // 90, axes=(1, 2)), mode
+
+def _normalize(stack: np.ndarray, mode: str, params: dict) -> Tuple[np.ndarray, str]:
+    """
+    Per-image, per-channel min/max stretch, as ImageOps.autocontrast does it.
+
+    Works on a channel-planar copy, (N, C, H*W), since reductions and
+    lookups along the innermost axis are several times faster than along
+    strided channels. Each image and channel gets a 256-entry lookup table
+    computed the way Pillow computes it, so the output is identical; the
+    lookups index with the uint8 pixels directly rather than widening the
+    whole stack to intp.
+    """
+    count, channels = stack.shape[0], (1 if mode == "L" else 3)
+    if mode == "L":
+        planar = stack.reshape(count, 1, -1)
+    else:
+        planar = np.ascontiguousarray(np.moveaxis(stack[..., :3].reshape(count, -1, 3), 2, 1))
+    lo = planar.min(axis=2).astype(np.float64)
+    hi = planar.max(axis=2).astype(np.float64)
+    flat = hi <= lo
+    scale = np.where(flat, 1.0, 255.0 / np.where(flat, 1.0, hi - lo))
+    offset = np.where(flat, 0.0, -lo * scale)
+    levels = np.arange(256, dtype=np.float64)
+    luts = np.clip(np.floor(levels * scale[..., None] + offset[..., None]), 0, 255).astype(np.uint8)
+    stretched = np.empty_like(planar)
+    for image in range(count):
+        for channel in range(channels):
+            np.take(luts[image, channel], planar[image, channel], out=stretched[image, channel])
+    if mode == "L":
+        return stretched.reshape(stack.shape), mode
+    color = np.moveaxis(stretched, 1, 2).reshape(*stack.shape[:-1], channels)
+    return np.concatenate([color, stack[..., 3:]], axis=-1), mode
+
+KERNELS: Dict[str, Kernel] = {
+    "grayscale": _luma,
+    "convert": _luma,
+    "flip": _flip,
+    "rotate": _rotate,
+    "normalize": _normalize,
+}
+
+def vectorizable(step: Step, mode: str, size: Size) -> bool:
+    """Whether ``step`` has an exact stacked kernel for images of this mode and size."""
+    if mode not in STACKABLE_MODES or step.op not in KERNELS:
+        return False
+    if step.op == "convert":
+        return step.params["mode"] == "l"
+    if step.op == "rotate":
+        angle = step.params["angle"]
+        return angle == 180 or (angle in (90, 270) and (step.params["expand"] or size[0] == size[1]))
+    return True
+
+def execute_stacked(images: List[Image.Image], steps: List[Step]) -> List[Image.Image]:
+    """
+    Run ``steps`` over images that share a mode and size.
+
+    Runs of steps with a kernel operate on one (N, H, W[, C]) array for the
+    whole group; other steps fall back to the per-image Pillow operation.
+    The images stay the same shape as each other throughout, so the group
+    can be restacked after a fallback step.
+    """
+    mode = images[0].mode
+    stack = None
+    for step in steps:
+        size = (stack.shape[2], stack.shape[1]) if stack is not None else images[0].size
+        if vectorizable(step, mode, size):
+            if stack is None:
+                stack = np.stack([np.asarray(img) for img in images])
+            stack, mode = KERNELS[step.op](stack, mode, step.params)
+            continue
+        if stack is not None:
+            images = [Image.fromarray(np.ascontiguousarray(array)) for array in stack]
+            stack = None
+        images = [OPERATIONS[step.op].apply(img, **step.params) for img in images]
+        mode = images[0].mode
+    if stack is not None:
+        images = [Image.fromarray(np.ascontiguousarray(array)) for array in stack]
+    return images
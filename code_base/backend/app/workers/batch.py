@@ -0,0 +1,226 @@
+"""
+Batch worker for small images.
+
+Tasks created with ``processing_mode = "vectorized"`` never go through
+Celery. This process claims them from the database in bulk, decodes the
+whole batch, groups images that share a transform spec, mode and size,
+and runs each group through ``execute_stacked`` so flips, rotations,
+grayscale and normalization are single NumPy operations over the group.
+Results are written back with one bulk UPDATE per batch.
+
+    python -m app.workers.batch
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import signal
+import time
+from PIL import Image
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.core.metrics import serve as serve_metrics
+from app.db.session import SessionLocal
+from app.models.task import ProcessingMode, Task, TaskStatus
+from app.services.credits import refund_task
+from app.services.task_events import publisher
+from app.storage.blobstore import find_derivative, processed_store, record_derivative, upload_store
+from app.transforms.pipeline import Step, TransformSpec, encode, parse_spec, prepare
+from app.transforms.vectorized import execute_stacked
+from app.workers.cache import result_cache, result_key, transform_key
+from app.workers.metrics import tasks_total
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Item:
+    task: Task
+    spec: Optional[TransformSpec] = None
+    image: Optional[Image.Image] = None
+    steps: Optional[List[Step]] = None  # Planned for this image's size
+    source_format: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+
+def claim(db: Session, limit: int) -> List[Task]:
+    """
+    Claim up to ``limit`` vectorized tasks and mark them processing.
+
+    Tasks left in processing longer than the lease (a batch worker died
+    mid-batch) are claimed again. ``SKIP LOCKED`` lets several batch
+    workers share the queue without claiming the same rows.
+    """
+    expired = datetime.utcnow() - timedelta(seconds=settings.VECTOR_BATCH_LEASE_SECONDS)
+    tasks = db.execute(
+        select(Task)
+        .where(
+            Task.processing_mode == ProcessingMode.VECTORIZED,
+            or_(
+                Task.status == TaskStatus.PENDING,
+                (Task.status == TaskStatus.PROCESSING) & (Task.updated_at < expired)
+            )
+        )
+        .order_by(Task.created_at, Task.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not tasks:
+        db.commit()
+        return []
+
+    now = datetime.utcnow()
+    db.execute(
+        update(Task)
+        .where(Task.id.in_([task.id for task in tasks]))
+        .values(status=TaskStatus.PROCESSING, updated_at=now)
+    )
+    # Detach before committing so the claimed rows stay loaded; from here
+    # on they are plain data and the bulk UPDATE writes the outcome
+    db.expunge_all()
+    db.commit()
+    for task in tasks:
+        task.status = TaskStatus.PROCESSING
+        task.updated_at = now
+    return tasks
+
+def _reuse(db: Session, item: Item) -> bool:
+    """Complete ``item`` from an earlier result for the same content and spec."""
+    if not item.task.content_hash:
+        return False
+    metadata = item.task.task_metadata
+    cached = result_cache.get(result_key(item.task.content_hash, metadata))
+    if cached:
+        tier, (suffix, data) = cached
+        _, processed_path = processed_store.add_bytes(db, data, suffix)
+    else:
+        output_digest = find_derivative(db, item.task.content_hash, transform_key(metadata))
+        processed_path = processed_store.retain(db, output_digest) if output_digest else None
+        tier = "store"
+    if processed_path is None:
+        return False
+    item.result = {"processed_image": processed_path, "cache": tier}
+    return True
+
+def _decode(item: Item) -> None:
+    """Plan the spec for this image and decode it, with the same checks as ``render``."""
+    with upload_store.local_path(item.task.image_path) as source, Image.open(source) as img:
+        item.source_format = img.format
+        item.steps = prepare(img, item.spec.steps, budget=settings.IMAGE_MEMORY_BUDGET_MB * 1024 * 1024)
+        img.load()
+        item.image = img
+
+def _group_key(item: Item) -> Tuple[str, str, Tuple[int, int]]:
+    steps = [(step.op, step.params) for step in item.steps]
+    return json.dumps(steps, sort_keys=True), item.image.mode, item.image.size
+
+def _store(db: Session, item: Item, img: Image.Image) -> None:
+    suffix, data = encode(img, item.spec.output, item.source_format)
+    output_digest, processed_path = processed_store.add_bytes(db, data, suffix)
+    if item.task.content_hash:
+        metadata = item.task.task_metadata
+        record_derivative(db, item.task.content_hash, transform_key(metadata), output_digest)
+        result_cache.set(result_key(item.task.content_hash, metadata), suffix, data)
+    item.result = {"processed_image": processed_path, "cache": None}
+
+def process_batch(db: Session, tasks: List[Task]) -> Dict[str, int]:
+    """Process claimed tasks and write every outcome back in one statement."""
+    items = [Item(task) for task in tasks]
+    pending: List[Item] = []
+    for item in items:
+        try:
+            item.spec = parse_spec(item.task.task_metadata)
+            if _reuse(db, item):
+                continue
+            _decode(item)
+            pending.append(item)
+        except Exception as e:
+            item.error = str(e)
+
+    groups: Dict[Tuple, List[Item]] = defaultdict(list)
+    for item in pending:
+        groups[_group_key(item)].append(item)
+
+    for group in groups.values():
+        try:
+            outputs = execute_stacked([item.image for item in group], group[0].steps)
+        except Exception as e:
+            for item in group:
+                item.error = str(e)
+            continue
+        for item, img in zip(group, outputs):
+            try:
+                _store(db, item, img)
+            except Exception as e:
+                item.error = str(e)
+
+    now = datetime.utcnow()
+    rows = []
+    for item in items:
+        task = item.task
+        if item.error is None:
+            task.status, task.result = TaskStatus.COMPLETED, item.result
+        else:
+            logger.error(f"Error processing task {task.id}: {item.error}")
+            task.status, task.error_message = TaskStatus.FAILED, item.error
+            refund_task(db, task)
+        task.updated_at = now
+        rows.append({
+            "id": task.id,
+            "status": task.status,
+            "result": task.result,
+            "error_message": task.error_message,
+            "updated_at": now,
+        })
+    # ORM bulk UPDATE by primary key: one executemany for the whole batch
+    db.execute(update(Task), rows)
+    db.commit()
+
+    for item in items:
+        publisher.publish(item.task)
+        cache_tier = item.result.get("cache") if item.result else None
+        tasks_total.labels(item.task.status, cache_tier or "none").inc()
+    completed = sum(1 for item in items if item.error is None)
+    return {"completed": completed, "failed": len(items) - completed, "groups": len(groups)}
+
+def run() -> None:
+    """Claim and process batches until SIGTERM or SIGINT."""
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        logger.info("Batch worker stopping after the current batch")
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Batch worker started, batch size {settings.VECTOR_BATCH_SIZE}")
+    while not stopping:
+        db = SessionLocal()
+        try:
+            tasks = claim(db, settings.VECTOR_BATCH_SIZE)
+            if tasks:
+                start = time.perf_counter()
+                stats = process_batch(db, tasks)
+                elapsed = time.perf_counter() - start
+                logger.info(
+                    f"Processed batch of {len(tasks)} in {elapsed:.2f}s "
+                    f"({len(tasks) / elapsed:.0f} images/s): {stats}"
+                )
+        except Exception as e:
+            logger.error(f"Batch failed: {e}")
+            db.rollback()
+            tasks = []
+        finally:
+            db.close()
+        if not tasks and not stopping:
+            time.sleep(settings.VECTOR_BATCH_POLL_INTERVAL)
+
+if __name__ == "__main__":
+    setup_logging()
+    serve_metrics(settings.WORKER_METRICS_PORT)
+    run()
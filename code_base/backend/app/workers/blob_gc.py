@@ -0,0 +1,55 @@
+"""
+Periodic collection of unreferenced blobs.
+
+Sweeps the upload and processed stores for files no task references:
+files left behind by transactions that rolled back after storing them,
+and blobs whose refcount dropped to zero (see ``BlobStore.collect``).
+
+    python -m app.workers.blob_gc
+"""
+import logging
+import signal
+import time
+from sqlalchemy.exc import SQLAlchemyError
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.db.session import SessionLocal
+from app.storage.blobstore import processed_store, upload_store
+
+logger = logging.getLogger(__name__)
+
+def sweep() -> int:
+    """One pass over both stores; returns the number of files deleted."""
+    deleted = 0
+    for store in (upload_store, processed_store):
+        db = SessionLocal()
+        try:
+            deleted += store.collect(db)
+        except (SQLAlchemyError, OSError) as e:
+            logger.warning(f"Collecting {store.namespace} blobs failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+    return deleted
+
+def run() -> None:
+    """Sweep every BLOB_GC_INTERVAL seconds until SIGTERM or SIGINT."""
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Blob collector started")
+    while not stopping:
+        sweep()
+        deadline = time.monotonic() + settings.BLOB_GC_INTERVAL
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(1)
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
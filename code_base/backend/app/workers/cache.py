@@ -0,0 +1,175 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import redis
+from prometheus_client import Counter
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.transforms.pipeline import parse_spec
+
+logger = logging.getLogger(__name__)
+
+cache_lookups = Counter(
+    "result_cache_lookups_total",
+    "Result cache lookups by tier and outcome (hit, miss, error)",
+    ["tier", "outcome"]
+)
+
+# Bump when the meaning of a transform changes so stale results are not reused
+TRANSFORM_KEY_VERSION = 2
+
+def canonical_pipeline(metadata: Optional[dict]) -> List[Tuple[str, Any]]:
+    """
+    Normalize a transform spec into the ordered steps that will actually run.
+
+    Steps are validated and normalized by the transform pipeline (defaults
+    filled in, no-op steps dropped), so specs that produce the same output
+    map to the same pipeline while reordered pipelines (which do not
+    commute) stay distinct.
+    """
+    return parse_spec(metadata).canonical()
+
+def transform_key(metadata: Optional[dict]) -> str:
+    """Stable digest of a transform spec, used to look up processed outputs."""
+    canonical = json.dumps(
+        [TRANSFORM_KEY_VERSION, canonical_pipeline(metadata)],
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def result_key(content_hash: str, metadata: Optional[dict]) -> str:
+    """Cache key for the output of a transform spec applied to some content."""
+    return f"{content_hash}:{transform_key(metadata)}"
+
+class LRUByteCache:
+    """Thread-safe LRU cache of byte strings, capped by total payload size."""
+
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_item_bytes or len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._items[key] = value
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+class ResultCache:
+    """
+    Two-tier cache of encoded transform outputs.
+
+    The first tier is an in-process LRU; the optional second tier is Redis,
+    shared by every worker. Values are ``(suffix, data)`` pairs, where the
+    suffix is the output file extension. Redis failures are logged and
+    treated as misses so the cache can never fail a task.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_item_bytes: int,
+        shared: Optional[redis.Redis] = None,
+        redis_ttl: int = 3600
+    ):
+        self.local = LRUByteCache(max_bytes, max_item_bytes)
+        self.shared = shared
+        self.redis_ttl = redis_ttl
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def _pack(suffix: str, data: bytes) -> bytes:
+        return suffix.encode() + b"\n" + data
+
+    @staticmethod
+    def _unpack(value: bytes) -> Tuple[str, bytes]:
+        suffix, data = value.split(b"\n", 1)
+        return suffix.decode(), data
+
+    def get(self, key: str) -> Optional[Tuple[str, Tuple[str, bytes]]]:
+        """Return ``(tier, (suffix, data))`` on a hit, None on a miss."""
+        value = self.local.get(key)
+        cache_lookups.labels("local", "miss" if value is None else "hit").inc()
+        if value is not None:
+            return "local", self._unpack(value)
+
+        if self.shared is None:
+            return None
+        try:
+            value = self.shared.get(f"result-cache:{key}")
+        except redis.RedisError as e:
+            self.redis_errors += 1
+            cache_lookups.labels("redis", "error").inc()
+            logger.warning(f"Result cache Redis lookup failed: {e}")
+            return None
+        if value is None:
+            self.redis_misses += 1
+            cache_lookups.labels("redis", "miss").inc()
+            return None
+
+        self.redis_hits += 1
+        cache_lookups.labels("redis", "hit").inc()
+        self.local.set(key, value)
+        return "redis", self._unpack(value)
+
+    def set(self, key: str, suffix: str, data: bytes) -> None:
+        value = self._pack(suffix, data)
+        self.local.set(key, value)
+
+        if self.shared is None or len(value) > self.local.max_item_bytes:
+            return
+        try:
+            self.shared.set(f"result-cache:{key}", value, ex=self.redis_ttl)
+        except redis.RedisError as e:
+            self.redis_errors += 1
+            logger.warning(f"Result cache Redis store failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "local_hits": self.local.hits,
+            "local_misses": self.local.misses,
+            "local_evictions": self.local.evictions,
+            "local_items": len(self.local),
+            "local_bytes": self.local.current_bytes,
+            "redis_hits": self.redis_hits,
+            "redis_misses": self.redis_misses,
+            "redis_errors": self.redis_errors,
+        }
+
+result_cache = ResultCache(
+    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+    max_item_bytes=settings.RESULT_CACHE_MAX_ITEM_BYTES,
+    shared=get_redis() if settings.RESULT_CACHE_REDIS_ENABLED else None,
+    redis_ttl=settings.RESULT_CACHE_REDIS_TTL
+)
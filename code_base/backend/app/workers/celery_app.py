@@ -1,6 +1,51 @@
+from typing import Any, Dict
 from celery import Celery
 from app.core.config import settings
 
+# Worker profiles, selected by CELERY_WORKER_PROFILE. Task status and
+# output live in Postgres, so the production profile stores no results.
+WORKER_PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {
+        "task_serializer": "json",
+        "accept_content": ["json"],
+        "result_serializer": "json",
+    },
+    "production": {
+        # Ack after the task returns and requeue it if the worker process
+        # dies, so a crash or deploy never loses a task
+        "task_acks_late": True,
+        "task_reject_on_worker_lost": True,
+        # Renders take seconds; a prefetched task would sit behind the
+        # running one while another worker idles
+        "worker_prefetch_multiplier": 1,
+        "task_ignore_result": True,
+        "result_expires": settings.CELERY_RESULT_EXPIRES,
+        # JSON is still accepted so messages queued by an older release
+        # drain after the switch
+        "task_serializer": "msgpack",
+        "accept_content": ["msgpack", "json"],
+        "result_serializer": "msgpack",
+        "task_soft_time_limit": settings.CELERY_TASK_SOFT_TIME_LIMIT,
+        "task_time_limit": settings.CELERY_TASK_TIME_LIMIT,
+        "worker_max_tasks_per_child": settings.CELERY_MAX_TASKS_PER_CHILD,
+        "worker_max_memory_per_child": settings.CELERY_MAX_MEMORY_PER_CHILD_MB * 1024,  # KB
+        # Unacked tasks are redelivered after this long; it must exceed
+        # the hard time limit or long tasks run twice
+        "broker_transport_options": {"visibility_timeout": settings.CELERY_TASK_TIME_LIMIT * 2},
+    },
+}
+
+def configure(app: Celery, profile: str = settings.CELERY_WORKER_PROFILE) -> Celery:
+    """Apply a worker profile to ``app``."""
+    app.conf.update(
+        timezone="UTC",
+        enable_utc=True,
+        # The result backend's own pool, capped like app.core.redis pools
+        redis_max_connections=settings.REDIS_MAX_CONNECTIONS,
+        **WORKER_PROFILES[profile]
+    )
+    return app
+
 celery_app = Celery(
     "worker",
     broker=settings.CELERY_BROKER_URL,
@@ -8,14 +53,4 @@ celery_app = Celery(
     include=["app.workers.tasks"]
 )
 
-celery_app.conf.task_routes = {
-    "app.workers.tasks.*": {"queue": "main-queue"}
-}
-
-celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
-    timezone="UTC",
-    enable_utc=True,
-) 
\ No newline at end of file
+configure(celery_app)
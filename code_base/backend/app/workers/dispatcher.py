@@ -0,0 +1,40 @@
+"""
+Periodic scheduler dispatch.
+
+Tasks are normally dispatched when they are submitted and whenever a task
+finishes. This loop covers the gaps: slots freed by expired leases (a
+worker died mid-task) and submissions whose dispatch failed.
+
+    python -m app.workers.dispatcher
+"""
+import logging
+import signal
+import time
+from app.core.config import settings
+from app.core.logging import setup_logging
+from app.workers.tasks import SCHEDULING_ERRORS, dispatch
+
+logger = logging.getLogger(__name__)
+
+def run() -> None:
+    """Dispatch every SCHEDULER_DISPATCH_INTERVAL seconds until SIGTERM or SIGINT."""
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Scheduler dispatcher started")
+    while not stopping:
+        try:
+            dispatch()
+        except SCHEDULING_ERRORS as e:
+            logger.warning(f"Scheduler dispatch failed: {e}")
+        time.sleep(settings.SCHEDULER_DISPATCH_INTERVAL)
+
+if __name__ == "__main__":
+    setup_logging()
+    run()
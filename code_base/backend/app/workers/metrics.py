@@ -0,0 +1,45 @@
+"""
+Worker metrics.
+
+``process_image`` times each stage of a task (see ``STAGES``) and records
+the timings on the task's result as well as in these histograms. Counters
+here are also updated by the batch worker.
+"""
+from typing import Dict
+from prometheus_client import Counter, Histogram
+from app.transforms.pipeline import TransformSpec
+
+# In the order a task passes through them. "ingest" only runs for files
+# uploaded with a signed URL. "reuse" is the result cache and derivative
+# lookup; tasks it completes skip decode, transform and encode.
+STAGES = ("fetch", "ingest", "reuse", "decode", "transform", "encode", "write", "commit")
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+stage_seconds = Histogram(
+    "worker_task_stage_seconds",
+    "Seconds process_image spends in each stage of a task",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+
+task_seconds = Histogram(
+    "worker_task_duration_seconds",
+    "Seconds from picking a task up to committing its outcome, by transform",
+    ["transform", "status"],
+    buckets=STAGE_BUCKETS
+)
+
+tasks_total = Counter(
+    "worker_tasks_total",
+    "Tasks finished by process_image, by outcome",
+    ["status", "cache"]
+)
+
+def transform_label(spec: TransformSpec) -> str:
+    """The spec's distinct operations (``grayscale+resize``), ignoring order and parameters."""
+    return "+".join(sorted({step.op for step in spec.steps})) or "none"
+
+def observe_stages(timings: Dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        stage_seconds.labels(stage).observe(seconds)
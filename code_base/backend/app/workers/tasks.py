@@ -1,46 +1,209 @@
-from PIL import Image
-import os
+"""
+Celery tasks and worker process hooks.
+
+    celery -A app.workers.celery_app worker -Q interactive,bulk
+"""
+from typing import Dict, List
+import logging
+import redis
+from celery import group
+from celery.signals import setup_logging as setup_celery_logging, worker_init, worker_process_init, worker_process_shutdown
+from celery.worker.control import inspect_command
+from kombu.exceptions import OperationalError
 from app.workers.celery_app import celery_app
 from app.core.config import settings
-from app.db.session import SessionLocal
+from app.core.logging import setup_logging
+from app.core.metrics import process_exited, serve as serve_metrics
+from app.core.timing import timed
+from app.db.session import SessionLocal, engine
 from app.models.task import Task, TaskStatus
+from app.services.credits import refund_task
+from app.services.scheduler import scheduler
+from app.services.task_events import publisher
+from app.storage.blobstore import find_derivative, processed_store, record_derivative, upload_store
+from app.storage.uploads import ingest, is_incoming
+from app.transforms.parallel import image_pool
+from app.transforms.pipeline import parse_spec
+from app.workers.cache import result_cache, result_key, transform_key
+from app.workers.metrics import observe_stages, task_seconds, tasks_total, transform_label
+
+logger = logging.getLogger(__name__)
+
+@setup_celery_logging.connect
+def configure_logging(**kwargs):
+    """Log through the app's handlers instead of Celery's."""
+    setup_logging()
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """Serve the pool processes' metrics from the parent; it outlives them."""
+    serve_metrics(settings.WORKER_METRICS_PORT)
+
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    """Drop connections inherited from the parent; forked children must not share them."""
+    engine.dispose(close=False)
+
+@worker_process_shutdown.connect
+def stop_image_pool(**kwargs):
+    image_pool.shutdown()
+    process_exited()
+
+@inspect_command()
+def result_cache_stats(state):
+    """Hit/miss/eviction counters of this worker's result cache."""
+    return result_cache.stats()
+
+# Redis failures in the scheduler, and broker failures when publishing
+SCHEDULING_ERRORS = (redis.RedisError, OperationalError)
+
+def dispatch() -> None:
+    """Send the tasks the scheduler picked to their lane's Celery queue."""
+    picked = scheduler.dispatch()
+    for index, (task_id, lane, _) in enumerate(picked):
+        try:
+            process_image.apply_async(args=[task_id], queue=lane)
+        except OperationalError:
+            # Hand back what was not sent, or it would be lost with its slot
+            scheduler.requeue(picked[index:])
+            raise
+
+def enqueue(user_id: int, task_ids: List[int], lane: str) -> None:
+    """Queue new tasks for processing, through the fair scheduler when it is enabled."""
+    if settings.SCHEDULER_ENABLED:
+        try:
+            scheduler.submit(user_id, lane, task_ids)
+        except redis.RedisError as e:
+            # Losing fairness beats losing tasks
+            logger.warning(f"Scheduler unavailable, enqueueing {len(task_ids)} tasks directly: {e}")
+        else:
+            try:
+                dispatch()
+            except SCHEDULING_ERRORS as e:
+                # Unsent tasks are back in their queues; the next dispatch picks them up
+                logger.warning(f"Scheduler dispatch failed: {e}")
+            return
+    try:
+        group(process_image.signature((task_id,), queue=lane) for task_id in task_ids).apply_async()
+    except OperationalError as e:
+        # The tasks are committed and paid for; they stay pending until re-sent
+        logger.error(f"Could not enqueue tasks {task_ids}: {e}")
+
+def finish(user_id: int, task_id: int) -> None:
+    """Free the task's scheduler slot and start whatever is next."""
+    if not settings.SCHEDULER_ENABLED:
+        return
+    try:
+        scheduler.release(user_id, task_id)
+        dispatch()
+    except SCHEDULING_ERRORS as e:
+        # The slot's lease runs out on its own
+        logger.warning(f"Scheduler release of task {task_id} failed: {e}")
 
 @celery_app.task(name="process_image")
-def process_image(task_id: int):
+def process_image(task_id: int) -> None:
+    """
+    Render a task's transform spec and store the output.
+
+    Seconds spent per stage (``metrics.STAGES``) are recorded in
+    ``task.result["timings"]`` and the stage histograms. The final commit
+    writes that result, so its own duration only reaches the histograms.
+    """
+    timings: Dict[str, float] = {}
     db = SessionLocal()
+    task = None
+    transform = "unknown"
+    status = None
     try:
-        task = db.query(Task).filter(Task.id == task_id).first()
-        if not task:
-            return {"error": "Task not found"}
+        with timed(timings, "fetch"):
+            task = db.query(Task).filter(Task.id == task_id).first()
+            if not task:
+                logger.error(f"Task {task_id} not found")
+                return
+            if task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+                # Redelivered after it finished but before the late ack
+                logger.info(f"Task {task_id} already {task.status}")
+                return
+            task.status = TaskStatus.PROCESSING
+            db.commit()
+        publisher.publish(task)
 
-        task.status = TaskStatus.PROCESSING
-        db.commit()
+        if task.content_hash is None and is_incoming(task.image_path):
+            # Uploaded with a signed URL: hash, check and store it first
+            with timed(timings, "ingest"):
+                incoming = task.image_path
+                task.content_hash, task.image_path = ingest(db, incoming)
+                db.commit()
+                upload_store.backend.delete(incoming)
 
-        # Process the image
-        input_path = os.path.join(settings.UPLOAD_FOLDER, task.image_path)
-        output_filename = f"processed_{task.image_path}"
-        output_path = os.path.join(settings.UPLOAD_FOLDER, output_filename)
+        metadata = task.task_metadata or {}
+        spec = parse_spec(metadata)
+        transform = transform_label(spec)
+        key = transform_key(metadata)
 
-        try:
-            with Image.open(input_path) as img:
-                # Example processing: Convert to grayscale
-                processed_img = img.convert('L')
-                processed_img.save(output_path)
+        # Reuse an earlier result for the same content and transforms:
+        # first from the result cache, then from the processed blob store.
+        # Credits were debited when the task was created, so a reused
+        # result is billed exactly like a freshly computed one.
+        processed_path = None
+        cache_tier = None
+        render_stats = {}
+        if task.content_hash:
+            with timed(timings, "reuse"):
+                cache_key = result_key(task.content_hash, metadata)
+                cached = result_cache.get(cache_key)
+                if cached:
+                    cache_tier, (suffix, data) = cached
+                    _, processed_path = processed_store.add_bytes(db, data, suffix)
+                else:
+                    output_digest = find_derivative(db, task.content_hash, key)
+                    if output_digest:
+                        processed_path = processed_store.retain(db, output_digest)
+                        cache_tier = "store" if processed_path else None
 
-            task.status = TaskStatus.COMPLETED
-            task.result_path = output_filename
-            db.commit()
+        if processed_path is None:
+            # Decode size, memory estimate, peak RSS and stage timings of the render
+            with upload_store.local_path(task.image_path) as source:
+                suffix, data = image_pool.render(source, spec, render_stats)
+            timings.update(render_stats.pop("timings", {}))
+            with timed(timings, "write"):
+                output_digest, processed_path = processed_store.add_bytes(db, data, suffix)
+                if task.content_hash:
+                    record_derivative(db, task.content_hash, key, output_digest)
+                    result_cache.set(cache_key, suffix, data)
+        else:
+            logger.info(f"Task {task_id} reused processed output from {cache_tier}")
 
-            return {
-                "status": "success",
-                "result_path": output_filename
-            }
+        task.status = TaskStatus.COMPLETED
+        task.result = {
+            "processed_image": processed_path,
+            "cache": cache_tier,
+            "render": render_stats or None,
+            "timings": dict(timings)
+        }
+        with timed(timings, "commit"):
+            db.commit()
+        publisher.publish(task)
+        status = TaskStatus.COMPLETED
+        tasks_total.labels(status, cache_tier or "none").inc()
+        logger.info(f"Task {task_id} completed in {sum(timings.values()):.3f}s: {timings}")
 
-        except Exception as e:
+    except Exception as e:
+        logger.error(f"Error processing task {task_id}: {e}")
+        if task:
+            db.rollback()
             task.status = TaskStatus.FAILED
             task.error_message = str(e)
-            db.commit()
-            return {"error": str(e)}
-
+            refund_task(db, task)
+            with timed(timings, "commit"):
+                db.commit()
+            publisher.publish(task)
+            status = TaskStatus.FAILED
+            tasks_total.labels(status, "none").inc()
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+        observe_stages(timings)
+        if status:
+            task_seconds.labels(transform, status).observe(sum(timings.values()))
+        if task is not None:
+            finish(task.user_id, task_id)
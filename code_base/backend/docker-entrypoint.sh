@@ -0,0 +1,12 @@
+#!/bin/sh
+# Start every container with an empty multiprocess metrics directory:
+# files left by a previous run (or another container) would be summed
+# into this one's metrics.
+set -e
+
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+    find "$PROMETHEUS_MULTIPROC_DIR" -mindepth 1 -delete
+fi
+
+exec "$@"
@@ -0,0 +1,109 @@
+"""
+Microbenchmark of authentication overhead per request.
+
+Times verifying an access token the way each request does, for HS256 and
+RS256 keys:
+
+    jose.decode     - ``jwt.decode`` with the raw key, as get_current_user
+                      used to (before its user lookup, not measured here)
+    uncached        - ``TokenVerifier.decode``: parsed key, no claims cache
+    cached          - ``TokenVerifier.verify`` with the claims cache, with
+                      ``--users`` distinct tokens sent in turn
+    get_current_user - the whole dependency on a cached token, with the
+                      user's token version already cached (needs Redis
+                      for the first lookup of each user)
+
+    python scripts/bench_auth.py --iterations 20000 --users 1000
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+from app.api import deps
+from app.core.tokens import TokenKeys, TokenVerifier
+from bench_common import percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+def report(label: str, samples) -> None:
+    mean = sum(samples) / len(samples)
+    print(
+        f"{label:<24} {mean * 1e6:>10.1f} {percentile(samples, 50) * 1e6:>10.1f} "
+        f"{percentile(samples, 99) * 1e6:>10.1f}"
+    )
+
+def time_calls(fn, tokens, iterations: int):
+    samples = []
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        start = time.perf_counter()
+        fn(token)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def time_dependency(tokens, iterations: int):
+    for token in tokens:  # Warm the token version cache
+        await deps.get_current_user(token)
+    samples = []
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        start = time.perf_counter()
+        await deps.get_current_user(token)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def rsa_keys(directory: Path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    public = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    (directory / "bench.pem").write_bytes(private)
+    return str(directory / "bench.pem"), public.decode()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000, help="distinct tokens in rotation")
+    parser.add_argument("--cache-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        private_file, public_pem = rsa_keys(Path(directory))
+        setups = {
+            "HS256": (TokenKeys("HS256", "bench-secret", "bench"), "bench-secret"),
+            "RS256": (TokenKeys("RS256", "", "bench", private_file), public_pem),
+        }
+        for algorithm, (keys, raw_key) in setups.items():
+            verifier = TokenVerifier(keys, args.cache_size)
+            tokens = [
+                verifier.issue({"sub": f"user{i}@example.com", "uid": i, "credits": 10}, timedelta(hours=1))
+                for i in range(args.users)
+            ]
+            print(f"\n{algorithm}, {args.users} tokens, {args.iterations} verifications, cache size {args.cache_size}")
+            print(f"{'path':<24} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}")
+            report("jose.decode", time_calls(
+                lambda token: jwt.decode(token, raw_key, algorithms=[algorithm]), tokens, args.iterations
+            ))
+            report("uncached", time_calls(verifier.decode, tokens, args.iterations))
+            report("cached", time_calls(verifier.verify, tokens, args.iterations))
+
+            deps.token_verifier = verifier
+            deps.token_versions.check_interval = 3600
+            deps.token_versions.cache_size = args.users
+            report("get_current_user", asyncio.run(time_dependency(tokens, args.iterations)))
@@ -0,0 +1,158 @@
+"""
+Compare Celery worker profiles against a local Redis.
+
+For each profile in ``WORKER_PROFILES``, queues a mixed workload (many
+short tasks with a few long ones among them, like thumbnails next to
+huge resizes) while no worker is running, then starts a prefork worker
+with that profile and times how long it takes to drain the queue.
+
+Tasks sleep instead of rendering, so the numbers isolate Celery's own
+behaviour: prefetching (long tasks hoarding short ones behind them),
+per-message size, result storage and acknowledgement. Each task records
+its finish time in Redis, so nothing depends on the result backend.
+
+Reported per profile:
+
+* makespan and short-task latency p50/p95/p99 (queued to finished)
+* bytes per queued message
+* result keys left in the backend, and Redis memory they use
+* with ``--kill``, tasks lost when a worker process is SIGKILLed mid-run
+
+    python scripts/bench_celery_profiles.py --redis redis://localhost:6379/15 --kill
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import redis
+from celery import Celery
+from app.workers.celery_app import WORKER_PROFILES, configure
+from bench_common import BACKEND_DIR, SCRIPTS_DIR, peak_rss_mb, percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+QUEUE = "bench"
+DONE_KEY = "bench:done"
+REDIS_URL = os.environ.get("BENCH_REDIS_URL", "redis://localhost:6379/15")
+
+# The worker subprocess imports this module with BENCH_PROFILE set
+bench_app = configure(
+    Celery("bench", broker=REDIS_URL, backend=REDIS_URL),
+    os.environ.get("BENCH_PROFILE", "default")
+)
+bench_app.conf.task_default_queue = QUEUE
+
+@bench_app.task(name="bench.work")
+def work(index: int, seconds: float, queued: float) -> int:
+    time.sleep(seconds)
+    redis.Redis.from_url(REDIS_URL).rpush(DONE_KEY, json.dumps([index, seconds, queued, time.time()]))
+    return index
+
+def workload(args) -> list:
+    """(seconds) per task: a long task every ``long_every`` tasks, short otherwise."""
+    return [
+        args.long if index % args.long_every == 0 else args.short
+        for index in range(args.tasks)
+    ]
+
+def worker_children(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as children:
+        return [int(child) for child in children.read().split()]
+
+def run_profile(profile: str, durations: list, args, client: redis.Redis) -> dict:
+    client.flushdb()
+    app = configure(Celery("bench", broker=args.redis, backend=args.redis), profile)
+    app.conf.task_default_queue = QUEUE
+
+    queued = time.time()
+    with app.producer_pool.acquire(block=True) as producer:
+        for index, seconds in enumerate(durations):
+            app.send_task("bench.work", args=[index, seconds, queued], producer=producer)
+    message_bytes = client.memory_usage(QUEUE) / len(durations)
+
+    worker = subprocess.Popen(
+        [
+            sys.executable, "-m", "celery", "-A", "bench_celery_profiles", "worker",
+            "-P", "prefork", "-c", str(args.concurrency), "-Q", QUEUE,
+            "--without-gossip", "--without-mingle", "--without-heartbeat", "-l", "warning",
+        ],
+        env=dict(
+            os.environ,
+            BENCH_PROFILE=profile,
+            BENCH_REDIS_URL=args.redis,
+            PYTHONPATH=f"{SCRIPTS_DIR}{os.pathsep}{BACKEND_DIR}",
+        ),
+        cwd=str(SCRIPTS_DIR),
+    )
+    peak = 0.0
+    killed = False
+    start = progress = time.time()
+    finished = 0
+    try:
+        # A lost task never finishes, so stop once progress stalls
+        while finished < len(durations) and time.time() - progress < args.long * 2 + 5:
+            if client.llen(DONE_KEY) > finished:
+                finished, progress = client.llen(DONE_KEY), time.time()
+            children = worker_children(worker.pid)
+            peak = max([peak] + [peak_rss_mb(child) for child in children])
+            if args.kill and not killed and time.time() - start > args.long and children:
+                os.kill(children[0], signal.SIGKILL)
+                killed = True
+            time.sleep(0.05)
+    finally:
+        worker.send_signal(signal.SIGTERM)
+        worker.wait()
+
+    done = [json.loads(entry) for entry in client.lrange(DONE_KEY, 0, -1)]
+    short = [done_at - queued_at for _, seconds, queued_at, done_at in done if seconds == args.short]
+    result_keys = list(client.scan_iter("celery-task-meta-*"))
+    return {
+        "makespan": max((entry[3] for entry in done), default=start) - start,
+        "short": short,
+        "message_bytes": message_bytes,
+        "result_keys": len(result_keys),
+        "result_kb": sum(client.memory_usage(key) or 0 for key in result_keys) / 1024,
+        "lost": len(durations) - len({entry[0] for entry in done}),
+        "peak_rss_mb": peak,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis", default=REDIS_URL, help="a database the benchmark may flush")
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument("--short", type=float, default=0.02, help="seconds per short task")
+    parser.add_argument("--long", type=float, default=2.0, help="seconds per long task")
+    parser.add_argument("--long-every", type=int, default=25, help="every Nth task is long")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--kill", action="store_true", help="SIGKILL a worker process mid-run")
+    parser.add_argument("--profiles", nargs="+", default=list(WORKER_PROFILES), choices=list(WORKER_PROFILES))
+    args = parser.parse_args()
+
+    client = redis.Redis.from_url(args.redis)
+    client.ping()
+    durations = workload(args)
+    print(
+        f"{args.tasks} tasks ({args.short}s short, {args.long}s every {args.long_every}), "
+        f"concurrency {args.concurrency}{', one worker process killed' if args.kill else ''}"
+    )
+    print(
+        f"{'profile':<12} {'makespan':>9} {'p50':>7} {'p95':>7} {'p99':>7} "
+        f"{'msg B':>6} {'results':>8} {'res KB':>7} {'lost':>5} {'RSS MB':>7}"
+    )
+    for profile in args.profiles:
+        stats = run_profile(profile, durations, args, client)
+        print(
+            f"{profile:<12} {stats['makespan']:>8.2f}s {percentile(stats['short'], 50):>6.2f}s "
+            f"{percentile(stats['short'], 95):>6.2f}s {percentile(stats['short'], 99):>6.2f}s "
+            f"{stats['message_bytes']:>6.0f} {stats['result_keys']:>8} {stats['result_kb']:>7.0f} "
+            f"{stats['lost']:>5} {stats['peak_rss_mb']:>7.0f}"
+        )
+    client.flushdb()
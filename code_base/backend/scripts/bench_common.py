@@ -0,0 +1,64 @@
+"""Helpers shared by the benchmark scripts in this directory."""
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = SCRIPTS_DIR.parent
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def peak_rss_mb(pid: int) -> float:
+    """Peak resident set size of a process in MB (Linux only)."""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def uvicorn_server(app: str, env: Optional[Dict[str, str]] = None) -> Iterator[subprocess.Popen]:
+    """
+    Run ``module:attribute`` from this directory in a uvicorn subprocess.
+
+    Yields the process once the port accepts connections; ``process.base_url``
+    holds the address to send requests to.
+    """
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", app,
+            "--app-dir", str(SCRIPTS_DIR),
+            "--port", str(port), "--log-level", "warning",
+        ],
+        env=dict(os.environ, **(env or {})),
+        cwd=str(BACKEND_DIR),
+    )
+    server.base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,118 @@
+"""
+Concurrency stress test for the credit ledger.
+
+Creates a throwaway user holding ``--credits`` credits, then has
+``--concurrency`` coroutines (each on its own connection) race to debit one
+credit at a time until the balance runs out. Afterwards it checks that no
+credits were lost or double-spent:
+
+    successful debits == starting credits
+    final balance     == 0
+    ledger sum        == -starting credits
+
+and reports debit throughput. ``--mode naive`` runs the old Python-side
+read-modify-write for comparison, which loses updates under concurrency.
+
+Requires the Postgres database configured in ``.env``.
+
+    python scripts/bench_credit_ledger.py --credits 5000 --concurrency 32
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, func, select
+from app.db.session import AsyncSessionLocal
+from app.models.credit_transaction import CreditTransaction
+from app.models.task import Task  # noqa: F401 - resolves the User.tasks relationship
+from app.models.user import User
+from app.services import credits
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def create_user(starting_credits: int) -> int:
+    async with AsyncSessionLocal() as db:
+        user = User(
+            email=f"ledger-bench-{uuid.uuid4().hex}@example.com",
+            hashed_password="!",
+            credits=starting_credits
+        )
+        db.add(user)
+        await db.commit()
+        return user.id
+
+async def delete_user(user_id: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(CreditTransaction).where(CreditTransaction.user_id == user_id))
+        await db.execute(delete(User).where(User.id == user_id))
+        await db.commit()
+
+async def ledger_worker(user_id: int, worker_id: int) -> int:
+    succeeded = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            balance = await credits.debit(db, user_id, 1, f"bench:{worker_id}:{succeeded}")
+            await db.commit()
+            if balance is None:
+                return succeeded
+            succeeded += 1
+
+async def naive_worker(user_id: int, worker_id: int) -> int:
+    succeeded = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            user = await db.get(User, user_id, populate_existing=True)
+            if user.credits < 1:
+                return succeeded
+            user.credits -= 1
+            await db.commit()
+            succeeded += 1
+
+async def run(mode: str, starting_credits: int, concurrency: int) -> None:
+    user_id = await create_user(starting_credits)
+    worker = ledger_worker if mode == "ledger" else naive_worker
+    try:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(worker(user_id, i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        async with AsyncSessionLocal() as db:
+            balance = (await db.execute(select(User.credits).where(User.id == user_id))).scalar_one()
+            ledger_sum = (
+                await db.execute(
+                    select(func.coalesce(func.sum(CreditTransaction.amount), 0))
+                    .where(CreditTransaction.user_id == user_id)
+                )
+            ).scalar_one()
+
+        debits = sum(results)
+        print(f"mode:               {mode}")
+        print(f"concurrency:        {concurrency}")
+        print(f"successful debits:  {debits} (expected {starting_credits})")
+        print(f"final balance:      {balance} (expected 0)")
+        if mode == "ledger":
+            print(f"ledger sum:         {ledger_sum} (expected {-starting_credits})")
+        print(f"throughput:         {debits / elapsed:.1f} debits/s")
+
+        consistent = debits == starting_credits and balance == 0
+        if mode == "ledger":
+            consistent = consistent and ledger_sum == -starting_credits
+        print(f"consistent:         {'yes' if consistent else 'NO - credits lost or double-spent'}")
+    finally:
+        await delete_user(user_id)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credits", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mode", choices=["ledger", "naive"], default="ledger")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.mode, args.credits, args.concurrency))
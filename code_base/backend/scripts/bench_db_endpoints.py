@@ -0,0 +1,104 @@
+"""
+Load test the sync and async database paths of the API.
+
+Starts a throwaway uvicorn server exposing the same lookup through the old
+pattern (synchronous ``SessionLocal`` inside an ``async def`` handler) and
+through ``AsyncSessionLocal``, then reports requests per second and latency
+percentiles for each. ``--query-delay`` adds a server-side ``pg_sleep`` to
+model a slow query; with the sync path a single slow query stalls every
+other request on the worker.
+
+Requires the Postgres database configured in ``.env``.
+
+    python scripts/bench_db_endpoints.py --concurrency 50 --requests 2000 --query-delay 0.01
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI
+from sqlalchemy import text
+from bench_common import percentile, uvicorn_server
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+QUERY = text("SELECT pg_sleep(:delay), count(*) FROM users")
+
+bench_app = FastAPI()
+
+@bench_app.get("/sync")
+async def sync_lookup():
+    from app.db.session import SessionLocal
+
+    db = SessionLocal()
+    try:
+        row = db.execute(QUERY, {"delay": float(os.getenv("BENCH_QUERY_DELAY", "0"))}).first()
+        return {"users": row[1]}
+    finally:
+        db.close()
+
+@bench_app.get("/async")
+async def async_lookup():
+    from app.db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        row = (
+            await db.execute(QUERY, {"delay": float(os.getenv("BENCH_QUERY_DELAY", "0"))})
+        ).first()
+        return {"users": row[1]}
+
+async def run_load(base_url: str, path: str, concurrency: int, requests: int):
+    import httpx
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        async def one_request():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        # Warm up connection pools on both sides
+        await asyncio.gather(*(one_request() for _ in range(concurrency)))
+        latencies.clear()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--query-delay", type=float, default=0.0, help="seconds of pg_sleep per query")
+    parser.add_argument("--paths", nargs="+", default=["sync", "async"])
+    args = parser.parse_args()
+
+    logger.info(
+        f"{args.requests} requests, concurrency {args.concurrency}, query delay {args.query_delay}s"
+    )
+    print(f"{'path':<8} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    env = {"BENCH_QUERY_DELAY": str(args.query_delay)}
+    with uvicorn_server("bench_db_endpoints:bench_app", env=env) as server:
+        for path in args.paths:
+            latencies, elapsed = asyncio.run(
+                run_load(server.base_url, f"/{path}", args.concurrency, args.requests)
+            )
+            print(
+                f"{path:<8} {args.requests / elapsed:>10.1f} {percentile(latencies, 50) * 1000:>10.1f} "
+                f"{percentile(latencies, 95) * 1000:>10.1f} {percentile(latencies, 99) * 1000:>10.1f}"
+            )
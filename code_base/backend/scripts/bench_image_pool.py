@@ -0,0 +1,110 @@
+"""
+Benchmark multi-core rendering through the worker's image pool.
+
+Two measurements per pool size (1, 2, 4 and 8 processes by default):
+
+* tiled: one large image resized in parallel bands; reports seconds per
+  image and the speedup over rendering it inline.
+* throughput: many medium images rendered through the pool by as many
+  concurrent callers as there are processes; reports images per second.
+
+Speedups are bounded by the cores actually available (printed first);
+the decode of a tiled source still happens in the calling process.
+
+    python scripts/bench_image_pool.py --processes 1 2 4 8 --megapixels 48
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+from app.transforms.parallel import ImagePool
+from app.transforms.pipeline import parse_spec, render
+from bench_common import percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+TILED_SPEC = {"steps": [{"op": "resize", "width": 2000, "height": 1500, "resample": "lanczos"}]}
+THROUGHPUT_SPEC = {"steps": [
+    {"op": "resize", "width": 800, "height": 600},
+    {"op": "sharpen"},
+    {"op": "format", "format": "jpeg", "quality": 85},
+]}
+
+def synthetic_image(path: Path, megapixels: float, image_format: str) -> None:
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    noise = Image.effect_noise((width // 8, height // 8), 64).resize((width, height))
+    gradient = Image.linear_gradient("L").resize((width, height))
+    img = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    img.save(path, format=image_format)
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return percentile(samples, 50)
+
+def bench_tiled(source: Path, processes: list, repeat: int) -> None:
+    spec = parse_spec(TILED_SPEC)
+    inline = timed(lambda: render(source, spec), repeat)
+    print(f"\ntiled resize ({source.suffix[1:]}), inline {inline:.2f}s")
+    print(f"{'processes':>9} {'s/image':>9} {'speedup':>8}")
+    for count in processes:
+        pool = ImagePool(count, tile_min_pixels=1)
+        try:
+            pool.render(source, spec)  # Start the pool processes
+            elapsed = timed(lambda: pool.render(source, spec), repeat)
+        finally:
+            pool.shutdown()
+        print(f"{count:>9} {elapsed:>9.2f} {inline / elapsed:>7.2f}x")
+
+def bench_throughput(sources: list, processes: list, repeat: int) -> None:
+    spec = parse_spec(THROUGHPUT_SPEC)
+    print(f"\nthroughput, {len(sources)} images per run")
+    print(f"{'processes':>9} {'img/s':>9} {'speedup':>8}")
+    baseline = None
+    for count in processes:
+        pool = ImagePool(count, tile_min_pixels=10 ** 12)
+        try:
+            with ThreadPoolExecutor(count) as callers:
+                run = lambda: list(callers.map(lambda path: pool.render(path, spec), sources))
+                run()
+                elapsed = timed(run, repeat)
+        finally:
+            pool.shutdown()
+        rate = len(sources) / elapsed
+        baseline = baseline or rate
+        print(f"{count:>9} {rate:>9.1f} {rate / baseline:>7.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--megapixels", type=float, default=48, help="size of the tiled source")
+    parser.add_argument("--images", type=int, default=32, help="images per throughput run")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"cores available: {len(os.sched_getaffinity(0))}")
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        for image_format, suffix in (("PNG", ".png"), ("JPEG", ".jpg")):
+            source = workdir / f"large{suffix}"
+            synthetic_image(source, args.megapixels, image_format)
+            bench_tiled(source, args.processes, args.repeat)
+
+        sources = []
+        for index in range(args.images):
+            path = workdir / f"medium{index}.jpg"
+            synthetic_image(path, 4, "JPEG")
+            sources.append(path)
+        bench_throughput(sources, args.processes, args.repeat)
@@ -0,0 +1,77 @@
+"""
+Measure event-loop latency while a burst of logins is being verified.
+
+A ticker coroutine sleeps for 5ms in a loop and records how late it wakes
+up; that lateness is what every other request on the worker experiences.
+The same burst of bcrypt verifications is run twice:
+
+    inline    - ``verify_password`` called directly in the async handler
+    executor  - ``verify_and_update_password`` on the bounded thread pool
+
+    python scripts/bench_password_hashing.py --logins 50 --rounds 12
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from passlib.context import CryptContext
+from app.core import security
+from bench_common import percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+TICK = 0.005
+
+async def ticker(stop: asyncio.Event, lags: list) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+async def inline_login(password: str, hashed: str) -> None:
+    security.verify_password(password, hashed)
+
+async def executor_login(password: str, hashed: str) -> None:
+    await security.verify_and_update_password(password, hashed)
+
+async def run_burst(login, logins: int, password: str, hashed: str):
+    stop = asyncio.Event()
+    lags = []
+    ticker_task = asyncio.create_task(ticker(stop, lags))
+    await asyncio.sleep(TICK * 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(password, hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker_task
+    return lags, elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    args = parser.parse_args()
+
+    security.pwd_context = CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=args.rounds
+    )
+    security.password_hasher.capacity = max(security.password_hasher.capacity, args.logins)
+    password = "Test123!@#"
+    hashed = security.pwd_context.hash(password)
+
+    print(f"{args.logins} concurrent logins, bcrypt rounds {args.rounds}")
+    print(f"{'mode':<10} {'loop lag p50 ms':>16} {'p99 ms':>10} {'max ms':>10} {'burst s':>10}")
+    for mode, login in (("inline", inline_login), ("executor", executor_login)):
+        lags, elapsed = asyncio.run(run_burst(login, args.logins, password, hashed))
+        lags = lags or [0.0]
+        print(
+            f"{mode:<10} {percentile(lags, 50) * 1000:>16.1f} {percentile(lags, 99) * 1000:>10.1f} "
+            f"{max(lags) * 1000:>10.1f} {elapsed:>10.2f}"
+        )
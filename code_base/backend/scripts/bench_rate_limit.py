@@ -0,0 +1,107 @@
+"""
+Microbenchmark of the rate limiter's per-request overhead.
+
+Measures ``limiter.hit`` latency for the Redis sliding-window path (against
+``REDIS_URL``) and for the in-process token bucket fallback, then the cost
+of the ``rate_limit`` dependency on a full in-process ASGI request compared
+with the same route unprotected. Redis measurements are skipped if Redis is
+unreachable.
+
+    python scripts/bench_rate_limit.py --iterations 20000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import Depends, FastAPI
+from app.core.config import settings
+from app.core.rate_limit import RateLimiter, RateLimitPolicy
+from app.core.redis import get_async_redis
+from bench_common import percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+# Large enough that nothing is rejected while measuring
+POLICY = RateLimitPolicy(limit=10 ** 9, window=60)
+
+def report(label: str, samples) -> None:
+    mean = sum(samples) / len(samples)
+    print(
+        f"{label:<28} {mean * 1e6:>10.1f} {percentile(samples, 50) * 1e6:>10.1f} "
+        f"{percentile(samples, 99) * 1e6:>10.1f}"
+    )
+
+async def time_hits(limiter: RateLimiter, iterations: int):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await limiter.hit("bench", POLICY, f"ip:10.0.{i % 256}.{i % 97}")
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def redis_available(limiter: RateLimiter) -> bool:
+    try:
+        await limiter._redis.ping()
+        return True
+    except Exception:
+        return False
+
+async def time_requests(app: FastAPI, path: str, iterations: int):
+    import httpx
+
+    samples = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            await client.get(path)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+def build_app(limiter: RateLimiter) -> FastAPI:
+    app = FastAPI()
+
+    async def limited():
+        result = await limiter.hit("bench.route", POLICY, "ip:127.0.0.1")
+        assert result.allowed
+
+    @app.get("/plain")
+    async def plain():
+        return {"ok": True}
+
+    @app.get("/limited", dependencies=[Depends(limited)])
+    async def limited_route():
+        return {"ok": True}
+
+    return app
+
+async def main(iterations: int) -> None:
+    print(f"{'measurement':<28} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}")
+
+    local = RateLimiter(get_async_redis("redis://127.0.0.1:1/0"), timeout=0.01, retry_interval=3600)
+    await local.hit("warmup", POLICY, "warmup")  # trips the fallback once
+    report("limiter.hit (local bucket)", await time_hits(local, iterations))
+
+    remote = RateLimiter(get_async_redis(), timeout=1, retry_interval=3600)
+    if await redis_available(remote):
+        report("limiter.hit (redis)", await time_hits(remote, iterations))
+    else:
+        print(f"redis at {settings.REDIS_URL} unreachable, skipping redis measurements")
+        remote = local
+
+    app = build_app(remote)
+    request_iterations = max(1, iterations // 10)
+    report("request without limiter", await time_requests(app, "/plain", request_iterations))
+    report("request with limiter", await time_requests(app, "/limited", request_iterations))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.iterations))
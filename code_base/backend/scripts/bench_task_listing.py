@@ -0,0 +1,192 @@
+"""
+Benchmark task listing queries over a large seeded tasks table.
+
+Seeds ``--tasks`` rows for a throwaway user (plus the same number spread
+over other users, so the user filter has work to do), then times:
+
+    unbounded - the old ``SELECT * ... WHERE user_id = ?`` with no limit
+    offset    - LIMIT/OFFSET paging at increasing depths
+    keyset    - the (created_at, id) cursor used by GET /tasks
+    sparse    - keyset paging selecting only id, status and created_at
+
+and prints the query plan of a deep keyset page so index usage can be
+checked. Run ``alembic upgrade head`` first; ``--drop-indexes`` repeats the
+keyset measurements without the composite indexes for comparison.
+
+Requires the Postgres database configured in ``.env``.
+
+    python scripts/bench_task_listing.py --tasks 100000 --page-size 50
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, select, text, tuple_
+from app.db.session import AsyncSessionLocal
+from app.models.task import Task
+from app.models.user import User
+from bench_common import percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+SEED_SQL = text("""
+    INSERT INTO tasks (user_id, original_filename, status, credits_used, metadata, created_at, updated_at)
+    SELECT
+        :user_id,
+        'seed-' || n || '.png',
+        (ARRAY['pending', 'processing', 'completed', 'failed'])[1 + n % 4],
+        1,
+        '{"grayscale": true}'::json,
+        now() - make_interval(secs => n),
+        now()
+    FROM generate_series(1, :count) AS n
+""")
+
+INDEXES = ("ix_tasks_user_created_id", "ix_tasks_user_status_created_id")
+
+async def create_users(count: int) -> list:
+    async with AsyncSessionLocal() as db:
+        users = [
+            User(email=f"listing-bench-{uuid.uuid4().hex}@example.com", hashed_password="!")
+            for _ in range(count)
+        ]
+        db.add_all(users)
+        await db.commit()
+        return [user.id for user in users]
+
+async def seed(user_ids: list, tasks: int) -> None:
+    async with AsyncSessionLocal() as db:
+        # The benchmark user gets all of ``tasks``; the others share as many
+        per_other = max(1, tasks // max(1, len(user_ids) - 1))
+        for i, user_id in enumerate(user_ids):
+            await db.execute(SEED_SQL, {"user_id": user_id, "count": tasks if i == 0 else per_other})
+        await db.commit()
+        await db.execute(text("ANALYZE tasks"))
+
+async def cleanup(user_ids: list) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Task).where(Task.user_id.in_(user_ids)))
+        await db.execute(delete(User).where(User.id.in_(user_ids)))
+        await db.commit()
+
+async def timed(db, query) -> tuple:
+    start = time.perf_counter()
+    rows = (await db.execute(query)).all()
+    return time.perf_counter() - start, rows
+
+def keyset_query(user_id: int, page_size: int, cursor, columns):
+    query = select(*columns).where(Task.user_id == user_id)
+    if cursor:
+        query = query.where(tuple_(Task.created_at, Task.id) < tuple_(*cursor))
+    return query.order_by(Task.created_at.desc(), Task.id.desc()).limit(page_size)
+
+async def walk_keyset(db, user_id: int, page_size: int, pages: int, columns) -> list:
+    """Time ``pages`` consecutive keyset pages starting from the newest."""
+    samples = []
+    cursor = None
+    for _ in range(pages):
+        elapsed, rows = await timed(db, keyset_query(user_id, page_size, cursor, columns))
+        samples.append(elapsed)
+        if len(rows) < page_size:
+            break
+        cursor = (rows[-1].created_at, rows[-1].id)
+    return samples
+
+async def deep_cursor(db, user_id: int, depth: int):
+    row = (
+        await db.execute(
+            select(Task.created_at, Task.id)
+            .where(Task.user_id == user_id)
+            .order_by(Task.created_at.desc(), Task.id.desc())
+            .offset(depth)
+            .limit(1)
+        )
+    ).one()
+    return row.created_at, row.id
+
+def report(label: str, samples) -> None:
+    print(
+        f"{label:<34} {percentile(samples, 50) * 1000:>10.2f} "
+        f"{percentile(samples, 99) * 1000:>10.2f} {max(samples) * 1000:>10.2f}"
+    )
+
+async def measure(user_id: int, tasks: int, page_size: int, pages: int) -> None:
+    full_row = [Task]
+    sparse = [Task.id, Task.status, Task.created_at]
+    depths = [0, tasks // 10, tasks // 2, max(0, tasks - page_size)]
+
+    async with AsyncSessionLocal() as db:
+        print(f"{'query':<34} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+        elapsed, rows = await timed(db, select(Task).where(Task.user_id == user_id))
+        report(f"unbounded ({len(rows)} rows)", [elapsed])
+
+        for depth in depths:
+            query = (
+                select(Task)
+                .where(Task.user_id == user_id)
+                .order_by(Task.created_at.desc(), Task.id.desc())
+                .offset(depth)
+                .limit(page_size)
+            )
+            report(f"offset page at {depth}", [(await timed(db, query))[0] for _ in range(5)])
+
+        for depth in depths:
+            cursor = await deep_cursor(db, user_id, depth) if depth else None
+            query = keyset_query(user_id, page_size, cursor, full_row)
+            report(f"keyset page at {depth}", [(await timed(db, query))[0] for _ in range(5)])
+
+        report(f"keyset walk ({pages} pages)", await walk_keyset(db, user_id, page_size, pages, full_row))
+        report(f"sparse walk ({pages} pages)", await walk_keyset(db, user_id, page_size, pages, sparse))
+
+        cursor = await deep_cursor(db, user_id, depths[-1])
+        query = keyset_query(user_id, page_size, cursor, full_row)
+        compiled = query.compile(db.get_bind(), compile_kwargs={"literal_binds": True})
+        plan = (await db.execute(text(f"EXPLAIN ANALYZE {compiled}"))).scalars().all()
+        print("\nplan of the deepest keyset page:")
+        print("\n".join(f"  {line}" for line in plan))
+
+async def drop_indexes() -> None:
+    async with AsyncSessionLocal() as db:
+        for name in INDEXES:
+            await db.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        await db.commit()
+
+async def create_indexes() -> None:
+    async with AsyncSessionLocal() as db:
+        for index in Task.__table__.indexes:
+            if index.name in INDEXES:
+                await db.run_sync(lambda session, index=index: index.create(session.connection(), checkfirst=True))
+        await db.commit()
+
+async def main(args) -> None:
+    user_ids = await create_users(args.users)
+    try:
+        print(f"seeding {args.tasks} tasks for the benchmark user...")
+        await seed(user_ids, args.tasks)
+        await measure(user_ids[0], args.tasks, args.page_size, args.pages)
+        if args.drop_indexes:
+            print("\nwithout the composite indexes:")
+            await drop_indexes()
+            try:
+                await measure(user_ids[0], args.tasks, args.page_size, args.pages)
+            finally:
+                await create_indexes()
+    finally:
+        await cleanup(user_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100000, help="tasks seeded for the benchmark user")
+    parser.add_argument("--users", type=int, default=5, help="users seeded, including the benchmark user")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=100, help="pages walked from the newest")
+    parser.add_argument("--drop-indexes", action="store_true")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
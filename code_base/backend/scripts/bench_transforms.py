@@ -0,0 +1,116 @@
+"""
+Benchmark image transforms per megapixel.
+
+For each registered operation, times a representative step over synthetic
+images of several sizes and reports milliseconds per source megapixel.
+Then runs a few multi-step specs end to end (decode, transform, encode)
+as written and through the optimizer, so the effect of fusion, grayscale
+hoisting and JPEG draft decoding is visible.
+
+    python scripts/bench_transforms.py --sizes 1 4 16 --repeat 5
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+from app.transforms.operations import OPERATIONS
+from app.transforms.pipeline import execute, parse_spec, render
+from bench_common import percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+# One representative step per operation, sized relative to the source
+def operation_steps(width: int, height: int) -> dict:
+    return {
+        "resize": {"op": "resize", "width": width // 4, "height": height // 4},
+        "crop": {"op": "crop", "left": width // 4, "top": height // 4, "right": width * 3 // 4, "bottom": height * 3 // 4},
+        "rotate": {"op": "rotate", "angle": 15},
+        "convert": {"op": "convert", "mode": "rgba"},
+        "grayscale": {"op": "grayscale"},
+        "sharpen": {"op": "sharpen"},
+        "thumbnail": {"op": "thumbnail", "width": 256, "height": 256},
+    }
+
+PIPELINES = {
+    "resize + crop + grayscale": {"steps": [
+        {"op": "resize", "width": 1600, "height": 1200},
+        {"op": "crop", "left": 200, "top": 150, "right": 1400, "bottom": 1050},
+        {"op": "grayscale"},
+    ]},
+    "crop + resize": {"steps": [
+        {"op": "crop", "left": 0, "top": 0, "right": 2000, "bottom": 1500},
+        {"op": "resize", "width": 400, "height": 300},
+    ]},
+    "thumbnail + sharpen + webp": {"steps": [
+        {"op": "thumbnail", "width": 320, "height": 320},
+        {"op": "sharpen"},
+        {"op": "format", "format": "webp", "quality": 80},
+    ]},
+    "legacy resize/grayscale/rotate": {"resize": [800, 600], "grayscale": True, "rotate": 90},
+}
+
+def synthetic_image(megapixels: float) -> Image.Image:
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    noise = Image.effect_noise((width // 8, height // 8), 64).resize((width, height))
+    gradient = Image.linear_gradient("L").resize((width, height))
+    return Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+def encoded(img: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, quality=90)
+    return buffer.getvalue()
+
+def timed(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_operations(sizes, repeat: int) -> None:
+    print(f"{'operation':<12} {'MP':>6} {'p50 ms':>10} {'ms/MP':>10}")
+    for megapixels in sizes:
+        img = synthetic_image(megapixels)
+        img.load()
+        actual_mp = img.width * img.height / 1e6
+        for name, raw in operation_steps(*img.size).items():
+            spec = parse_spec({"steps": [raw]})
+            samples = timed(lambda: execute(img, spec.steps), repeat)
+            p50 = percentile(samples, 50) * 1000
+            print(f"{name:<12} {actual_mp:>6.1f} {p50:>10.1f} {p50 / actual_mp:>10.2f}")
+    missing = set(OPERATIONS) - set(operation_steps(8, 8)) - {"format"}
+    if missing:
+        print(f"(no benchmark step for: {', '.join(sorted(missing))})")
+
+def bench_pipelines(sizes, repeat: int) -> None:
+    print(f"\n{'pipeline':<32} {'src':>5} {'MP':>6} {'naive ms/MP':>12} {'planned ms/MP':>14} {'speedup':>8}")
+    for megapixels in sizes:
+        img = synthetic_image(megapixels)
+        actual_mp = img.width * img.height / 1e6
+        for image_format in ("JPEG", "PNG"):
+            data = encoded(img, image_format)
+            for name, raw in PIPELINES.items():
+                spec = parse_spec(raw)
+                naive = percentile(timed(lambda: render(io.BytesIO(data), spec, optimize=False), repeat), 50)
+                planned = percentile(timed(lambda: render(io.BytesIO(data), spec), repeat), 50)
+                print(
+                    f"{name:<32} {image_format:>5} {actual_mp:>6.1f} {naive * 1000 / actual_mp:>12.2f} "
+                    f"{planned * 1000 / actual_mp:>14.2f} {naive / planned:>7.1f}x"
+                )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 16], help="source sizes in megapixels")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    bench_operations(args.sizes, args.repeat)
+    bench_pipelines(args.sizes, args.repeat)
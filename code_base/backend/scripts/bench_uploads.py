@@ -0,0 +1,126 @@
+"""
+Benchmark the upload ingest path.
+
+Starts a throwaway uvicorn server per mode and fires concurrent multipart
+uploads at it, reporting the server's peak RSS and upload latency
+percentiles. A lightweight probe request runs alongside the uploads to show
+how much the event loop is stalled while files are being written.
+
+    python scripts/bench_uploads.py --size-mb 30 --concurrency 16 --requests 64
+
+Modes:
+    legacy     - ``await image.read()`` followed by a blocking ``write()``
+    streaming  - ``app.storage.uploads.save_upload``
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI, File, UploadFile
+from bench_common import peak_rss_mb, percentile, uvicorn_server
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BENCH_DIR = Path(os.getenv("BENCH_UPLOAD_DIR", tempfile.gettempdir())) / "bench_uploads"
+
+bench_app = FastAPI()
+
+@bench_app.get("/ping")
+async def ping():
+    return {"ok": True}
+
+@bench_app.post("/upload")
+async def upload(image: UploadFile = File(...)):
+    destination = BENCH_DIR / f"{time.monotonic_ns()}_{image.filename}"
+    if os.getenv("BENCH_MODE") == "legacy":
+        with open(destination, "wb+") as file_object:
+            file_object.write(await image.read())
+    else:
+        from app.storage.uploads import save_upload
+        await save_upload(image, destination)
+    os.unlink(destination)
+    return {"ok": True}
+
+async def run_load(base_url: str, payload: bytes, concurrency: int, requests: int):
+    import httpx
+
+    upload_latencies = []
+    probe_latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        async def one_upload(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/upload",
+                    files={"image": (f"bench_{i}.jpg", payload, "image/jpeg")}
+                )
+                response.raise_for_status()
+                upload_latencies.append(time.perf_counter() - start)
+
+        async def probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/ping")
+                probe_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.05)
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(one_upload(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    return upload_latencies, probe_latencies, elapsed
+
+def bench_mode(mode: str, payload: bytes, concurrency: int, requests: int) -> dict:
+    with uvicorn_server("bench_uploads:bench_app", env={"BENCH_MODE": mode}) as server:
+        uploads, probes, elapsed = asyncio.run(
+            run_load(server.base_url, payload, concurrency, requests)
+        )
+        return {
+            "mode": mode,
+            "peak_rss_mb": peak_rss_mb(server.pid),
+            "upload_p50_ms": percentile(uploads, 50) * 1000,
+            "upload_p99_ms": percentile(uploads, 99) * 1000,
+            "probe_p99_ms": percentile(probes, 99) * 1000,
+            "throughput_rps": requests / elapsed,
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--modes", nargs="+", default=["legacy", "streaming"])
+    args = parser.parse_args()
+
+    BENCH_DIR.mkdir(parents=True, exist_ok=True)
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+
+    logger.info(
+        f"Uploading {args.requests} x {args.size_mb}MB files with concurrency {args.concurrency}"
+    )
+    print(f"{'mode':<10} {'peak RSS MB':>12} {'p50 ms':>10} {'p99 ms':>10} {'probe p99 ms':>13} {'req/s':>8}")
+    try:
+        for mode in args.modes:
+            result = bench_mode(mode, payload, args.concurrency, args.requests)
+            print(
+                f"{result['mode']:<10} {result['peak_rss_mb']:>12.1f} {result['upload_p50_ms']:>10.1f} "
+                f"{result['upload_p99_ms']:>10.1f} {result['probe_p99_ms']:>13.1f} {result['throughput_rps']:>8.2f}"
+            )
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
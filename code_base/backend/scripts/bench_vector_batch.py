@@ -0,0 +1,104 @@
+"""
+Benchmark the vectorized batch mode against one-task-at-a-time processing.
+
+Encodes a set of small synthetic images, then processes them two ways:
+one at a time through ``render`` (decode, plan, transform, encode per
+image, as the Celery worker does) and as a batch the way the batch worker
+does (plan and decode all, group by planned steps/mode/size, run each
+group through ``execute_stacked``, encode). Reports images per second.
+
+Only the image work is timed. The one-at-a-time path additionally pays a
+DB session and a Celery round trip per task, which the batch worker
+amortizes over the whole batch, so real-world gains are larger.
+
+    python scripts/bench_vector_batch.py --count 512 --size 64 --repeat 5
+"""
+import argparse
+import io
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+import logging
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image
+from app.transforms.pipeline import draft, encode, parse_spec, plan, render
+from app.transforms.vectorized import execute_stacked
+from bench_common import percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+SPECS = {
+    "grayscale": {"steps": [{"op": "grayscale"}]},
+    "flip + normalize": {"steps": [
+        {"op": "flip", "direction": "horizontal"},
+        {"op": "normalize"},
+    ]},
+    "rotate 90 + grayscale + normalize": {"steps": [
+        {"op": "rotate", "angle": 90, "expand": True},
+        {"op": "grayscale"},
+        {"op": "normalize"},
+    ]},
+    "flip + sharpen (partial fallback)": {"steps": [
+        {"op": "flip", "direction": "vertical"},
+        {"op": "sharpen"},
+    ]},
+}
+
+def synthetic_images(count: int, size: int, image_format: str) -> list:
+    payloads = []
+    for seed in range(count):
+        noise = Image.effect_noise((size, size), 32 + seed % 64)
+        gradient = Image.linear_gradient("L").resize((size, size))
+        img = Image.merge("RGB", (gradient, noise, gradient.rotate(90)))
+        buffer = io.BytesIO()
+        img.save(buffer, format=image_format)
+        payloads.append(buffer.getvalue())
+    return payloads
+
+def one_at_a_time(payloads: list, spec) -> None:
+    for data in payloads:
+        render(io.BytesIO(data), spec)
+
+def batched(payloads: list, spec) -> None:
+    groups = defaultdict(list)
+    for data in payloads:
+        with Image.open(io.BytesIO(data)) as img:
+            steps = draft(img, plan(spec.steps, img.size))
+            img.load()
+            key = (repr([(step.op, step.params) for step in steps]), img.mode, img.size)
+            groups[key].append((img, img.format, steps))
+    for members in groups.values():
+        outputs = execute_stacked([img for img, _, _ in members], members[0][2])
+        for out, (_, source_format, _) in zip(outputs, members):
+            encode(out, spec.output, source_format)
+
+def timed(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=512, help="images per batch")
+    parser.add_argument("--size", type=int, default=64, help="image edge in pixels")
+    parser.add_argument("--format", default="PNG", choices=["PNG", "JPEG", "WEBP"])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = synthetic_images(args.count, args.size, args.format)
+    print(f"{args.count} {args.size}x{args.size} {args.format} images")
+    print(f"{'spec':<36} {'single img/s':>13} {'batch img/s':>12} {'speedup':>8}")
+    for name, raw in SPECS.items():
+        spec = parse_spec(raw)
+        single = percentile(timed(lambda: one_at_a_time(payloads, spec), args.repeat), 50)
+        batch = percentile(timed(lambda: batched(payloads, spec), args.repeat), 50)
+        print(
+            f"{name:<36} {args.count / single:>13.0f} {args.count / batch:>12.0f} "
+            f"{single / batch:>7.2f}x"
+        )
@@ -0,0 +1,139 @@
+"""
+Simulate queue wait times per user, FIFO against the fair scheduler.
+
+A discrete-event simulation under skewed load. At t=0 one user submits a
+large bulk batch, a second user submits a medium batch a minute later,
+and several light users keep submitting single images throughout. The
+same jobs and service times are run two ways with the same total number
+of worker slots:
+
+* fifo: one shared queue, as with a single Celery ``main-queue``.
+* fair: the real ``TaskScheduler`` Lua scripts (against fakeredis) with
+  a virtual clock, so lanes, per-user caps and weights all apply.
+
+Reports each user's wait (submission to start of processing) p50/p95/p99
+and when their last task finished.
+
+    python scripts/sim_scheduler.py --bulk-tasks 10000 --light-users 5
+"""
+import argparse
+import heapq
+import random
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fakeredis
+from app.core.config import settings
+from app.services.scheduler import Lane, TaskScheduler, lane_for
+from bench_common import percentile
+
+def make_jobs(args) -> list:
+    """(arrival, user, lane, task id, service seconds) for every task, by arrival."""
+    rng = random.Random(args.seed)
+    jobs = []
+    task_ids = iter(range(1, 10**9))
+
+    def batch(user: str, arrival: float, size: int):
+        lane = lane_for(size)
+        for _ in range(size):
+            jobs.append((arrival, user, lane, next(task_ids), rng.uniform(0.5, 1.5) * args.service))
+
+    batch("heavy", 0.0, args.bulk_tasks)
+    batch("medium", 60.0, args.bulk_tasks // 20)
+    for light in range(args.light_users):
+        arrival = rng.expovariate(1 / args.light_interval)
+        while arrival < args.duration:
+            batch(f"light-{light + 1}", arrival, 1)
+            arrival += rng.expovariate(1 / args.light_interval)
+    jobs.sort()
+    return jobs
+
+def simulate_fifo(jobs: list, workers: int) -> dict:
+    """Per-user (waits, last finish) with one queue served by ``workers`` slots."""
+    free_at = [0.0] * workers
+    waits, finished = defaultdict(list), defaultdict(float)
+    for arrival, user, _, _, service in jobs:
+        start = max(arrival, heapq.heappop(free_at))
+        heapq.heappush(free_at, start + service)
+        waits[user].append(start - arrival)
+        finished[user] = max(finished[user], start + service)
+    return {user: (waits[user], finished[user]) for user in waits}
+
+def simulate_fair(jobs: list, capacity: dict, user_cap: int, weights: dict) -> dict:
+    """Per-user (waits, last finish) with the fair scheduler dispatching onto lane slots."""
+    user_ids = {user: index for index, user in enumerate(sorted({job[1] for job in jobs}), 1)}
+    scheduler = TaskScheduler(
+        capacity,
+        user_cap,
+        lease_seconds=10**9,
+        weights={user_ids[user]: weight for user, weight in weights.items() if user in user_ids},
+        client=fakeredis.FakeRedis()
+    )
+    by_id = {job[3]: job for job in jobs}
+    waits, finished = defaultdict(list), defaultdict(float)
+    completions = []  # (time, task id)
+    index = 0
+    while index < len(jobs) or completions:
+        next_arrival = jobs[index][0] if index < len(jobs) else float("inf")
+        next_completion = completions[0][0] if completions else float("inf")
+        now = min(next_arrival, next_completion)
+
+        # Submit everything arriving now, one call per (user, lane) batch
+        submissions = defaultdict(list)
+        while index < len(jobs) and jobs[index][0] == now:
+            _, user, lane, task_id, _ = jobs[index]
+            submissions[(user, lane)].append(task_id)
+            index += 1
+        for (user, lane), task_ids in submissions.items():
+            scheduler.submit(user_ids[user], lane, task_ids)
+        while completions and completions[0][0] == now:
+            _, task_id = heapq.heappop(completions)
+            scheduler.release(user_ids[by_id[task_id][1]], task_id)
+
+        for task_id, _, _ in scheduler.dispatch(now=now, limit=10**6):
+            arrival, user, _, _, service = by_id[task_id]
+            heapq.heappush(completions, (now + service, task_id))
+            waits[user].append(now - arrival)
+            finished[user] = max(finished[user], now + service)
+    return {user: (waits[user], finished[user]) for user in waits}
+
+def report(name: str, results: dict) -> None:
+    print(f"\n{name}")
+    print(f"{'user':<10} {'tasks':>6} {'p50 wait':>9} {'p95 wait':>9} {'p99 wait':>9} {'done at':>8}")
+    for user in sorted(results, key=lambda user: (not user.startswith("light"), user)):
+        waits, done = results[user]
+        print(
+            f"{user:<10} {len(waits):>6} {percentile(waits, 50):>8.1f}s "
+            f"{percentile(waits, 95):>8.1f}s {percentile(waits, 99):>8.1f}s {done:>7.0f}s"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bulk-tasks", type=int, default=10000, help="size of the heavy user's batch")
+    parser.add_argument("--light-users", type=int, default=5)
+    parser.add_argument("--light-interval", type=float, default=20.0, help="mean seconds between a light user's uploads")
+    parser.add_argument("--duration", type=float, default=900.0, help="seconds light users keep submitting")
+    parser.add_argument("--service", type=float, default=1.0, help="mean seconds per task")
+    parser.add_argument("--interactive-slots", type=int, default=settings.SCHEDULER_LANE_CAPACITY["interactive"])
+    parser.add_argument("--bulk-slots", type=int, default=settings.SCHEDULER_LANE_CAPACITY["bulk"])
+    parser.add_argument("--user-cap", type=int, default=settings.SCHEDULER_USER_CONCURRENCY)
+    parser.add_argument("--medium-weight", type=float, default=1.0, help="fair-share weight of the medium user")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    jobs = make_jobs(args)
+    slots = args.interactive_slots + args.bulk_slots
+    print(
+        f"{len(jobs)} tasks, {slots} worker slots "
+        f"({args.interactive_slots} interactive + {args.bulk_slots} bulk), user cap {args.user_cap}"
+    )
+    report(f"fifo ({slots} slots, one queue)", simulate_fifo(jobs, slots))
+    report("fair", simulate_fair(
+        jobs,
+        {Lane.INTERACTIVE: args.interactive_slots, Lane.BULK: args.bulk_slots},
+        args.user_cap,
+        {"medium": args.medium_weight}
+    ))
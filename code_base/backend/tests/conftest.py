@@ -0,0 +1,5 @@
+import os
+
+# Tests call asyncio.run repeatedly; pooled asyncpg connections cannot move
+# between event loops
+os.environ.setdefault("DB_ASYNC_NULL_POOL", "true")
@@ -8,6 +8,12 @@ from app.core.security import get_password_hash
 
 client = TestClient(app)
 
+@pytest.fixture(scope="module", autouse=True)
+def app_lifespan():
+    # Run startup/shutdown once and keep one event loop for the module
+    with client:
+        yield
+
 def test_signup():
     response = client.post(
         "/api/v1/auth/signup",
@@ -0,0 +1,20 @@
+from celery import Celery
+from app.core.config import settings
+from app.workers.celery_app import WORKER_PROFILES, configure
+
+def test_production_profile_limits_are_consistent():
+    conf = configure(Celery("test"), "production").conf
+
+    assert conf.task_acks_late and conf.task_reject_on_worker_lost
+    assert conf.worker_prefetch_multiplier == 1
+    assert conf.task_ignore_result
+    assert conf.task_soft_time_limit < conf.task_time_limit
+    # Unacked tasks must not be redelivered while still running, and a
+    # task's scheduler slot must outlive it
+    assert conf.broker_transport_options["visibility_timeout"] > conf.task_time_limit
+    assert conf.task_time_limit < settings.SCHEDULER_LEASE_SECONDS
+
+def test_profiles_accept_their_own_serializer():
+    for profile in WORKER_PROFILES:
+        conf = configure(Celery("test"), profile).conf
+        assert conf.task_serializer in conf.accept_content
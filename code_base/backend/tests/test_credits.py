@@ -0,0 +1,94 @@
+import pytest
+import asyncio
+import uuid
+from sqlalchemy import delete, func, select
+from app.db.session import AsyncSessionLocal, SessionLocal
+from app.models.credit_transaction import CreditTransaction
+from app.models.task import Task
+from app.models.user import User
+from app.services import credits
+
+def create_user(starting_credits):
+    db = SessionLocal()
+    user = User(
+        email=f"ledger-{uuid.uuid4().hex}@example.com",
+        hashed_password="!",
+        credits=starting_credits
+    )
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+def cleanup(user_id):
+    db = SessionLocal()
+    db.execute(delete(CreditTransaction).where(CreditTransaction.user_id == user_id))
+    db.execute(delete(Task).where(Task.user_id == user_id))
+    db.execute(delete(User).where(User.id == user_id))
+    db.commit()
+    db.close()
+
+def test_concurrent_debits_never_overspend():
+    user_id = create_user(10)
+
+    async def attempt(i):
+        async with AsyncSessionLocal() as db:
+            balance = await credits.debit(db, user_id, 1, f"test:{i}")
+            await db.commit()
+            return balance
+
+    async def race():
+        return await asyncio.gather(*(attempt(i) for i in range(20)))
+
+    results = asyncio.run(race())
+
+    db = SessionLocal()
+    balance = db.execute(select(User.credits).where(User.id == user_id)).scalar_one()
+    ledger_sum = db.execute(
+        select(func.sum(CreditTransaction.amount)).where(CreditTransaction.user_id == user_id)
+    ).scalar_one()
+    db.close()
+
+    assert len([result for result in results if result is not None]) == 10
+    assert balance == 0
+    assert ledger_sum == -10
+
+    cleanup(user_id)
+
+def test_purchase_is_idempotent_per_payment():
+    user_id = create_user(0)
+
+    async def verify_twice():
+        async with AsyncSessionLocal() as db:
+            first = await credits.purchase(db, user_id, 5, "payment:pay_test")
+            second = await credits.purchase(db, user_id, 5, "payment:pay_test")
+            await db.commit()
+            return first, second
+
+    first, second = asyncio.run(verify_twice())
+    assert first == 5
+    assert second is None
+
+    cleanup(user_id)
+
+def test_failed_task_is_refunded_once():
+    user_id = create_user(1)
+    db = SessionLocal()
+    task = Task(user_id=user_id, image_path="missing.png", credits_used=1)
+    db.add(task)
+    db.commit()
+
+    async def charge():
+        async with AsyncSessionLocal() as async_db:
+            await credits.debit(async_db, user_id, 1, f"task:{task.id}")
+            await async_db.commit()
+
+    asyncio.run(charge())
+
+    assert credits.refund_task(db, task) == 1
+    assert credits.refund_task(db, task) is None
+    db.commit()
+    db.close()
+
+    cleanup(user_id)
@@ -0,0 +1,80 @@
+import asyncio
+import io
+import os
+import threading
+import time
+from PIL import Image
+from app.services import derivatives
+from app.services.derivatives import DerivativeCache
+from app.storage.backends import LocalBackend
+from app.storage.blobstore import BlobStore
+
+def make_store(tmp_path, count=1):
+    store = BlobStore(tmp_path / "processed", "processed", LocalBackend(tmp_path / "processed", "processed", "http://testserver"))
+    keys = []
+    for index in range(count):
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 200), (index, 0, 0)).save(buffer, format="PNG")
+        key = f"{index:02x}/00/{index:02x}{'0' * 62}.png"
+        store.backend.put_bytes(key, buffer.getvalue())
+        keys.append(key)
+    return store, keys
+
+def counting_render(monkeypatch, delay=0.0):
+    calls = []
+    render = derivatives.image_pool.render
+
+    def counted(source, spec, stats=None):
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        return render(source, spec, stats)
+
+    monkeypatch.setattr(derivatives.image_pool, "render", counted)
+    return calls
+
+def test_concurrent_requests_render_once(tmp_path, monkeypatch):
+    store, (key,) = make_store(tmp_path)
+    cache = DerivativeCache(tmp_path / "derivatives", 10 * 1024 * 1024, render_threads=4, quality=80)
+    calls = counting_render(monkeypatch, delay=0.2)
+
+    async def burst():
+        return await asyncio.gather(*(cache.get(store, key, 64, "webp") for _ in range(100)))
+
+    results = asyncio.run(burst())
+
+    assert len(calls) == 1
+    assert len(set(results)) == 1
+    with Image.open(cache.backend.path(results[0])) as img:
+        assert img.format == "WEBP"
+        assert img.size == (64, 32)
+
+    # Cached from now on
+    asyncio.run(cache.get(store, key, 64, "webp"))
+    assert len(calls) == 1
+
+def test_keys_depend_on_content_and_parameters(tmp_path):
+    cache = DerivativeCache(tmp_path, 1024, render_threads=1, quality=80)
+    key = "ab/cd/" + "ab" * 32 + ".png"
+
+    assert cache.key(key, 64, None).endswith(".png")
+    assert cache.key(key, 64, "jpeg").endswith(".jpg")
+    assert cache.key(key, 64, None) == cache.key("other/path/" + "ab" * 32 + ".png", 64, None)
+    assert len({cache.key(key, 64, None), cache.key(key, 128, None), cache.key(key, 64, "png")}) == 3
+
+def test_least_recently_used_are_evicted(tmp_path, monkeypatch):
+    store, keys = make_store(tmp_path, count=5)
+    cache = DerivativeCache(tmp_path / "derivatives", 10 * 1024 * 1024, render_threads=1, quality=80)
+    rendered = [asyncio.run(cache.get(store, key, 256, "png")) for key in keys[:4]]
+    sizes = [os.stat(cache.backend.path(key)).st_size for key in rendered]
+
+    # Age the entries in order, then use the oldest so it becomes the newest
+    now = time.time()
+    for age, key in enumerate(reversed(rendered)):
+        os.utime(cache.backend.path(key), (now - 1000 * (age + 1),) * 2)
+    assert cache.lookup(rendered[0])
+
+    # Room for about three: adding the fifth evicts the two least recent
+    cache.max_bytes = int(max(sizes) * 3.2 / derivatives.EVICT_TO)
+    asyncio.run(cache.get(store, keys[4], 256, "png"))
+
+    assert [cache.backend.exists(key) for key in rendered] == [True, False, False, True]
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.health import HealthMonitor, health_monitor
+
+async def healthy():
+    pass
+
+async def failing():
+    raise ConnectionError("refused")
+
+async def hanging():
+    await asyncio.sleep(10)
+
+def test_probes_run_concurrently_under_a_timeout():
+    monitor = HealthMonitor(
+        {"ok": healthy, "down": failing, "slow": hanging, "slower": hanging},
+        interval=10,
+        timeout=0.2,
+        required=["ok"]
+    )
+    start = time.perf_counter()
+    results = asyncio.run(monitor.check())
+
+    assert time.perf_counter() - start < 1
+    assert results["ok"].healthy
+    assert results["down"].error == "refused"
+    assert results["slow"].error == "timed out after 0.2s"
+    assert monitor.ready()[0]
+
+def test_readiness_needs_fresh_results_for_required_dependencies():
+    monitor = HealthMonitor({"ok": healthy, "down": failing}, interval=10, timeout=1, required=["ok", "down"])
+    assert not monitor.ready()[0]  # Nothing probed yet
+
+    asyncio.run(monitor.check())
+    assert not monitor.ready()[0]
+
+    monitor.required = ("ok",)
+    assert monitor.ready()[0]
+    # The monitor stopped probing
+    monitor.results["ok"].checked_at -= 31
+    assert not monitor.ready()[0]
+
+def test_endpoints_serve_cached_results(monkeypatch):
+    monitor = HealthMonitor({"database": healthy, "redis": failing}, interval=10, timeout=1, required=["database"])
+    asyncio.run(monitor.check())
+    monkeypatch.setattr(health_monitor, "results", monitor.results)
+    monkeypatch.setattr(health_monitor, "required", ("database",))
+    monkeypatch.setattr(health_monitor, "start", lambda: None)  # Keep the cached results
+    with TestClient(app) as client:
+        assert client.get("/api/v1/health/live").json() == {"status": "alive"}
+        assert client.get("/api/v1/health/ready").status_code == 200
+        assert client.get("/api/v1/health").json()["services"] == {"database": "healthy", "redis": "unhealthy"}
+        assert client.get("/api/v1/health/redis").json()["error"] == "refused"
+
+        monkeypatch.setattr(health_monitor, "required", ("database", "redis"))
+        assert client.get("/api/v1/health/ready").status_code == 503
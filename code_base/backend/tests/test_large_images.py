@@ -0,0 +1,54 @@
+import pytest
+import io
+from PIL import Image, ImageChops
+from app.core.config import settings
+from app.transforms.memory import ImageTooLarge, peak_rss
+from app.transforms.pipeline import Step, parse_spec, render, resize_in_strips
+
+MB = 1024 * 1024
+
+def encoded(size=(2000, 1500), image_format="JPEG") -> io.BytesIO:
+    img = Image.effect_noise((size[0] // 10, size[1] // 10), 50).resize(size).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format)
+    buffer.seek(0)
+    return buffer
+
+def test_jpeg_over_budget_is_drafted_down():
+    spec = parse_spec({"resize": [1000, 750]})
+    stats = {}
+
+    _, data = render(encoded(), spec, budget=8 * MB, stats=stats)
+
+    assert stats["budget_draft"]
+    assert stats["source_size"] == [2000, 1500]
+    assert stats["decoded_size"] == [1000, 750]
+    assert stats["estimated_mb"] <= 8
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (1000, 750)
+
+def test_over_budget_without_draft_is_rejected_before_decoding():
+    spec = parse_spec({"resize": [1000, 750]})
+    with pytest.raises(ImageTooLarge):
+        render(encoded(image_format="PNG"), spec, budget=8 * MB)
+
+def test_decompression_bomb_is_rejected(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_MAX_PIXELS", 1_000_000)
+    with pytest.raises(ImageTooLarge):
+        render(encoded(image_format="PNG"), parse_spec({"grayscale": True}))
+
+def test_strip_resize_matches_single_resize():
+    with Image.open(encoded(image_format="PNG")) as img:
+        img.load()
+        params = {"width": 640, "height": 480, "resample": "lanczos", "box": (100, 50, 1900, 1400)}
+        expected = img.resize((640, 480), Image.Resampling.LANCZOS, box=params["box"])
+
+        striped = resize_in_strips(img, params, max_bytes=64 * 1024)
+
+    assert ImageChops.difference(striped, expected).getextrema() <= ((0, 1),) * 3
+
+def test_peak_rss_reports_the_block():
+    with peak_rss() as peak:
+        buffer = bytearray(64 * MB)
+        buffer[::4096] = b"x" * len(buffer[::4096])
+    assert peak() >= 64
@@ -0,0 +1,119 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from app.db.pool_metrics import InstrumentedQueuePool, instrument
+from app.main import app
+from app.transforms.pipeline import parse_spec
+from app.workers.metrics import transform_label
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+def test_requests_are_labelled_by_route_template():
+    with TestClient(app) as client:
+        client.get("/")
+        client.get("/no/such/path")
+        body = client.get("/metrics").text
+
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in body
+    assert 'route="unmatched",status="404"' in body
+    assert "http_requests_in_progress" in body
+
+def test_pool_gauges_follow_checkouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=3,
+        max_overflow=0
+    )
+    instrument(engine, "metrics-test", "api")
+    labels = {"pool": "metrics-test", "profile": "api"}
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        assert REGISTRY.get_sample_value("db_pool_checked_out", labels) == 1
+    assert REGISTRY.get_sample_value("db_pool_checked_out", labels) == 0
+    assert REGISTRY.get_sample_value("db_pool_size", labels) == 3
+    assert REGISTRY.get_sample_value("db_pool_events_total", {**labels, "event": "checkout"}) == 1
+
+def test_transform_label_ignores_order_and_parameters():
+    spec = parse_spec({"steps": [
+        {"op": "resize", "width": 10, "height": 10},
+        {"op": "grayscale"},
+        {"op": "resize", "width": 5, "height": 5},
+    ]})
+    assert transform_label(spec) == "grayscale+resize"
+    assert transform_label(parse_spec({})) == "none"
+
+def test_multiprocess_mode_sums_across_processes(tmp_path):
+    # The value class is chosen when prometheus_client is imported, so the
+    # multiprocess run needs a fresh interpreter
+    script = """
+import os
+from app.core.metrics import latest, process_exited
+from app.services.credits import credits_moved
+
+for _ in range(2):
+    pid = os.fork()
+    if pid == 0:
+        credits_moved.labels("debit").inc(5)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    process_exited(pid)
+print(latest()[0].decode())
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=BACKEND_DIR,
+        env=dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path)),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert 'credits_total{kind="debit"} 10.0' in result.stdout
+
+def test_worker_exporter_serves_the_container_processes(tmp_path):
+    script = """
+import os
+import socket
+import urllib.request
+from app.core.metrics import serve
+from app.services.credits import credits_moved
+
+with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+serve(port)
+pid = os.fork()
+if pid == 0:
+    credits_moved.labels("refund").inc(3)
+    os._exit(0)
+os.waitpid(pid, 0)
+print(urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode())
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=BACKEND_DIR,
+        env=dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path)),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert 'credits_total{kind="refund"} 3.0' in result.stdout
+
+def test_entrypoint_empties_the_metrics_directory(tmp_path):
+    (tmp_path / "counter_1.db").write_bytes(b"stale")
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "gauge_livesum_1.db").write_bytes(b"stale")
+
+    result = subprocess.run(
+        ["sh", str(BACKEND_DIR / "docker-entrypoint.sh"), "ls", "-A", str(tmp_path)],
+        env=dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path)),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert result.stdout == ""
@@ -0,0 +1,80 @@
+import pytest
+import io
+from pathlib import Path
+from PIL import Image, ImageChops
+from app.transforms.parallel import ImagePool, estimate_tiled_peak
+from app.transforms.pipeline import estimate_peak, parse_spec, prepare, render
+
+@pytest.fixture
+def pool():
+    pool = ImagePool(processes=2, tile_min_pixels=1)
+    yield pool
+    pool.shutdown()
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.png"
+    Image.effect_noise((1200, 900), 60).convert("RGB").save(path)
+    return path
+
+def decode(data: bytes) -> Image.Image:
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        return img
+
+def test_whole_renders_match_inline(pool, source):
+    pool.tile_min_pixels = 10 ** 12
+    spec = parse_spec({"steps": [{"op": "thumbnail", "width": 200, "height": 200}, {"op": "sharpen"}]})
+    assert pool.render(source, spec) == render(source, spec)
+
+@pytest.mark.parametrize("resample", ["bicubic", "lanczos", "bilinear"])
+def test_tiled_resize_matches_full_resample(pool, source, resample):
+    spec = parse_spec({"steps": [
+        {"op": "grayscale"},
+        {"op": "resize", "width": 300, "height": 225, "resample": resample},
+        {"op": "flip", "direction": "vertical"},
+    ]})
+    stats = {}
+    suffix, data = pool.render(source, spec, stats)
+
+    with Image.open(source) as img:
+        expected = (
+            img.convert("L")
+            .resize((300, 225), Image.Resampling[resample.upper()])
+            .transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+        )
+    assert suffix == ".png"
+    assert ImageChops.difference(decode(data), expected).getextrema()[1] <= 1
+    assert set(stats["timings"]) == {"decode", "transform", "encode"}
+
+def test_disabled_pool_renders_inline(source):
+    spec = parse_spec({"resize": [100, 75]})
+    pool = ImagePool(processes=0, tile_min_pixels=1)
+    assert pool.render(source, spec) == render(source, spec)
+    assert pool._executor is None
+
+def shared_blocks():
+    return {path.name for path in Path("/dev/shm").iterdir() if path.name.startswith("psm_")}
+
+def test_shared_memory_is_released(pool, source):
+    before = shared_blocks()
+    pool.render(source, parse_spec({"resize": [300, 225]}))
+    # Output bigger than the block the parent sized from the source
+    pool.tile_min_pixels = 10 ** 12
+    suffix, data = pool.render(source, parse_spec({"resize": [2400, 1800]}))
+    assert decode(data).size == (2400, 1800)
+    assert shared_blocks() == before
+
+def test_tiled_resize_over_budget_renders_in_one_process(pool, source, monkeypatch):
+    spec = parse_spec({"resize": [300, 225]})
+    with Image.open(source) as img:
+        steps = prepare(img, spec.steps)
+        tiled = estimate_tiled_peak(img.mode, img.size, steps, 0)
+        whole = estimate_peak(img.mode, img.size, steps)
+    assert tiled > whole
+    pool.memory_budget = whole
+    monkeypatch.setattr(pool, "_render_tiled", lambda *args: pytest.fail("banded over budget"))
+
+    stats = {}
+    assert pool.render(source, spec, stats) == render(source, spec, budget=whole)
+    assert stats["estimated_mb"] <= whole / 2 ** 20
@@ -0,0 +1,57 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app.db.pool_metrics import InstrumentedQueuePool, instrument
+
+def test_instrumented_pool_tracks_checkouts_and_churn(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=2,
+        max_overflow=0
+    )
+    metrics = instrument(engine, "test", "api")
+
+    with engine.connect() as first, engine.connect() as second:
+        first.execute(text("SELECT 1"))
+        second.execute(text("SELECT 1"))
+        assert metrics.snapshot()["checked_out"] == 2
+
+    snapshot = metrics.snapshot()
+    assert snapshot["checked_out"] == 0
+    assert snapshot["checkouts"] == 2
+    assert snapshot["connections_opened"] == 2
+    assert snapshot["wait_time_seconds"]["count"] == 2
+    assert snapshot["wait_time_seconds"]["buckets"]["+Inf"] == 2
+
+    # Metrics survive the pool being replaced
+    engine.dispose()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert metrics.snapshot()["checkouts"] == 3
+    assert metrics.snapshot()["connections_closed"] == 2
+
+def test_overflow_and_timeouts_are_prometheus_series(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05
+    )
+    metrics = instrument(engine, "test-overflow", "api")
+    labels = {"pool": "test-overflow", "profile": "api"}
+
+    with engine.connect(), engine.connect():
+        assert REGISTRY.get_sample_value("db_pool_overflow", labels) == 1
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    assert REGISTRY.get_sample_value("db_pool_overflow", labels) == 0
+    assert REGISTRY.get_sample_value("db_pool_checkout_timeouts_total", labels) == 1
+    assert REGISTRY.get_sample_value("db_pool_checkout_wait_seconds_count", labels) == 3
+
+    snapshot = metrics.snapshot()
+    assert snapshot["checkout_timeouts"] == 1
+    assert snapshot["checkout_failures"] == 1
+    assert snapshot["checkouts"] == 2
@@ -0,0 +1,68 @@
+import pytest
+import asyncio
+from app.core.rate_limit import (
+    LocalRateLimiter,
+    RateLimiter,
+    RateLimitPolicy,
+    TokenBucket
+)
+from app.core.redis import get_async_redis
+
+def test_token_bucket_allows_burst_then_limits():
+    bucket = TokenBucket(RateLimitPolicy(limit=3, window=60))
+
+    results = [bucket.take() for _ in range(4)]
+
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert results[2].remaining == 0
+    # One token refills every 20 seconds
+    assert 19 < results[3].retry_after <= 20
+
+def test_local_limiter_keys_are_independent():
+    local = LocalRateLimiter()
+    policy = RateLimitPolicy(limit=1, window=60)
+
+    assert local.hit("a", policy).allowed
+    assert not local.hit("a", policy).allowed
+    assert local.hit("b", policy).allowed
+
+def test_limiter_falls_back_when_redis_is_unreachable():
+    limiter = RateLimiter(get_async_redis("redis://127.0.0.1:1/0"), timeout=0.05, retry_interval=60)
+    policy = RateLimitPolicy(limit=2, window=60)
+
+    async def hit_three_times():
+        return [await limiter.hit("test", policy, "ip:1.2.3.4") for _ in range(3)]
+
+    results = asyncio.run(hit_three_times())
+    assert [result.allowed for result in results] == [True, True, False]
+
+def test_sliding_window_script():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+    limiter = RateLimiter(fakeredis.aioredis.FakeRedis(), timeout=1, retry_interval=60)
+    policy = RateLimitPolicy(limit=2, window=60)
+
+    async def hit_three_times():
+        return [await limiter.hit("test", policy, "user:1") for _ in range(3)]
+
+    results = asyncio.run(hit_three_times())
+    assert [result.allowed for result in results] == [True, True, False]
+    assert results[0].remaining == 1
+    assert 59 < results[2].retry_after <= 60
+    assert len(limiter.local._buckets) == 0
+
+def test_limiter_falls_back_on_any_client_failure():
+    class BrokenClient:
+        def register_script(self, script):
+            async def call(keys, args):
+                raise RuntimeError("Lock is bound to a different event loop")
+            return call
+
+    limiter = RateLimiter(BrokenClient(), timeout=1, retry_interval=60)
+    policy = RateLimitPolicy(limit=1, window=60)
+
+    async def hit_twice():
+        return [await limiter.hit("test", policy, "user:1") for _ in range(2)]
+
+    assert [result.allowed for result in asyncio.run(hit_twice())] == [True, False]
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+import redis
+from app.core.redis import LoopLocalAsyncPool, PoolStats, RedisPools, abatched, batched, get_async_redis, get_redis, pools_for
+
+fakeredis = pytest.importorskip("fakeredis")
+
+def test_clients_share_one_pool_per_url():
+    assert get_redis() is get_redis()
+    assert get_async_redis() is get_async_redis()
+    assert get_async_redis(decode_responses=True) is not get_async_redis()
+    assert pools_for("redis://127.0.0.1:1/3") is not pools_for()
+
+def test_pool_name_hides_password():
+    pools = pools_for("redis://:secret@cache.internal:6380/2")
+    assert pools.name == "cache.internal:6380/2"
+
+def test_batched_preserves_order_across_round_trips():
+    client = fakeredis.FakeRedis()
+    for index in range(1, 7):
+        client.rpush(f"list:{index}", *range(index))
+
+    lengths = batched(client, (("llen", (f"list:{index}",)) for index in range(7)), batch_size=3)
+
+    assert lengths == list(range(7))
+    assert batched(client, []) == []
+
+def test_abatched():
+    client = fakeredis.aioredis.FakeRedis()
+
+    async def run():
+        await abatched(client, [("set", (f"key:{index}", index)) for index in range(5)], batch_size=2)
+        return await abatched(client, [("get", (f"key:{index}",)) for index in range(5)])
+
+    assert asyncio.run(run()) == [b"0", b"1", b"2", b"3", b"4"]
+
+def test_unreachable_redis_counts_checkout_errors():
+    pools = RedisPools("redis://127.0.0.1:1/0", "unreachable", max_connections=2, retries=0, connect_timeout=0.05)
+    client = pools.client()
+
+    with pytest.raises(redis.ConnectionError):
+        client.ping()
+
+    stats = pools.stats()["unreachable:sync"]
+    assert stats["max_connections"] == 2
+    assert stats["in_use"] == 0
+
+def test_async_pool_is_split_per_event_loop():
+    pool = LoopLocalAsyncPool(
+        connection_class=fakeredis.aioredis.FakeConnection,
+        server=fakeredis.FakeServer(),
+        max_connections=1,
+        timeout=1
+    )
+    pool.stats = PoolStats("per-loop", 1)
+
+    async def checkout():
+        connection = await pool.get_connection("PING")
+        await pool.release(connection)
+        again = await pool.get_connection("PING")
+        await pool.release(again)
+        assert again is connection  # Reused within one loop
+        return connection
+
+    first = asyncio.run(checkout())
+    second = asyncio.run(checkout())
+
+    assert first is not second
+    assert pool.stats.snapshot()["in_use"] == 0
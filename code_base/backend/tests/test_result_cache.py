@@ -0,0 +1,53 @@
+import pytest
+from app.workers.cache import (
+    LRUByteCache,
+    ResultCache,
+    canonical_pipeline,
+    transform_key
+)
+
+def test_equivalent_specs_share_a_key():
+    assert transform_key({"grayscale": True, "resize": [50, 50]}) == \
+        transform_key({"resize": (50.0, 50), "grayscale": 1, "rotate": 0})
+    assert transform_key({"rotate": 450}) == transform_key({"rotate": 90})
+
+def test_different_specs_have_different_keys():
+    assert transform_key({"resize": [50, 50]}) != transform_key({"resize": [50, 60]})
+    assert transform_key({"rotate": 90}) != transform_key({"rotate": 90, "grayscale": True})
+
+def test_canonical_pipeline_follows_application_order():
+    steps = canonical_pipeline({"rotate": 90, "grayscale": True, "resize": [10, 20]})
+    assert [name for name, _ in steps] == ["resize", "grayscale", "rotate"]
+
+def test_lru_evicts_least_recently_used_by_size():
+    cache = LRUByteCache(max_bytes=10, max_item_bytes=10)
+    cache.set("a", b"aaaa")
+    cache.set("b", b"bbbb")
+    cache.get("a")
+    cache.set("c", b"cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.evictions == 1
+    assert cache.current_bytes == 8
+
+def test_lru_skips_oversized_items():
+    cache = LRUByteCache(max_bytes=100, max_item_bytes=4)
+    cache.set("big", b"12345")
+    assert cache.get("big") is None
+    assert len(cache) == 0
+
+def test_result_cache_round_trip_and_stats():
+    cache = ResultCache(max_bytes=1024, max_item_bytes=1024)
+    assert cache.get("key") is None
+
+    cache.set("key", ".png", b"\x89PNG\nbody")
+    tier, (suffix, data) = cache.get("key")
+
+    assert tier == "local"
+    assert suffix == ".png"
+    assert data == b"\x89PNG\nbody"
+    stats = cache.stats()
+    assert stats["local_hits"] == 1
+    assert stats["local_misses"] == 1
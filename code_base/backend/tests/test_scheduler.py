@@ -0,0 +1,142 @@
+import pytest
+from app.services.scheduler import Lane, TaskScheduler, lane_for
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+def make_scheduler(capacity=None, user_concurrency=100, lease_seconds=60, weights=None):
+    return TaskScheduler(
+        capacity or {Lane.INTERACTIVE: 1, Lane.BULK: 1},
+        user_concurrency,
+        lease_seconds,
+        weights,
+        client=fakeredis.FakeRedis()
+    )
+
+def drain(scheduler, user_of, now=0.0):
+    """Run every queued task one at a time, returning the dispatch order."""
+    order = []
+    while True:
+        dispatched = scheduler.dispatch(now=now)
+        if not dispatched:
+            return order
+        for task_id, _, _ in dispatched:
+            order.append(task_id)
+            scheduler.release(user_of[task_id], task_id)
+
+def test_lane_for_batch_size(monkeypatch):
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "SCHEDULER_INTERACTIVE_MAX_BATCH", 10)
+
+    assert lane_for(1) == Lane.INTERACTIVE
+    assert lane_for(10) == Lane.INTERACTIVE
+    assert lane_for(11) == Lane.BULK
+
+def test_users_are_interleaved():
+    scheduler = make_scheduler()
+    # User 1 floods the lane before user 2 submits anything
+    scheduler.submit(1, Lane.BULK, range(100, 110))
+    scheduler.submit(2, Lane.BULK, [200, 201])
+    user_of = {**{i: 1 for i in range(100, 110)}, 200: 2, 201: 2}
+
+    order = drain(scheduler, user_of)
+
+    assert order.index(201) < 4
+    assert sorted(order) == sorted(user_of)
+
+def test_weights_set_the_share():
+    scheduler = make_scheduler(weights={1: 3.0})
+    scheduler.submit(1, Lane.BULK, range(100, 130))
+    scheduler.submit(2, Lane.BULK, range(200, 230))
+    user_of = {**{i: 1 for i in range(100, 130)}, **{i: 2 for i in range(200, 230)}}
+
+    first = drain(scheduler, user_of)[:20]
+
+    assert sum(1 for task_id in first if user_of[task_id] == 1) == 15
+
+def test_idle_user_gets_no_banked_credit():
+    scheduler = make_scheduler()
+    scheduler.submit(1, Lane.BULK, range(100, 110))
+    user_of = {i: 1 for i in range(100, 110)}
+    drain(scheduler, user_of)
+
+    scheduler.submit(1, Lane.BULK, [110, 111])
+    scheduler.submit(2, Lane.BULK, [200, 201])
+    user_of.update({110: 1, 111: 1, 200: 2, 201: 2})
+
+    # User 2 joins at the current virtual time, not at zero, so it
+    # alternates with user 1 instead of running both tasks first
+    assert drain(scheduler, user_of) == [200, 110, 201, 111]
+
+def test_lane_capacity_and_lanes_are_independent():
+    scheduler = make_scheduler({Lane.INTERACTIVE: 2, Lane.BULK: 3})
+    scheduler.submit(1, Lane.BULK, range(100, 110))
+    scheduler.submit(2, Lane.INTERACTIVE, range(200, 210))
+
+    dispatched = scheduler.dispatch(now=0)
+
+    assert [lane for _, lane, _ in dispatched].count(Lane.INTERACTIVE) == 2
+    assert [lane for _, lane, _ in dispatched].count(Lane.BULK) == 3
+    assert scheduler.dispatch(now=1) == []
+    assert scheduler.depth(Lane.BULK) == {"queued": 7, "running": 3}
+
+    scheduler.release(1, 100)
+    assert scheduler.dispatch(now=2) == [(103, Lane.BULK, 1)]
+
+def test_user_cap_spans_lanes():
+    scheduler = make_scheduler({Lane.INTERACTIVE: 10, Lane.BULK: 10}, user_concurrency=3)
+    scheduler.submit(1, Lane.BULK, range(100, 110))
+    scheduler.submit(1, Lane.INTERACTIVE, range(200, 210))
+    scheduler.submit(2, Lane.BULK, [300])
+
+    dispatched = scheduler.dispatch(now=0)
+
+    assert sum(1 for task_id, _, _ in dispatched if task_id < 300) == 3
+    assert (300, Lane.BULK, 2) in dispatched
+
+    # A finished task lets the capped user run one more
+    scheduler.release(1, dispatched[0][0])
+    assert len(scheduler.dispatch(now=1)) == 1
+
+def test_expired_leases_free_slots():
+    scheduler = make_scheduler(lease_seconds=60)
+    scheduler.submit(1, Lane.BULK, [100, 101])
+
+    assert scheduler.dispatch(now=0) == [(100, Lane.BULK, 1)]
+    assert scheduler.dispatch(now=30) == []
+    # The worker running task 100 never released it
+    assert scheduler.dispatch(now=61) == [(101, Lane.BULK, 1)]
+
+def test_requeued_tasks_go_back_to_the_front():
+    scheduler = make_scheduler({Lane.INTERACTIVE: 3, Lane.BULK: 3})
+    scheduler.submit(1, Lane.BULK, range(100, 105))
+
+    dispatched = scheduler.dispatch(now=0)
+    assert [task_id for task_id, _, _ in dispatched] == [100, 101, 102]
+    # Publishing stopped after the first task
+    scheduler.requeue(dispatched[1:])
+
+    assert scheduler.depth(Lane.BULK) == {"queued": 4, "running": 1}
+    assert [task_id for task_id, _, _ in scheduler.dispatch(now=1)] == [101, 102]
+
+def test_publish_failure_requeues_unsent_tasks(monkeypatch):
+    from kombu.exceptions import OperationalError
+    from app.workers import tasks
+
+    scheduler = make_scheduler({Lane.INTERACTIVE: 3, Lane.BULK: 3})
+    monkeypatch.setattr(tasks, "scheduler", scheduler)
+    monkeypatch.setattr(tasks.settings, "SCHEDULER_ENABLED", True)
+    sent = []
+
+    def apply_async(args, queue):
+        if len(sent) == 1:
+            raise OperationalError("broker down")
+        sent.append(args[0])
+
+    monkeypatch.setattr(tasks.process_image, "apply_async", apply_async)
+
+    # Logged, not raised: the debit is already committed
+    tasks.enqueue(1, [100, 101, 102], Lane.BULK)
+
+    assert sent == [100]
+    assert scheduler.depth(Lane.BULK) == {"queued": 2, "running": 1}
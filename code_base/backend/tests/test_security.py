@@ -0,0 +1,164 @@
+import pytest
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwt
+from passlib.context import CryptContext
+from types import SimpleNamespace
+from app.api import deps
+from app.api.deps import CurrentUser, get_current_user
+from app.core import security, tokens
+from app.core.security import PasswordHasher, verify_and_update_password
+from app.core.tokens import InvalidToken, TokenKeys, TokenVerifier, TokenVersions
+
+def test_password_hasher_rejects_when_saturated():
+    hasher = PasswordHasher(max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def saturate():
+        blocked = [asyncio.ensure_future(hasher.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc_info:
+            await hasher.run(lambda: None)
+        release.set()
+        await asyncio.gather(*blocked)
+        return exc_info.value
+
+    error = asyncio.run(saturate())
+    assert error.status_code == 503
+    assert error.headers["Retry-After"] == "1"
+    assert hasher.in_flight == 0
+
+def test_login_rehashes_outdated_hash(monkeypatch):
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("Test123!@#")
+    monkeypatch.setattr(
+        security,
+        "pwd_context",
+        CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5)
+    )
+
+    valid, new_hash = asyncio.run(verify_and_update_password("Test123!@#", old_hash))
+    assert valid
+    assert new_hash.startswith("$2b$05$")
+
+    valid, new_hash = asyncio.run(verify_and_update_password("wrong", old_hash))
+    assert not valid
+    assert new_hash is None
+
+def rsa_pem(path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ))
+    public = path.with_suffix(".pub")
+    public.write_bytes(key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    return str(path), str(public)
+
+def test_verified_tokens_are_cached_until_they_expire(monkeypatch):
+    verifier = TokenVerifier(TokenKeys("HS256", "secret", "default"), cache_size=2)
+    token = verifier.issue({"sub": "a@example.com", "uid": 1}, timedelta(minutes=5))
+    decodes = []
+    decode = verifier.decode
+    monkeypatch.setattr(verifier, "decode", lambda token: decodes.append(token) or decode(token))
+
+    assert verifier.verify(token)["uid"] == 1
+    assert verifier.verify(token)["uid"] == 1
+    assert len(decodes) == 1
+
+    # A cached token stops working at its exp, like an uncached one
+    monkeypatch.setattr(time, "time", lambda: jwt.get_unverified_claims(token)["exp"] + 1)
+    with pytest.raises(InvalidToken):
+        verifier.verify(token)
+
+def test_claims_cache_is_bounded_and_skips_invalid_tokens():
+    verifier = TokenVerifier(TokenKeys("HS256", "secret", "default"), cache_size=2)
+    tokens = [verifier.issue({"sub": f"{i}@example.com", "uid": i}, timedelta(minutes=5)) for i in range(3)]
+    for token in tokens:
+        verifier.verify(token)
+    assert len(verifier._cache) == 2
+
+    forged = TokenVerifier(TokenKeys("HS256", "other", "default"), 0).issue({"sub": "x", "uid": 9}, timedelta(minutes=5))
+    for token in (forged, tokens[0][:-2], "not-a-token"):
+        with pytest.raises(InvalidToken):
+            verifier.verify(token)
+    assert len(verifier._cache) == 2
+
+def test_asymmetric_keys_are_chosen_by_key_id(tmp_path):
+    old_private, old_public = rsa_pem(tmp_path / "old.pem")
+    new_private, _ = rsa_pem(tmp_path / "new.pem")
+    old = TokenVerifier(TokenKeys("RS256", "", "old", old_private), 10)
+    new = TokenVerifier(TokenKeys("RS256", "", "new", new_private, {"old": old_public}), 10)
+
+    token = new.issue({"sub": "a@example.com", "uid": 1}, timedelta(minutes=5))
+    assert jwt.get_unverified_header(token)["kid"] == "new"
+    assert new.verify(token)["uid"] == 1
+    # Tokens from the retired key still verify while its public key is listed
+    assert new.verify(old.issue({"sub": "b@example.com", "uid": 2}, timedelta(minutes=5)))["uid"] == 2
+
+    unknown = TokenVerifier(TokenKeys("RS256", "", "other", old_private), 10)
+    with pytest.raises(InvalidToken):
+        new.verify(unknown.issue({"sub": "c@example.com", "uid": 3}, timedelta(minutes=5)))
+
+@pytest.fixture
+def token_versions(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    versions = TokenVersions(
+        fakeredis.aioredis.FakeRedis(server=server),
+        fakeredis.FakeRedis(server=server),
+        check_interval=60,
+        timeout=1,
+        cache_size=10
+    )
+    monkeypatch.setattr(deps, "token_versions", versions)
+    monkeypatch.setattr(tokens, "token_versions", versions)
+    return versions
+
+def test_current_user_comes_from_the_token(token_versions):
+    token = security.create_access_token({"sub": "a@example.com", "uid": 7, "credits": 3}, timedelta(minutes=5))
+    # No database is reachable here; a lookup would fail
+    assert asyncio.run(get_current_user(token)) == CurrentUser(7, "a@example.com", 3)
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(get_current_user(token + "x"))
+    assert exc_info.value.status_code == 401
+
+def test_deleted_users_tokens_are_rejected(token_versions):
+    token = security.create_access_token({"sub": "a@example.com", "uid": 7, "ver": 0}, timedelta(minutes=5))
+    other = security.create_access_token({"sub": "b@example.com", "uid": 8, "ver": 0}, timedelta(minutes=5))
+
+    async def run():
+        assert (await get_current_user(token)).id == 7
+        # What the session's flush calls when the user row is deleted
+        tokens.revoke_deleted_user(None, None, SimpleNamespace(id=7))
+
+        with pytest.raises(HTTPException) as exc_info:
+            await get_current_user(token)
+        assert exc_info.value.status_code == 401
+        assert (await get_current_user(other)).id == 8
+
+        # Other processes notice once their copy of the version expires
+        token_versions.clear()
+        with pytest.raises(HTTPException):
+            await get_current_user(token)
+        # Tokens issued afterwards carry the new version
+        assert await token_versions.current(7) == 1
+
+    asyncio.run(run())
+
+def test_token_versions_fall_back_when_redis_fails():
+    class BrokenClient:
+        async def get(self, key):
+            raise RuntimeError("unreachable")
+
+    versions = TokenVersions(BrokenClient(), None, check_interval=60, timeout=1, cache_size=10)
+    assert asyncio.run(versions.current(7)) == 0
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from app.core.config import settings
+from app.main import app
+from app.storage.backends import LocalBackend, S3Backend, StorageBackend, sign, verify
+from app.storage.blobstore import processed_store, upload_store
+from app.storage.serving import RangeNotSatisfiable, file_response, parse_range
+from app.storage.uploads import incoming_key
+
+@pytest.fixture
+def local_stores(tmp_path, monkeypatch):
+    for store in (upload_store, processed_store):
+        root = tmp_path / store.namespace
+        monkeypatch.setattr(store, "root", root)
+        monkeypatch.setattr(store, "backend", LocalBackend(root, store.namespace, "http://testserver"))
+    return upload_store.backend, processed_store.backend
+
+def relative_url(url):
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}"
+
+def test_local_backend_round_trip(tmp_path):
+    backend = LocalBackend(tmp_path, "uploads", "http://testserver")
+    backend.put_bytes("ab/cd/abcd.png", b"data")
+
+    assert backend.exists("ab/cd/abcd.png")
+    assert backend.size("ab/cd/abcd.png") == 4
+    with backend.local_path("ab/cd/abcd.png") as path, backend.open("ab/cd/abcd.png") as file_object:
+        assert path.read_bytes() == file_object.read() == b"data"
+
+    backend.delete("ab/cd/abcd.png")
+    backend.delete("ab/cd/abcd.png")
+    assert backend.size("ab/cd/abcd.png") is None
+
+def test_local_backend_lists_keys_without_staging(tmp_path):
+    backend = LocalBackend(tmp_path, "uploads", "http://testserver")
+    backend.put_bytes("ab/cd/abcd.png", b"data")
+    backend.put_bytes("incoming/1/a", b"data")
+    (tmp_path / ".tmp").mkdir()
+    (tmp_path / ".tmp" / "staged").write_bytes(b"data")
+
+    assert sorted(backend.keys()) == ["ab/cd/abcd.png", "incoming/1/a"]
+
+def test_local_backend_rejects_keys_outside_its_root(tmp_path):
+    backend = LocalBackend(tmp_path / "uploads", "uploads", "http://testserver")
+    with pytest.raises(ValueError):
+        backend.path("../processed/secret.png")
+
+def test_signatures_bind_every_parameter():
+    expires_at = int(time.time()) + 60
+    signature = sign("PUT", "uploads", "incoming/1/a", expires_at, 10)
+
+    assert verify("PUT", "uploads", "incoming/1/a", expires_at, signature, 10)
+    assert not verify("PUT", "uploads", "incoming/1/a", expires_at, signature, 11)
+    assert not verify("PUT", "uploads", "incoming/2/a", expires_at, signature, 10)
+    assert not verify("GET", "uploads", "incoming/1/a", expires_at, signature, 10)
+    assert not verify("PUT", "uploads", "incoming/1/a", int(time.time()) - 1,
+                      sign("PUT", "uploads", "incoming/1/a", int(time.time()) - 1, 10), 10)
+
+def test_signed_upload_then_download(local_stores):
+    uploads, _ = local_stores
+    with TestClient(app) as client:
+        key = incoming_key(1, "0" * 32)
+        data = b"\x89PNG" + b"x" * 1000
+
+        signed = uploads.upload_url(key, 60, len(data), "image/png")
+        assert client.put(relative_url(signed.url), content=data[:-1], headers=signed.headers).status_code == 400
+        assert client.put(relative_url(signed.url), content=data + b"!", headers=signed.headers).status_code == 413
+        assert not uploads.exists(key)
+        assert client.put(relative_url(signed.url), content=data, headers=signed.headers).status_code == 204
+        assert uploads.path(key).read_bytes() == data
+        # Nothing left in staging
+        assert list((uploads.root / ".tmp").iterdir()) == []
+
+        url = relative_url(uploads.download_url(key, 60, "photo.png"))
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.content == data
+        assert "photo.png" in response.headers["content-disposition"]
+        assert response.headers["etag"] == f'"{"0" * 32}"'
+
+        assert client.get(url.replace("signature=", "signature=0")).status_code == 403
+
+def test_signed_uploads_only_write_incoming_keys(local_stores):
+    uploads, _ = local_stores
+    signed = uploads.upload_url("ab/cd/abcd.png", 60, 4, "image/png")
+    with TestClient(app) as client:
+        assert client.put(relative_url(signed.url), content=b"data").status_code == 403
+
+def test_s3_backend():
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="images")
+        backend = S3Backend("images", "processed", client=client)
+
+        backend.put_bytes("ab/cd/abcd.png", b"data")
+        assert client.get_object(Bucket="images", Key="processed/ab/cd/abcd.png")["Body"].read() == b"data"
+        assert backend.size("ab/cd/abcd.png") == 4
+        with backend.local_path("ab/cd/abcd.png") as path:
+            assert path.read_bytes() == b"data"
+        assert not path.exists()
+
+        assert "X-Amz-Signature" in backend.download_url("ab/cd/abcd.png", 60, "photo.png")
+        signed = backend.upload_url("incoming/1/a", 60, 4, "image/png")
+        assert "content-length" in signed.url.lower()
+
+        backend.delete("ab/cd/abcd.png")
+        assert not backend.exists("ab/cd/abcd.png")
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=990-2000", 1000) == (990, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=-5000", 1000) == (0, 999)
+    # Served whole
+    assert parse_range("bytes=0-1,5-9", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+    assert parse_range("bytes=a-b", 1000) is None
+    for header in ("bytes=1000-", "bytes=5-1", "bytes=-0"):
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range(header, 1000)
+
+def test_processed_files_support_ranges_and_revalidation(local_stores, monkeypatch):
+    _, processed = local_stores
+    digest = "ab" * 32
+    key = f"ab/ab/{digest}.png"
+    data = bytes(range(256)) * 1024
+    processed.put_bytes(key, data)
+    with TestClient(app) as client:
+        url = relative_url(processed.download_url(key, 60))
+
+        response = client.get(url)
+        assert response.content == data
+        assert response.headers["etag"] == f'"{digest}"'
+        assert response.headers["content-type"] == "image/png"
+        assert "immutable" in response.headers["cache-control"]
+
+        response = client.get(url, headers={"Range": "bytes=1000-1999"})
+        assert response.status_code == 206
+        assert response.content == data[1000:2000]
+        assert response.headers["content-range"] == f"bytes 1000-1999/{len(data)}"
+
+        assert client.get(url, headers={"Range": "bytes=1000-1999", "If-Range": '"stale"'}).content == data
+        assert client.get(url, headers={"Range": f"bytes={len(data)}-"}).status_code == 416
+        assert client.get(url, headers={"If-None-Match": f'W/"{digest}"'}).status_code == 304
+
+        response = client.head(url)
+        assert response.headers["content-length"] == str(len(data))
+        assert response.content == b""
+
+        monkeypatch.setattr(settings, "FILES_ACCEL_REDIRECT_PREFIX", "/internal-files/")
+        response = client.get(url)
+        assert response.headers["x-accel-redirect"] == f"/internal-files/processed/{key}"
+        assert response.content == b""
+
+def test_responses_hold_the_file_open(tmp_path):
+    backend = LocalBackend(tmp_path, "derivatives", "http://testserver")
+    key = f"ab/ab/{'ab' * 32}.png"
+    data = b"x" * 1000
+    backend.put_bytes(key, data)
+    response = file_response(Request({"type": "http", "method": "GET", "headers": []}), backend, key)
+    # Evicted after the response was built
+    backend.delete(key)
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(response({"type": "http", "method": "GET"}, None, send))
+    assert b"".join(message.get("body", b"") for message in messages) == data
+    assert response.file_object.closed
+
+def test_incomplete_backends_fail_when_created():
+    class Partial(StorageBackend):
+        def exists(self, key):
+            return False
+
+    with pytest.raises(TypeError):
+        Partial()
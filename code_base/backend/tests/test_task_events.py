@@ -0,0 +1,93 @@
+import pytest
+import asyncio
+import json
+from types import SimpleNamespace
+from app.services.task_events import (
+    TaskEventBroker,
+    TaskEventPublisher,
+    event_stream,
+    parse_event_id
+)
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+def make_task(status, task_id=1, user_id=7):
+    return SimpleNamespace(
+        id=task_id,
+        user_id=user_id,
+        batch_id=None,
+        status=status,
+        result=None,
+        error_message=None
+    )
+
+@pytest.fixture
+def redis_pair():
+    server = fakeredis.FakeServer()
+    publisher = TaskEventPublisher(fakeredis.FakeRedis(server=server))
+    broker = TaskEventBroker(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True), queue_size=8)
+    return publisher, broker
+
+def parse_sse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields["id"], json.loads(fields["data"])
+
+def test_event_ids_compare_numerically():
+    assert parse_event_id("1700000000000-10") > parse_event_id("1700000000000-9")
+    assert parse_event_id("1700000000001-0") > parse_event_id("1700000000000-99")
+
+def test_resume_replays_missed_events_then_streams_live(redis_pair):
+    publisher, broker = redis_pair
+    first = publisher.publish(make_task("processing"))
+    publisher.publish(make_task("completed"))
+
+    async def consume():
+        stream = event_stream(broker, 7, first, heartbeat=5)
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        _, replayed = parse_sse(await stream.__anext__())
+
+        # Published after the client subscribed
+        await asyncio.sleep(0.2)
+        publisher.publish(make_task("processing", task_id=2))
+        _, live = parse_sse(await asyncio.wait_for(stream.__anext__(), 5))
+        await stream.aclose()
+        await broker.close()
+        return replayed, live
+
+    replayed, live = asyncio.run(consume())
+    assert replayed == {
+        "task_id": 1,
+        "batch_id": None,
+        "status": "completed",
+        "result": None,
+        "error_message": None
+    }
+    assert live["task_id"] == 2
+    assert not broker._subscribers
+
+def test_heartbeat_when_idle(redis_pair):
+    _, broker = redis_pair
+
+    async def consume():
+        stream = event_stream(broker, 7, None, heartbeat=0.05)
+        await stream.__anext__()
+        chunk = await asyncio.wait_for(stream.__anext__(), 5)
+        await stream.aclose()
+        await broker.close()
+        return chunk
+
+    assert asyncio.run(consume()) == ": heartbeat\n\n"
+
+def test_slow_consumer_is_marked_lagging(redis_pair):
+    _, broker = redis_pair
+
+    async def overflow():
+        async with broker.subscribe(7) as subscription:
+            for i in range(broker.queue_size + 1):
+                broker.dispatch("task-events:7:live", f"1-{i} {{}}")
+            lagging = subscription.lagging
+        await broker.close()
+        return lagging
+
+    assert asyncio.run(overflow())
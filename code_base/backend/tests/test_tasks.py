@@ -7,6 +7,12 @@ import io
 
 client = TestClient(app)
 
+@pytest.fixture(scope="module", autouse=True)
+def app_lifespan():
+    # Run startup/shutdown once and keep one event loop for the module
+    with client:
+        yield
+
 def create_test_image():
     """Create a test image file."""
     img = Image.new('RGB', (100, 100), color='red')
@@ -58,7 +64,90 @@ def test_get_tasks():
     )
     assert response.status_code == 200
     data = response.json()
-    assert isinstance(data, list)
+    assert isinstance(data["items"], list)
+    assert "next_cursor" in data
+
+def test_get_tasks_pagination():
+    login_response = client.post(
+        "/api/v1/auth/login",
+        data={
+            "username": "test@example.com",
+            "password": "Test123!@#"
+        }
+    )
+    token = login_response.json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for _ in range(3):
+        client.post(
+            "/api/v1/tasks/",
+            files={"image": ("test.png", create_test_image(), "image/png")},
+            headers=headers
+        )
+
+    # Walk the list two tasks at a time, only asking for ids and statuses
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "fields": "id,status"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/tasks/", params=params, headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["items"]) <= 2
+        for item in data["items"]:
+            assert set(item) == {"id", "status", "created_at"}
+        seen.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen) >= 3
+    assert len(seen) == len(set(seen))
+    assert seen == sorted(seen, reverse=True)
+
+    response = client.get(
+        "/api/v1/tasks/",
+        params={"status": "pending", "fields": "status"},
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert all(item["status"] == "pending" for item in response.json()["items"])
+
+def test_get_tasks_rejects_bad_parameters():
+    login_response = client.post(
+        "/api/v1/auth/login",
+        data={
+            "username": "test@example.com",
+            "password": "Test123!@#"
+        }
+    )
+    token = login_response.json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    for params in ({"cursor": "not-a-cursor"}, {"status": "bogus"}, {"fields": "password"}):
+        response = client.get("/api/v1/tasks/", params=params, headers=headers)
+        assert response.status_code == 400
+
+def test_get_tasks_accepts_timezone_aware_dates():
+    login_response = client.post(
+        "/api/v1/auth/login",
+        data={
+            "username": "test@example.com",
+            "password": "Test123!@#"
+        }
+    )
+    token = login_response.json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get(
+        "/api/v1/tasks/",
+        params={"created_after": "2024-01-01T00:00:00Z", "created_before": "2999-01-01T05:30:00+05:30"},
+        headers=headers
+    )
+    assert response.status_code == 200
+    assert all(item["created_at"] >= "2024-01-01" for item in response.json()["items"])
 
 def test_get_task():
     # Login to get token
@@ -87,4 +176,96 @@ def test_get_task():
     )
     assert response.status_code == 200
     data = response.json()
-    assert data["id"] == task_id 
\ No newline at end of file
+    assert data["id"] == task_id
+
+def test_create_batch():
+    # Login to get token
+    login_response = client.post(
+        "/api/v1/auth/login",
+        data={
+            "username": "test@example.com",
+            "password": "Test123!@#"
+        }
+    )
+    token = login_response.json()["token"]
+
+    # Submit three images with one shared transform spec
+    response = client.post(
+        "/api/v1/tasks/batch",
+        files=[
+            ("images", (f"test_{i}.png", create_test_image(), "image/png"))
+            for i in range(3)
+        ],
+        data={"metadata": '{"grayscale": true}'},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["task_ids"]) == 3
+    batch_id = data["batch_id"]
+
+    # Poll aggregate progress
+    response = client.get(
+        f"/api/v1/tasks/batches/{batch_id}",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 3
+    assert 0 <= data["progress"] <= 1
+
+def test_get_unknown_batch():
+    login_response = client.post(
+        "/api/v1/auth/login",
+        data={
+            "username": "test@example.com",
+            "password": "Test123!@#"
+        }
+    )
+    token = login_response.json()["token"]
+
+    response = client.get(
+        "/api/v1/tasks/batches/does-not-exist",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 404
+
+def test_concurrent_tasks_for_one_upload():
+    import asyncio
+    import httpx
+    from urllib.parse import urlsplit
+
+    login_response = client.post(
+        "/api/v1/auth/login",
+        data={
+            "username": "test@example.com",
+            "password": "Test123!@#"
+        }
+    )
+    token = login_response.json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    data = create_test_image().getvalue()
+
+    upload = client.post(
+        "/api/v1/tasks/uploads",
+        params={"filename": "test.png", "size": len(data), "content_type": "image/png"},
+        headers=headers
+    ).json()
+    parts = urlsplit(upload["url"])
+    client.put(f"{parts.path}?{parts.query}", content=data, headers=upload["headers"])
+
+    async def create_twice():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            return await asyncio.gather(*(
+                async_client.post(
+                    f"/api/v1/tasks/uploads/{upload['upload_id']}",
+                    params={"filename": "test.png"},
+                    headers=headers
+                )
+                for _ in range(2)
+            ))
+
+    statuses = sorted(response.status_code for response in asyncio.run(create_twice()))
+    # Only one task is created and charged
+    assert statuses == [200, 409]
@@ -0,0 +1,107 @@
+import pytest
+import io
+from PIL import Image, ImageChops, ImageStat
+from app.transforms.operations import InvalidTransformSpec
+from app.transforms.pipeline import parse_spec, plan, render
+
+def create_test_image(size=(1600, 1200), image_format="PNG"):
+    """Create an image with enough structure that resampling differences show."""
+    gradient = Image.linear_gradient("L").resize(size)
+    img = Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.ROTATE_90).resize(size), gradient))
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+def mean_difference(a: bytes, b: bytes) -> float:
+    with Image.open(io.BytesIO(a)) as first, Image.open(io.BytesIO(b)) as second:
+        assert first.size == second.size
+        diff = ImageChops.difference(first.convert("RGB"), second.convert("RGB"))
+        return max(ImageStat.Stat(diff).mean)
+
+def test_legacy_and_step_specs_parse_to_the_same_steps():
+    legacy = parse_spec({"resize": [50, 40], "grayscale": True, "rotate": 450})
+    steps = parse_spec({"steps": [
+        {"op": "resize", "width": 50, "height": 40},
+        {"op": "grayscale"},
+        {"op": "rotate", "angle": 90},
+    ]})
+    assert legacy.canonical() == steps.canonical()
+    assert legacy.steps[0].params == {"width": 50, "height": 40, "resample": "bicubic"}
+
+@pytest.mark.parametrize("spec", [
+    {"steps": [{"op": "explode"}]},
+    {"steps": [{"op": "resize", "width": 0, "height": 10}]},
+    {"steps": [{"op": "resize", "width": 10}]},
+    {"steps": [{"op": "rotate", "angle": "left"}]},
+    {"steps": [{"op": "crop", "left": 10, "top": 0, "right": 5, "bottom": 5}]},
+    {"steps": [{"op": "format", "format": "bmp"}]},
+    {"steps": [{"op": "format", "format": "png"}, {"op": "format", "format": "jpeg"}]},
+    {"resize": [10, 10], "sepia": True},
+    {"resize": 10},
+])
+def test_invalid_specs_are_rejected(spec):
+    with pytest.raises(InvalidTransformSpec):
+        parse_spec(spec)
+
+def test_plan_fuses_resize_and_crop_and_converts_first():
+    spec = parse_spec({"steps": [
+        {"op": "resize", "width": 800, "height": 600},
+        {"op": "crop", "left": 100, "top": 100, "right": 500, "bottom": 400},
+        {"op": "grayscale"},
+    ]})
+    steps = plan(spec.steps, (1600, 1200))
+
+    assert [step.op for step in steps] == ["grayscale", "resize"]
+    assert steps[1].params["box"] == (200.0, 200.0, 1000.0, 800.0)
+    assert (steps[1].params["width"], steps[1].params["height"]) == (400, 300)
+
+def test_plan_resolves_thumbnails():
+    spec = parse_spec({"steps": [{"op": "thumbnail", "width": 400, "height": 400}]})
+    steps = plan(spec.steps, (1600, 1200))
+    assert [(step.op, step.params["width"], step.params["height"]) for step in steps] == [("resize", 400, 300)]
+
+    # Thumbnails never upscale
+    assert plan(spec.steps, (200, 100)) == []
+
+@pytest.mark.parametrize("image_format", ["PNG", "JPEG"])
+@pytest.mark.parametrize("spec", [
+    {"steps": [
+        {"op": "resize", "width": 800, "height": 600},
+        {"op": "crop", "left": 100, "top": 100, "right": 500, "bottom": 400},
+        {"op": "grayscale"},
+    ]},
+    {"steps": [
+        {"op": "crop", "left": 0, "top": 0, "right": 800, "bottom": 600},
+        {"op": "resize", "width": 100, "height": 75},
+    ]},
+    {"steps": [{"op": "thumbnail", "width": 200, "height": 200}, {"op": "sharpen"}]},
+    {"resize": [400, 300], "grayscale": True, "rotate": 90},
+])
+def test_optimized_render_matches_naive(spec, image_format):
+    source = create_test_image(image_format=image_format)
+    spec = parse_spec(spec)
+
+    naive_suffix, naive = render(io.BytesIO(source), spec, optimize=False)
+    suffix, optimized = render(io.BytesIO(source), spec)
+
+    assert suffix == naive_suffix
+    assert mean_difference(naive, optimized) < 3
+
+def test_output_format_and_quality():
+    spec = parse_spec({"steps": [
+        {"op": "convert", "mode": "rgba"},
+        {"op": "format", "format": "jpeg", "quality": 70},
+    ]})
+    suffix, data = render(io.BytesIO(create_test_image((64, 64))), spec)
+
+    assert suffix == ".jpg"
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == "JPEG"
+        assert img.mode == "RGB"
+
+def test_render_records_stage_timings():
+    stats = {}
+    render(io.BytesIO(create_test_image()), parse_spec({"steps": [{"op": "grayscale"}]}), stats=stats)
+
+    assert set(stats["timings"]) == {"decode", "transform", "encode"}
+    assert all(seconds >= 0 for seconds in stats["timings"].values())
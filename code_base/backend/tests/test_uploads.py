@@ -0,0 +1,63 @@
+import pytest
+import asyncio
+import hashlib
+import io
+import os
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+from app.core.config import settings
+from app.storage.uploads import check_image, copy_stream, save_upload, UploadTooLarge
+
+def test_copy_stream_hashes_and_writes(tmp_path):
+    data = os.urandom(300 * 1024)
+    destination = tmp_path / "nested" / "image.bin"
+
+    stored = copy_stream(io.BytesIO(data), destination, max_size=len(data), chunk_size=64 * 1024)
+
+    assert stored.size == len(data)
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+    assert destination.read_bytes() == data
+
+def test_copy_stream_rejects_oversized_upload(tmp_path):
+    destination = tmp_path / "image.bin"
+
+    with pytest.raises(UploadTooLarge):
+        copy_stream(io.BytesIO(b"x" * 1000), destination, max_size=999, chunk_size=128)
+
+    # Neither the destination nor the temporary file should be left behind
+    assert list(tmp_path.iterdir()) == []
+
+def test_save_upload_returns_413_when_too_large(tmp_path):
+    upload = UploadFile(io.BytesIO(b"x" * 2048), filename="big.png")
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(save_upload(upload, tmp_path / "big.png", max_size=1024, chunk_size=256))
+
+    assert exc_info.value.status_code == 413
+    assert not (tmp_path / "big.png").exists()
+
+def test_save_upload_streams_to_disk(tmp_path):
+    data = b"image-bytes" * 1000
+    upload = UploadFile(io.BytesIO(data), filename="small.png")
+
+    stored = asyncio.run(save_upload(upload, tmp_path / "small.png", max_size=len(data), chunk_size=100))
+
+    assert stored.size == len(data)
+    assert (tmp_path / "small.png").read_bytes() == data
+
+@pytest.mark.parametrize("max_pixels, status_code", [(1000, 413), (None, 400)])
+def test_check_image_rejects_bombs_and_non_images(tmp_path, monkeypatch, max_pixels, status_code):
+    path = tmp_path / "upload"
+    if max_pixels:
+        monkeypatch.setattr(settings, "IMAGE_MAX_PIXELS", max_pixels)
+        Image.new("L", (100, 100)).save(path, format="PNG")
+    else:
+        path.write_bytes(b"not an image")
+    data = path.read_bytes()
+    stored = asyncio.run(save_upload(UploadFile(io.BytesIO(data), filename="x.png"), path))
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(check_image(stored))
+
+    assert exc_info.value.status_code == status_code
+    assert not path.exists()
@@ -0,0 +1,41 @@
+import pytest
+from PIL import Image, ImageChops
+from app.transforms.pipeline import execute, parse_spec
+from app.transforms.vectorized import execute_stacked, vectorizable
+
+def create_images(mode, count=4, size=(48, 32)):
+    images = []
+    for seed in range(count):
+        noise = Image.effect_noise(size, 40 + seed * 10)
+        bands = [noise.point(lambda v, s=seed, b=b: (v * (b + 1) + s * 17) % 256) for b in range(len(mode))]
+        images.append(Image.merge(mode, bands) if len(bands) > 1 else bands[0])
+    return images
+
+@pytest.mark.parametrize("mode", ["L", "RGB", "RGBA"])
+@pytest.mark.parametrize("steps", [
+    [{"op": "grayscale"}],
+    [{"op": "convert", "mode": "l"}, {"op": "normalize"}],
+    [{"op": "flip", "direction": "horizontal"}, {"op": "flip", "direction": "vertical"}],
+    [{"op": "rotate", "angle": 90, "expand": True}],
+    [{"op": "rotate", "angle": 180}],
+    [{"op": "normalize"}],
+    # sharpen has no kernel, so the group falls back to Pillow in between
+    [{"op": "flip", "direction": "horizontal"}, {"op": "sharpen"}, {"op": "grayscale"}],
+])
+def test_stacked_matches_per_image(mode, steps):
+    images = create_images(mode)
+    spec = parse_spec({"steps": steps})
+
+    stacked = execute_stacked(images, spec.steps)
+
+    for img, out in zip(images, stacked):
+        expected = execute(img, spec.steps)
+        assert out.mode == expected.mode
+        assert out.size == expected.size
+        assert ImageChops.difference(out, expected).getbbox() is None
+
+def test_non_square_quarter_turn_without_expand_is_not_vectorized():
+    step = parse_spec({"steps": [{"op": "rotate", "angle": 90}]}).steps[0]
+    assert not vectorizable(step, "RGB", (48, 32))
+    assert vectorizable(step, "RGB", (32, 32))
+    assert not vectorizable(step, "P", (32, 32))
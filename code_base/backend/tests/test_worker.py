@@ -1,7 +1,8 @@
 import pytest
-from app.worker import process_image
+from app.workers.tasks import process_image
 from app.models.task import Task
 from app.db.session import SessionLocal
+from app.storage.blobstore import upload_store, processed_store
 import os
 from PIL import Image
 import io
@@ -28,7 +29,7 @@ def test_process_image():
     task = Task(
         user_id=1,
         image_path=image_path,
-        metadata={
+        task_metadata={
             "resize": (50, 50),
             "grayscale": True
         }
@@ -43,7 +44,8 @@ def test_process_image():
     # Check results
     task = db.query(Task).filter(Task.id == task_id).first()
     assert task.status == "completed"
-    assert task.result["processed_image"] == f"processed_{image_path}"
+    assert task.result["processed_image"].endswith(".png")
+    assert {"fetch", "decode", "transform", "encode", "write"} <= set(task.result["timings"])
     
     # Check if processed image exists
     processed_path = os.path.join("processed", task.result["processed_image"])
@@ -61,6 +63,45 @@ def test_process_image():
     db.commit()
     db.close()
 
+def test_process_image_reuses_processed_output():
+    # Store the same image twice under the content-addressed layout
+    test_image = create_test_image().getvalue()
+    db = SessionLocal()
+    tasks = []
+    for _ in range(2):
+        content_hash, image_path = upload_store.add_bytes(db, test_image)
+        task = Task(
+            user_id=1,
+            original_filename="test.png",
+            image_path=image_path,
+            content_hash=content_hash,
+            task_metadata={"grayscale": True}
+        )
+        db.add(task)
+        tasks.append(task)
+    db.commit()
+    task_ids = [task.id for task in tasks]
+
+    # Process the first task, then make the source unreadable so the second
+    # task can only succeed by reusing the stored output
+    process_image(task_ids[0])
+    upload_store.backend.delete(image_path)
+    process_image(task_ids[1])
+
+    first, second = [db.query(Task).filter(Task.id == task_id).first() for task_id in task_ids]
+    assert first.status == "completed"
+    assert second.status == "completed"
+    assert first.result["processed_image"] == second.result["processed_image"]
+
+    # Cleanup
+    output_digest = os.path.basename(first.result["processed_image"]).split(".")[0]
+    for task in (first, second):
+        processed_store.release(db, output_digest)
+        upload_store.release(db, content_hash)
+        db.delete(task)
+    db.commit()
+    db.close()
+
 def test_process_image_invalid_task():
     # Try to process non-existent task
     process_image(999999)
@@ -74,7 +115,7 @@ def test_process_image_invalid_image():
     task = Task(
         user_id=1,
         image_path="nonexistent.png",
-        metadata={}
+        task_metadata={}
     )
     db.add(task)
     db.commit()
@@ -86,9 +127,26 @@ def test_process_image_invalid_image():
     # Check results
     task = db.query(Task).filter(Task.id == task_id).first()
     assert task.status == "failed"
-    assert task.error is not None
+    assert task.error_message is not None
     
     # Cleanup
     db.delete(task)
     db.commit()
-    db.close() 
\ No newline at end of file
+    db.close() 
+
+def test_collect_deletes_unreferenced_blobs():
+    db = SessionLocal()
+    live_digest, live_path = processed_store.add_bytes(db, b"referenced", ".png")
+    db.commit()
+    # Added, then rolled back: the file stays without a row
+    orphan_digest, orphan_path = processed_store.add_bytes(db, b"rolled back", ".png")
+    db.rollback()
+    assert processed_store.backend.exists(orphan_path)
+
+    assert processed_store.collect(db) >= 1
+    assert not processed_store.backend.exists(orphan_path)
+    assert processed_store.backend.exists(live_path)
+
+    processed_store.release(db, live_digest)
+    db.commit()
+    db.close()
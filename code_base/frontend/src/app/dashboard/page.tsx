@@ -25,7 +25,7 @@ export default function DashboardPage() {
     resolver: zodResolver(taskSchema),
   });
   const [uploading, setUploading] = useState(false);
-  const { tasks, loading, error, fetchTasks, createTask } = useTaskStore();
+  const { tasks, loading, error, fetchTasks, createTask, downloadUrl } = useTaskStore();
   const { user } = useAuthStore();
   const { toast } = useToast();
 
@@ -127,10 +127,14 @@ export default function DashboardPage() {
                               Status: {task.status}
                             </p>
                           </div>
-                          {task.result_path && (
+                          {task.result?.processed_image && (
                             <Button
                               variant="outline"
-                              onClick={() => window.open(`/uploads/${task.result_path}`, '_blank')}
+                              onClick={async () => {
+                                // Opened before the request so popup blockers allow it
+                                const tab = window.open('', '_blank');
+                                if (tab) tab.location.href = await downloadUrl(task.id);
+                              }}
                             >
                               View Result
                             </Button>
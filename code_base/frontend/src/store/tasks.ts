@@ -1,12 +1,18 @@
 import { create } from 'zustand';
 import api from '@/lib/api';
 
+export interface TaskResult {
+  processed_image: string;
+  cache: string | null;
+  timings: Record<string, number>;
+}
+
 export interface Task {
   id: number;
   image_path: string;
   metadata: string;
-  status: 'queued' | 'processing' | 'completed' | 'failed';
-  result_path: string | null;
+  status: 'pending' | 'processing' | 'completed' | 'failed';
+  result: TaskResult | null;
   error_message: string | null;
   credits_used: number;
   created_at: string;
@@ -19,6 +25,7 @@ interface TaskState {
   error: string | null;
   fetchTasks: () => Promise<void>;
   createTask: (formData: FormData) => Promise<void>;
+  downloadUrl: (taskId: number) => Promise<string>;
 }
 
 export const useTaskStore = create<TaskState>((set) => ({
@@ -30,7 +37,7 @@ export const useTaskStore = create<TaskState>((set) => ({
     set({ loading: true, error: null });
     try {
       const response = await api.get('/tasks');
-      set({ tasks: response.data, loading: false });
+      set({ tasks: response.data.items, loading: false });
     } catch (error) {
       set({ error: 'Failed to fetch tasks', loading: false });
     }
@@ -52,4 +59,10 @@ export const useTaskStore = create<TaskState>((set) => ({
       set({ error: 'Failed to create task', loading: false });
     }
   },
+
+  downloadUrl: async (taskId: number) => {
+    // Signed and short-lived, so fetched when needed rather than stored
+    const response = await api.get(`/tasks/${taskId}/download`);
+    return response.data.url;
+  },
 })); 
\ No newline at end of file